@@ -1,4 +1,5 @@
 import streamlit as st
+from utils.model_registry import default_registry
 
 st.set_page_config(
     page_title="CUREVIA - Medical AI Platform",
@@ -7,6 +8,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Starts background preloading of the models listed in CUREVIA_PRELOAD (no-op otherwise),
+# so the first analysis after a restart doesn't pay for loading and warm-up
+default_registry()
+
 # Custom CSS for better styling
 st.markdown("""
 <style>
@@ -1,10 +1,15 @@
 import streamlit as st
 import sys
+import time
 sys.path.append('..')
-from utils.brain_predictor import BrainTumorPredictor
+from utils.gradcam import overlay
+from utils.history import default_history
+from utils.metrics import observe_stages
+from utils.model_registry import default_registry
+from utils.prediction_cache import CachedPredictor, default_cache, image_digest
+from utils.preprocessing import thumbnail
+from utils.scheduler import MicroBatchScheduler
 from utils.recommendations import get_brain_recommendation
-import tempfile
-from PIL import Image
 
 st.set_page_config(
     page_title="Brain Tumor Detection - CUREVIA",
@@ -35,10 +40,128 @@ app_mode = st.sidebar.selectbox(
     ["Home", "About", "Tumor Detection"]
 )
 
-# Initialize predictor (cached)
+# Starts background preloading of the models listed in CUREVIA_PRELOAD (no-op otherwise)
+default_registry()
+
+# Initialize predictor (cached, shared by every session through one batching scheduler).
+# The registry owns model paths, loading, warm-up and eviction; repeat uploads of the
+# same scan are answered from the prediction cache without a forward pass.
 @st.cache_resource
 def load_brain_model():
-    return BrainTumorPredictor("models/brain_tumor/my_model.keras")
+    return CachedPredictor(
+        MicroBatchScheduler(default_registry().handle("brain"), max_batch_size=16, max_wait_ms=10),
+        default_cache(),
+    )
+
+def display_name(class_name):
+    # Format class name for display
+    return class_name.title() if class_name != 'notumor' else 'No Tumor'
+
+# Widget interactions rerun this script. Uploads are hashed once per upload id, display
+# thumbnails and heatmap overlays are cached by content hash, and results stay in the
+# session keyed by hash and mode, so a rerun does no decoding or inference.
+def upload_digests(uploads):
+    known = st.session_state.get("brain_digests", {})
+    digests = {
+        upload.file_id: known.get(upload.file_id) or image_digest(upload.getvalue())
+        for upload in uploads
+    }
+    st.session_state["brain_digests"] = digests
+    return [digests[upload.file_id] for upload in uploads]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_thumbnail(digest, _upload):
+    return thumbnail(_upload.getvalue())
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_overlay(digest, _upload, _cam):
+    return overlay(load_thumbnail(digest, _upload), _cam)
+
+def show_result(upload, digest, result, use_tta, show_gradcam):
+    """Render the analysis of one scan: metrics, alert, recommendations and timings."""
+    result_index = result['class_index']
+    class_name = result['class_name']
+    confidence = result['confidence']
+
+    col1, col2 = st.columns([1, 1])
+
+    with col1:
+        st.subheader("📤 Uploaded MRI Scan")
+        st.image(load_thumbnail(digest, upload), use_column_width=True, caption=upload.name)
+
+    with col2:
+        st.subheader("🤖 AI Analysis")
+
+        # Display results
+        st.markdown('<div class="result-box">', unsafe_allow_html=True)
+        st.success(f"✅ Analysis Complete!")
+        st.metric("Detection Result", display_name(class_name), delta=None)
+        st.metric("Confidence Level", f"{confidence:.1%}", delta=None)
+        if use_tta:
+            spread = result['variance'][result_index] ** 0.5
+            st.metric("TTA Spread (± std)", f"{spread:.1%}", delta=None)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Progress bar for confidence
+        st.progress(confidence)
+
+        # Color-coded alert based on tumor type
+        if class_name == 'notumor':
+            st.success("✅ **NO TUMOR DETECTED** - Normal brain tissue identified")
+        elif class_name == 'glioma':
+            st.error("⚠️ **GLIOMA DETECTED** - Immediate medical consultation required")
+        elif class_name == 'meningioma':
+            st.warning("⚠️ **MENINGIOMA DETECTED** - Prompt medical evaluation recommended")
+        elif class_name == 'pituitary':
+            st.warning("⚠️ **PITUITARY TUMOR DETECTED** - Specialized consultation needed")
+
+    # Recommendation section
+    st.markdown("---")
+    with st.expander("📋 **Medical Recommendations & Next Steps**", expanded=True):
+        # Get condition-specific description
+        if class_name == 'glioma':
+            st.write("**Analysis Result:** MRI scan shows signs consistent with *Glioma* (brain tumor originating from glial cells).")
+        elif class_name == 'meningioma':
+            st.write("**Analysis Result:** MRI scan shows signs consistent with *Meningioma* (tumor of the meninges).")
+        elif class_name == 'notumor':
+            st.write("**Analysis Result:** MRI scan shows *normal brain tissue without tumor indication*.")
+        elif class_name == 'pituitary':
+            st.write("**Analysis Result:** MRI scan shows signs consistent with *Pituitary Tumor* (tumor of the pituitary gland).")
+
+        if show_gradcam:
+            st.image(load_overlay(digest, upload, result['gradcam']), use_column_width=True,
+                     caption="Grad-CAM: regions that drove the prediction")
+
+        # Display recommendations (timed: the Markdown is large)
+        render_start = time.perf_counter()
+        recommendation = get_brain_recommendation(result_index)
+        st.markdown(recommendation)
+        render_seconds = time.perf_counter() - render_start
+        observe_stages("brain", {"render": render_seconds})
+
+        # Critical warning for tumor cases
+        if class_name != 'notumor':
+            st.error("""
+            🚨 **URGENT NOTICE**:
+            - This is a preliminary AI screening result
+            - **Immediate consultation with a neurologist or neurosurgeon is essential**
+            - Additional diagnostic tests and imaging will be required
+            - Do not delay seeking professional medical evaluation
+            """)
+        else:
+            st.info("""
+            ℹ️ **Notice**:
+            - While no tumor was detected, this does not guarantee absence of all conditions
+            - Continue regular check-ups as recommended by your healthcare provider
+            - Report any new or worsening symptoms immediately
+            """)
+
+    # Per-stage timings; results served from the prediction cache have none
+    timings = result.get('timings')
+    if timings:
+        timings = {**timings, "render": round(render_seconds * 1000, 3)}
+        with st.expander("⏱️ Timing breakdown"):
+            st.table({"Stage": list(timings), "Milliseconds": list(timings.values())})
 
 # HOME Section
 if app_mode == "Home":
@@ -182,111 +305,104 @@ elif app_mode == "Tumor Detection":
     st.header("🔍 Brain Tumor Detection")
     st.markdown("Upload a brain MRI scan for AI-powered tumor detection")
     
-    # File uploader
-    test_image = st.file_uploader(
-        "Choose an MRI image...", 
+    # File uploader (a whole study can be uploaded at once)
+    uploads = st.file_uploader(
+        "Choose MRI images...", 
         type=["jpg", "jpeg", "png"],
-        help="Upload a clear brain MRI scan in JPG or PNG format"
+        accept_multiple_files=True,
+        help="Upload one or more clear brain MRI scans in JPG or PNG format"
     )
     
-    # Display uploaded image
-    if test_image is not None:
-        image = Image.open(test_image)
+    if uploads:
+        use_tta = st.checkbox(
+            "🔁 Test-time augmentation",
+            help="Average 8 brightness/contrast variants in one batched pass and report their spread"
+        )
+        # Grad-CAM needs gradients through the Keras model
+        keras_backend = default_registry().specs["brain"].predictor_kwargs.get("backend", "keras") == "keras"
+        show_gradcam = st.checkbox(
+            "🔥 Show Grad-CAM heatmap",
+            help="Highlight the regions that drove the prediction" if keras_backend
+            else "Needs the Keras model (CUREVIA_BACKEND=keras)",
+            disabled=not keras_backend,
+        )
         
-        col1, col2 = st.columns([1, 1])
+        digests = upload_digests(uploads)
+        mode = (use_tta, show_gradcam)
+        # Only the current uploads' results are kept, for every mode they were analyzed in
+        results = {
+            key: result for key, result in st.session_state.get("brain_results", {}).items()
+            if key[0] in digests
+        }
+        st.session_state["brain_results"] = results
+        missing = [i for i, digest in enumerate(digests) if (digest, mode) not in results]
         
-        with col1:
-            st.subheader("📤 Uploaded MRI Scan")
-            st.image(image, use_column_width=True, caption="Brain MRI")
+        # Predict button
+        label = "🔬 Analyze MRI Scan" if len(uploads) == 1 else f"🔬 Analyze {len(uploads)} MRI Scans"
+        if missing and st.button(label, type="primary", use_container_width=True):
+            with st.spinner("🧠 AI is analyzing your brain MRI scans..."):
+                # One batched call for the scans this session hasn't analyzed yet;
+                # the encoded bytes go straight to the predictor's decoder
+                predictor = load_brain_model()
+                scans = [uploads[i].getvalue() for i in missing]
+                if use_tta:
+                    fresh = [predictor.predict_tta(scan) for scan in scans]
+                elif show_gradcam:
+                    # Predictions and heatmaps come out of the same forward pass
+                    fresh = predictor.predict_gradcam_batch(scans)
+                else:
+                    fresh = predictor.predict_batch(scans)
+                if show_gradcam and use_tta:
+                    for result, cam in zip(fresh, predictor.predict_gradcam_batch(scans)):
+                        result['gradcam'] = cam['gradcam']
+            for i, result in zip(missing, fresh):
+                results[(digests[i], mode)] = result
+            # Audit trail (CUREVIA_HISTORY_DB); queued, so the page never waits on disk
+            history = default_history()
+            if history is not None:
+                history.record_many(
+                    "brain", [digests[i] for i in missing], fresh, [uploads[i].name for i in missing]
+                )
+            missing = []
         
-        with col2:
-            st.subheader("🤖 AI Analysis")
-            
-            # Predict button
-            if st.button("🔬 Analyze MRI Scan", type="primary", use_container_width=True):
-                with st.spinner("🧠 AI is analyzing your brain MRI scan..."):
-                    # Save to temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-                        tmp_file.write(test_image.getvalue())
-                        temp_file_path = tmp_file.name
-                    
-                    # Load model and predict
-                    predictor = load_brain_model()
-                    result = predictor.predict(temp_file_path)
-                    
-                    result_index = result['class_index']
-                    class_name = result['class_name']
-                    confidence = result['confidence']
-                    
-                    # Display results
-                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                    st.success(f"✅ Analysis Complete!")
-                    
-                    # Format class name for display
-                    display_name = class_name.title() if class_name != 'notumor' else 'No Tumor'
-                    st.metric("Detection Result", display_name, delta=None)
-                    st.metric("Confidence Level", f"{confidence:.1%}", delta=None)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # Progress bar for confidence
-                    st.progress(confidence)
-                    
-                    # Color-coded alert based on tumor type
-                    if class_name == 'notumor':
-                        st.success("✅ **NO TUMOR DETECTED** - Normal brain tissue identified")
-                    elif class_name == 'glioma':
-                        st.error("⚠️ **GLIOMA DETECTED** - Immediate medical consultation required")
-                    elif class_name == 'meningioma':
-                        st.warning("⚠️ **MENINGIOMA DETECTED** - Prompt medical evaluation recommended")
-                    elif class_name == 'pituitary':
-                        st.warning("⚠️ **PITUITARY TUMOR DETECTED** - Specialized consultation needed")
-                    
-                    # Recommendation section
-                    st.markdown("---")
-                    with st.expander("📋 **Medical Recommendations & Next Steps**", expanded=True):
-                        # Get condition-specific description
-                        if class_name == 'glioma':
-                            st.write("**Analysis Result:** MRI scan shows signs consistent with *Glioma* (brain tumor originating from glial cells).")
-                        elif class_name == 'meningioma':
-                            st.write("**Analysis Result:** MRI scan shows signs consistent with *Meningioma* (tumor of the meninges).")
-                        elif class_name == 'notumor':
-                            st.write("**Analysis Result:** MRI scan shows *normal brain tissue without tumor indication*.")
-                        elif class_name == 'pituitary':
-                            st.write("**Analysis Result:** MRI scan shows signs consistent with *Pituitary Tumor* (tumor of the pituitary gland).")
-                        
-                        st.image(image, use_column_width=True)
-                        
-                        # Display recommendations
-                        recommendation = get_brain_recommendation(result_index)
-                        st.markdown(recommendation)
-                        
-                        # Critical warning for tumor cases
-                        if class_name != 'notumor':
-                            st.error("""
-                            🚨 **URGENT NOTICE**: 
-                            - This is a preliminary AI screening result
-                            - **Immediate consultation with a neurologist or neurosurgeon is essential**
-                            - Additional diagnostic tests and imaging will be required
-                            - Do not delay seeking professional medical evaluation
-                            """)
-                        else:
-                            st.info("""
-                            ℹ️ **Notice**: 
-                            - While no tumor was detected, this does not guarantee absence of all conditions
-                            - Continue regular check-ups as recommended by your healthcare provider
-                            - Report any new or worsening symptoms immediately
-                            """)
+        if not missing:
+            selected = 0
+            if len(uploads) > 1:
+                st.subheader("📊 Study Results")
+                st.dataframe(
+                    {
+                        "File": [upload.name for upload in uploads],
+                        "Result": [display_name(results[(digest, mode)]['class_name']) for digest in digests],
+                        "Confidence": [results[(digest, mode)]['confidence'] for digest in digests],
+                    },
+                    column_config={
+                        "Confidence": st.column_config.ProgressColumn(
+                            "Confidence", format="%.3f", min_value=0.0, max_value=1.0
+                        ),
+                    },
+                    hide_index=True,
+                    use_container_width=True,
+                )
+                selected = st.selectbox(
+                    "Show details for",
+                    range(len(uploads)),
+                    format_func=lambda i: f"{uploads[i].name} – {display_name(results[(digests[i], mode)]['class_name'])}",
+                )
+            upload, digest = uploads[selected], digests[selected]
+            show_result(upload, digest, results[(digest, mode)], use_tta, show_gradcam)
+        elif len(missing) < len(uploads):
+            st.info(f"ℹ️ {len(missing)} new scan(s) not analyzed yet")
     
     else:
-        st.info("👆 Please upload a brain MRI scan image to begin analysis")
+        st.info("👆 Please upload one or more brain MRI scan images to begin analysis")
         
         # Sample instructions
         st.markdown("""
         ### 📝 Instructions:
-        1. Upload a clear brain MRI scan image
-        2. Click the "Analyze MRI Scan" button
-        3. Review the AI prediction and confidence score
-        4. Read the detailed medical recommendations
+        1. Upload one or more clear brain MRI scan images (e.g. all slices of a study)
+        2. Click the "Analyze" button
+        3. Review the AI predictions and confidence scores; sort the results table by any column
+        4. Pick a scan to read its detailed medical recommendations
         5. **Immediately consult with a neurologist if tumor is detected**
         
         ### 🎯 Image Requirements:
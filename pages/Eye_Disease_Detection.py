@@ -1,10 +1,15 @@
 import streamlit as st
 import sys
+import time
 sys.path.append('..')
-from utils.eye_predictor import EyeDiseasePredictor
+from utils.gradcam import overlay
+from utils.history import default_history
+from utils.metrics import observe_stages
+from utils.model_registry import default_registry
+from utils.prediction_cache import CachedPredictor, default_cache, image_digest
+from utils.preprocessing import thumbnail
+from utils.scheduler import MicroBatchScheduler
 from utils.recommendations import get_eye_recommendation
-import tempfile
-from PIL import Image
 
 st.set_page_config(
     page_title="Eye Disease Detection - CUREVIA",
@@ -35,10 +40,100 @@ app_mode = st.sidebar.selectbox(
     ["Home", "About", "Disease Identification"]
 )
 
-# Initialize predictor (cached)
+# Starts background preloading of the models listed in CUREVIA_PRELOAD (no-op otherwise)
+default_registry()
+
+# Initialize predictor (cached, shared by every session through one batching scheduler).
+# The registry owns model paths, loading, warm-up and eviction; repeat uploads of the
+# same scan are answered from the prediction cache without a forward pass.
 @st.cache_resource
 def load_eye_model():
-    return EyeDiseasePredictor("models/eye_disease/Trained_Model.keras")
+    return CachedPredictor(
+        MicroBatchScheduler(default_registry().handle("eye"), max_batch_size=16, max_wait_ms=10),
+        default_cache(),
+    )
+
+# Widget interactions rerun this script. Uploads are hashed once per upload id, display
+# thumbnails and heatmap overlays are cached by content hash, and results stay in the
+# session keyed by hash and mode, so a rerun does no decoding or inference.
+def upload_digests(uploads):
+    known = st.session_state.get("eye_digests", {})
+    digests = {
+        upload.file_id: known.get(upload.file_id) or image_digest(upload.getvalue())
+        for upload in uploads
+    }
+    st.session_state["eye_digests"] = digests
+    return [digests[upload.file_id] for upload in uploads]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_thumbnail(digest, _upload):
+    return thumbnail(_upload.getvalue())
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_overlay(digest, _upload, _cam):
+    return overlay(load_thumbnail(digest, _upload), _cam)
+
+def show_result(upload, digest, result, use_tta, show_gradcam):
+    """Render the analysis of one scan: metrics, recommendations and timings."""
+    result_index = result['class_index']
+    class_name = result['class_name']
+    confidence = result['confidence']
+
+    col1, col2 = st.columns([1, 1])
+
+    with col1:
+        st.subheader("📤 Uploaded Image")
+        st.image(load_thumbnail(digest, upload), use_column_width=True, caption=upload.name)
+
+    with col2:
+        st.subheader("🤖 AI Analysis")
+
+        # Display results
+        st.markdown('<div class="result-box">', unsafe_allow_html=True)
+        st.success(f"✅ Analysis Complete!")
+        st.metric("Detected Condition", class_name, delta=None)
+        st.metric("Confidence Level", f"{confidence:.1%}", delta=None)
+        if use_tta:
+            spread = result['variance'][result_index] ** 0.5
+            st.metric("TTA Spread (± std)", f"{spread:.1%}", delta=None)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Progress bar for confidence
+        st.progress(confidence)
+
+    # Recommendation section
+    st.markdown("---")
+    with st.expander("📋 **Medical Recommendations & Information**", expanded=True):
+        # Get condition-specific description
+        if result_index == 0:  # CNV
+            st.write("**Detected Condition:** OCT scan showing *CNV with subretinal fluid.*")
+        elif result_index == 1:  # DME
+            st.write("**Detected Condition:** OCT scan showing *DME with retinal thickening and intraretinal fluid.*")
+        elif result_index == 2:  # DRUSEN
+            st.write("**Detected Condition:** OCT scan showing *drusen deposits in early AMD.*")
+        elif result_index == 3:  # NORMAL
+            st.write("**Detected Condition:** OCT scan showing a *normal retina with preserved foveal contour.*")
+
+        if show_gradcam:
+            st.image(load_overlay(digest, upload, result['gradcam']), use_column_width=True,
+                     caption="Grad-CAM: regions that drove the prediction")
+
+        # Display recommendations (timed: the Markdown is large)
+        render_start = time.perf_counter()
+        recommendation = get_eye_recommendation(result_index)
+        st.markdown(recommendation)
+        render_seconds = time.perf_counter() - render_start
+        observe_stages("eye", {"render": render_seconds})
+
+        # Warning
+        st.warning("⚠️ **Important**: This AI analysis is a screening tool and should not replace professional medical diagnosis. Please consult with a qualified ophthalmologist for proper evaluation and treatment.")
+
+    # Per-stage timings; results served from the prediction cache have none
+    timings = result.get('timings')
+    if timings:
+        timings = {**timings, "render": round(render_seconds * 1000, 3)}
+        with st.expander("⏱️ Timing breakdown"):
+            st.table({"Stage": list(timings), "Milliseconds": list(timings.values())})
 
 # HOME Section
 if app_mode == "Home":
@@ -134,84 +229,104 @@ elif app_mode == "Disease Identification":
     st.header("🔍 Disease Identification")
     st.markdown("Upload an OCT retinal scan for AI-powered analysis")
     
-    # File uploader
-    test_image = st.file_uploader(
-        "Choose an OCT image...", 
+    # File uploader (a whole study can be uploaded at once)
+    uploads = st.file_uploader(
+        "Choose OCT images...", 
         type=["jpg", "jpeg", "png"],
-        help="Upload a clear OCT scan image in JPG or PNG format"
+        accept_multiple_files=True,
+        help="Upload one or more clear OCT scan images in JPG or PNG format"
     )
     
-    # Display uploaded image
-    if test_image is not None:
-        image = Image.open(test_image)
+    if uploads:
+        use_tta = st.checkbox(
+            "🔁 Test-time augmentation",
+            help="Average 8 brightness/contrast variants in one batched pass and report their spread"
+        )
+        # Grad-CAM needs gradients through the Keras model
+        keras_backend = default_registry().specs["eye"].predictor_kwargs.get("backend", "keras") == "keras"
+        show_gradcam = st.checkbox(
+            "🔥 Show Grad-CAM heatmap",
+            help="Highlight the regions that drove the prediction" if keras_backend
+            else "Needs the Keras model (CUREVIA_BACKEND=keras)",
+            disabled=not keras_backend,
+        )
         
-        col1, col2 = st.columns([1, 1])
+        digests = upload_digests(uploads)
+        mode = (use_tta, show_gradcam)
+        # Only the current uploads' results are kept, for every mode they were analyzed in
+        results = {
+            key: result for key, result in st.session_state.get("eye_results", {}).items()
+            if key[0] in digests
+        }
+        st.session_state["eye_results"] = results
+        missing = [i for i, digest in enumerate(digests) if (digest, mode) not in results]
         
-        with col1:
-            st.subheader("📤 Uploaded Image")
-            st.image(image, use_column_width=True, caption="OCT Scan")
+        # Predict button
+        label = "🔬 Analyze Image" if len(uploads) == 1 else f"🔬 Analyze {len(uploads)} Images"
+        if missing and st.button(label, type="primary", use_container_width=True):
+            with st.spinner("🧠 AI is analyzing your OCT scans..."):
+                # One batched call for the scans this session hasn't analyzed yet;
+                # the encoded bytes go straight to the predictor's decoder
+                predictor = load_eye_model()
+                scans = [uploads[i].getvalue() for i in missing]
+                if use_tta:
+                    fresh = [predictor.predict_tta(scan) for scan in scans]
+                elif show_gradcam:
+                    # Predictions and heatmaps come out of the same forward pass
+                    fresh = predictor.predict_gradcam_batch(scans)
+                else:
+                    fresh = predictor.predict_batch(scans)
+                if show_gradcam and use_tta:
+                    for result, cam in zip(fresh, predictor.predict_gradcam_batch(scans)):
+                        result['gradcam'] = cam['gradcam']
+            for i, result in zip(missing, fresh):
+                results[(digests[i], mode)] = result
+            # Audit trail (CUREVIA_HISTORY_DB); queued, so the page never waits on disk
+            history = default_history()
+            if history is not None:
+                history.record_many(
+                    "eye", [digests[i] for i in missing], fresh, [uploads[i].name for i in missing]
+                )
+            missing = []
         
-        with col2:
-            st.subheader("🤖 AI Analysis")
-            
-            # Predict button
-            if st.button("🔬 Analyze Image", type="primary", use_container_width=True):
-                with st.spinner("🧠 AI is analyzing your OCT scan..."):
-                    # Save to temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-                        tmp_file.write(test_image.getvalue())
-                        temp_file_path = tmp_file.name
-                    
-                    # Load model and predict
-                    predictor = load_eye_model()
-                    result = predictor.predict(temp_file_path)
-                    
-                    result_index = result['class_index']
-                    class_name = result['class_name']
-                    confidence = result['confidence']
-                    
-                    # Display results
-                    st.markdown('<div class="result-box">', unsafe_allow_html=True)
-                    st.success(f"✅ Analysis Complete!")
-                    st.metric("Detected Condition", class_name, delta=None)
-                    st.metric("Confidence Level", f"{confidence:.1%}", delta=None)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # Progress bar for confidence
-                    st.progress(confidence)
-                    
-                    # Recommendation section
-                    st.markdown("---")
-                    with st.expander("📋 **Medical Recommendations & Information**", expanded=True):
-                        # Get condition-specific description
-                        if result_index == 0:  # CNV
-                            st.write("**Detected Condition:** OCT scan showing *CNV with subretinal fluid.*")
-                        elif result_index == 1:  # DME
-                            st.write("**Detected Condition:** OCT scan showing *DME with retinal thickening and intraretinal fluid.*")
-                        elif result_index == 2:  # DRUSEN
-                            st.write("**Detected Condition:** OCT scan showing *drusen deposits in early AMD.*")
-                        elif result_index == 3:  # NORMAL
-                            st.write("**Detected Condition:** OCT scan showing a *normal retina with preserved foveal contour.*")
-                        
-                        st.image(image, use_column_width=True)
-                        
-                        # Display recommendations
-                        recommendation = get_eye_recommendation(result_index)
-                        st.markdown(recommendation)
-                        
-                        # Warning
-                        st.warning("⚠️ **Important**: This AI analysis is a screening tool and should not replace professional medical diagnosis. Please consult with a qualified ophthalmologist for proper evaluation and treatment.")
+        if not missing:
+            selected = 0
+            if len(uploads) > 1:
+                st.subheader("📊 Scan Results")
+                st.dataframe(
+                    {
+                        "File": [upload.name for upload in uploads],
+                        "Result": [results[(digest, mode)]['class_name'] for digest in digests],
+                        "Confidence": [results[(digest, mode)]['confidence'] for digest in digests],
+                    },
+                    column_config={
+                        "Confidence": st.column_config.ProgressColumn(
+                            "Confidence", format="%.3f", min_value=0.0, max_value=1.0
+                        ),
+                    },
+                    hide_index=True,
+                    use_container_width=True,
+                )
+                selected = st.selectbox(
+                    "Show details for",
+                    range(len(uploads)),
+                    format_func=lambda i: f"{uploads[i].name} – {results[(digests[i], mode)]['class_name']}",
+                )
+            upload, digest = uploads[selected], digests[selected]
+            show_result(upload, digest, results[(digest, mode)], use_tta, show_gradcam)
+        elif len(missing) < len(uploads):
+            st.info(f"ℹ️ {len(missing)} new scan(s) not analyzed yet")
     
     else:
-        st.info("👆 Please upload an OCT retinal scan image to begin analysis")
+        st.info("👆 Please upload one or more OCT retinal scan images to begin analysis")
         
         # Sample instructions
         st.markdown("""
         ### 📝 Instructions:
-        1. Upload a clear OCT retinal scan image
-        2. Click the "Analyze Image" button
-        3. Review the AI prediction and confidence score
-        4. Read the detailed medical recommendations
+        1. Upload one or more clear OCT retinal scan images
+        2. Click the "Analyze" button
+        3. Review the AI predictions and confidence scores; sort the results table by any column
+        4. Pick a scan to read its detailed medical recommendations
         5. Consult with your ophthalmologist for proper diagnosis
         """)
 
@@ -0,0 +1,93 @@
+import streamlit as st
+import sys
+import time
+from datetime import datetime
+sys.path.append('..')
+from utils.history import default_history
+from utils.model_registry import PREDICTORS
+
+st.set_page_config(
+    page_title="Prediction History - CUREVIA",
+    page_icon="🗃️",
+    layout="wide"
+)
+
+# Page header
+st.title("🗃️ Prediction History")
+st.markdown("### Audit and follow up on past analyses")
+
+history = default_history()
+if history is None:
+    st.info("""
+    ℹ️ Prediction history is off. Set the `CUREVIA_HISTORY_DB` environment variable to a
+    SQLite file path (e.g. `history/curevia.db`) and restart the app to record every analysis.
+    """)
+    st.stop()
+
+# Sidebar filters
+st.sidebar.title("Filters")
+model = st.sidebar.selectbox("Model", ["All"] + sorted(PREDICTORS))
+class_names = sorted({name for cls in PREDICTORS.values() for name in cls.class_names}) \
+    if model == "All" else PREDICTORS[model].class_names
+class_name = st.sidebar.selectbox("Predicted class", ["All"] + list(class_names))
+min_confidence = st.sidebar.slider("Minimum confidence", 0.0, 1.0, 0.0, 0.05)
+periods = {"Last 24 hours": 1, "Last 7 days": 7, "Last 30 days": 30, "All time": None}
+period = st.sidebar.selectbox("Period", list(periods), index=1)
+digest = st.sidebar.text_input("Image hash", help="SHA-256 of the image file, to find earlier results")
+limit = st.sidebar.number_input("Rows", min_value=10, max_value=10000, value=200, step=50)
+
+days = periods[period]
+since = None if days is None else time.time() - days * 86400
+model_filter = None if model == "All" else model
+
+# Per-class totals for the period
+counts = history.class_counts(model=model_filter, since=since)
+col1, col2 = st.columns([1, 2])
+with col1:
+    st.metric("Predictions", sum(sum(by_class.values()) for by_class in counts.values()))
+    if history.dropped:
+        st.warning(f"⚠️ {history.dropped} predictions were not recorded (writer overloaded)")
+with col2:
+    chart = {
+        "Class": [f"{name} ({row_model})" for row_model, by_class in sorted(counts.items())
+                  for name in by_class],
+        "Predictions": [count for _, by_class in sorted(counts.items()) for count in by_class.values()],
+    }
+    if chart["Class"]:
+        st.bar_chart(chart, x="Class", y="Predictions")
+
+# Matching predictions, newest first
+rows = history.query(
+    model=model_filter,
+    class_name=None if class_name == "All" else class_name,
+    min_confidence=min_confidence or None,
+    since=since,
+    digest=digest.strip() or None,
+    limit=int(limit),
+)
+st.subheader(f"📋 {len(rows)} matching predictions")
+if rows:
+    st.dataframe(
+        {
+            "Time": [datetime.fromtimestamp(row["created"]).strftime("%Y-%m-%d %H:%M:%S") for row in rows],
+            "Model": [row["model"] for row in rows],
+            "Result": [row["class_name"] for row in rows],
+            "Confidence": [row["confidence"] for row in rows],
+            "File": [row["source"] or "" for row in rows],
+            "Image hash": [row["digest"] for row in rows],
+        },
+        column_config={
+            "Confidence": st.column_config.ProgressColumn(
+                "Confidence", format="%.3f", min_value=0.0, max_value=1.0
+            ),
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+else:
+    st.info("No predictions match these filters.")
+
+st.sidebar.markdown("---")
+st.sidebar.info("""
+Records image hashes and results only; uploaded images themselves are never stored.
+""")
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.base_predictor import BasePredictor
+from utils.cascade import TriageGate, calibrate, distill, recommend
+from utils.datasets import Manifest
+from utils.shards import pack
+
+# Channel 0 of an image picks the stand-in model's class (0, 100 or 200),
+# channel 1 is the stand-in gate's P(normal) * 255
+PIXEL_CLASS_STEP = 100
+
+
+class StubPredictor(BasePredictor):
+    """BasePredictor with a forward pass read off the pixels; records every row it sees."""
+
+    name = 'stub'
+    class_names = ['normal', 'small', 'large']
+    normal_class = 'normal'
+    image_size = 4
+    input_divisor = 255.0
+
+    def __init__(self, gate=None):
+        self.instrument = False
+        self.gate = gate
+        self.seen = []
+        self._serve = self._forward_pixels
+
+    def _forward_pixels(self, batch):
+        self.seen.extend(batch[:, 0, 0].tolist())
+        classes = np.rint(batch[:, 0, 0, 0] * 255.0 / PIXEL_CLASS_STEP).astype(int)
+        return np.eye(len(self.class_names), dtype=np.float32)[classes] * 0.7 + 0.1
+
+
+class StandInGate:
+    fingerprint = 'stand-in'
+
+    def __init__(self, threshold=0.95):
+        self.threshold = threshold
+
+    def scores(self, batch):
+        return batch[:, 0, 0, 1].copy()
+
+
+def rows(*pixels):
+    """A preprocessed batch with one constant (class pixel, gate pixel) row per argument."""
+    batch = np.zeros((len(pixels), 4, 4, 3), dtype=np.float32)
+    for row, (class_pixel, gate_pixel) in zip(batch, pixels):
+        row[..., 0] = class_pixel / 255.0
+        row[..., 1] = gate_pixel / 255.0
+    return batch
+
+
+def test_gate_answers_confident_normals_and_escalates_the_rest():
+    predictor = StubPredictor(StandInGate(threshold=0.95))
+    batch = rows((0, 250), (100, 50), (0, 245), (200, 240))
+    results = predictor.predict_preprocessed(batch)
+
+    # Only the two rows scored below the threshold reach the full model, as one batch
+    assert predictor.seen == batch[[1, 3], 0, 0].tolist()
+    assert [result['triage'] for result in results] == ['gate', 'full', 'gate', 'full']
+    assert [result['class_name'] for result in results] == ['normal', 'small', 'normal', 'large']
+    gated = results[0]
+    assert gated['confidence'] == pytest.approx(250 / 255)
+    assert sum(gated['all_predictions']) == pytest.approx(1.0)
+    assert gated['gate_score'] == gated['confidence']
+
+
+def test_gate_short_circuits_the_full_model():
+    predictor = StubPredictor(StandInGate(threshold=0.5))
+    results = predictor.predict_preprocessed(rows((100, 200), (200, 255)))
+    assert predictor.seen == []
+    assert {result['triage'] for result in results} == {'gate'}
+
+
+def test_predict_probabilities_skips_the_gate():
+    predictor = StubPredictor(StandInGate(threshold=0.5))
+    probs = predictor.predict_probabilities(rows((200, 255)))
+    assert probs.argmax(axis=1).tolist() == [2]
+    assert len(predictor.seen) == 1
+
+
+# (label, class pixel, gate pixel): the stand-in model misses image 4, the
+# gate scores abnormal images 3 (0.98) and 6 (0.94) as normal
+IMAGES = [(0, 0, 250), (0, 0, 100), (1, 100, 250), (1, 0, 50), (2, 200, 20), (2, 200, 240)]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    paths, labels = [], []
+    for index, (label, class_pixel, gate_pixel) in enumerate(IMAGES):
+        path = tmp_path / f'{index}.png'
+        Image.new('RGB', (4, 4), (class_pixel, gate_pixel, 0)).save(path)
+        paths.append(str(path))
+        labels.append(label)
+    return Manifest(paths, labels, StubPredictor.class_names)
+
+
+def test_calibrate_reports_each_threshold(manifest):
+    predictor = StubPredictor()
+    report = calibrate(predictor, StandInGate(), manifest, thresholds=(0.9, 0.95), batch_size=4)
+
+    assert len(predictor.seen) == len(IMAGES)
+    assert (report['images'], report['abnormal_images']) == (6, 4)
+    assert report['full_model'] == {'miss_rate': 0.25, 'accuracy': pytest.approx(5 / 6)}
+    loose, strict = report['thresholds']
+    assert (loose['gated'], loose['miss_rate'], loose['gate_misses']) == (0.5, 0.75, 2)
+    assert loose['accuracy'] == 0.5
+    assert (strict['gated'], strict['miss_rate'], strict['gate_misses']) == (pytest.approx(1 / 3), 0.5, 1)
+    assert strict['accuracy'] == pytest.approx(4 / 6)
+    assert recommend(report, max_miss_rate=0.5) == 0.95
+    assert recommend(report, max_miss_rate=0.3) is None
+
+
+def test_distill_trains_a_loadable_gate(manifest, tmp_path):
+    pytest.importorskip('tensorflow')
+    dataset = pack(manifest, str(tmp_path / 'shards'), StubPredictor.image_size, shard_size=4)
+    predictor = StubPredictor()
+    output = str(tmp_path / 'gate.keras')
+    summary = distill(predictor, dataset, output, epochs=1, batch_size=4, gate_size=4)
+
+    assert len(predictor.seen) == len(IMAGES)
+    # The teacher calls images 1, 2 and 4 normal
+    assert summary['images'] == 6
+    assert summary['teacher_normal_rate'] == 0.5
+    gate = TriageGate(output, StubPredictor.image_size)
+    scores = gate.scores(rows((0, 0), (200, 0)))
+    assert scores.shape == (2,)
+    assert ((scores >= 0) & (scores <= 1)).all()
@@ -0,0 +1,135 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import utils.evaluate
+from utils.evaluate import LOGIT_RANGE, SCORE_BINS, StreamingEvaluation, compare
+
+CLASS_NAMES = ['normal', 'glioma', 'meningioma']
+
+
+def reference_auc(scores, positive):
+    """ROC-AUC from sklearn, or the Mann-Whitney statistic with ties counted half."""
+    try:
+        from sklearn.metrics import roc_auc_score
+    except ImportError:
+        pos, neg = scores[positive], scores[~positive]
+        greater = (pos[:, None] > neg[None, :]).sum()
+        ties = (pos[:, None] == neg[None, :]).sum()
+        return (greater + 0.5 * ties) / (len(pos) * len(neg))
+    return roc_auc_score(positive, scores)
+
+
+def sample(n=600, seed=0):
+    """Labels and softmax outputs of a noisy but better-than-chance classifier."""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, len(CLASS_NAMES), n)
+    logits = rng.normal(0, 1.5, (n, len(CLASS_NAMES)))
+    logits[np.arange(n), labels] += 1.5
+    probs = np.exp(logits)
+    return probs / probs.sum(axis=1, keepdims=True), labels
+
+
+def test_roc_auc_and_confusion_match_an_exact_reference():
+    probs, labels = sample()
+    evaluation = StreamingEvaluation(CLASS_NAMES, normal_class='normal')
+    for start in range(0, len(labels), 64):
+        evaluation.update(probs[start:start + 64], labels[start:start + 64])
+    report = evaluation.report()
+
+    # Binning can only err on pairs that share a bin; half of each is the bound
+    bin_width = 2 * LOGIT_RANGE / SCORE_BINS
+    for index, name in enumerate(CLASS_NAMES):
+        positive = labels == index
+        logits = np.log(probs[:, index]) - np.log1p(-probs[:, index])
+        shared = np.abs(logits[positive][:, None] - logits[~positive][None, :]) < bin_width
+        tolerance = 0.5 * shared.mean() + 1e-12
+        expected = reference_auc(probs[:, index], positive)
+        assert report['classes'][name]['roc_auc'] == pytest.approx(expected, abs=tolerance)
+
+    predicted = probs.argmax(axis=1)
+    confusion = np.zeros((3, 3), dtype=int)
+    for label, prediction in zip(labels, predicted):
+        confusion[label, prediction] += 1
+    assert report['confusion_matrix']['counts'] == confusion.tolist()
+    assert report['accuracy'] == pytest.approx((predicted == labels).mean())
+    recall = confusion[1, 1] / confusion[1].sum()
+    assert report['classes']['glioma']['recall'] == pytest.approx(recall)
+    abnormal = labels != 0
+    assert report['screening']['sensitivity'] == pytest.approx((predicted[abnormal] != 0).mean())
+    assert report['screening']['missed_abnormal'] == int((predicted[abnormal] == 0).sum())
+
+
+def test_tied_and_perfect_scores():
+    evaluation = StreamingEvaluation(['normal', 'tumor'])
+    evaluation.update([[0.5, 0.5]] * 4, [0, 1, 0, 1])
+    assert evaluation.roc_auc(1) == 0.5
+
+    evaluation = StreamingEvaluation(['normal', 'tumor'])
+    evaluation.update([[0.999, 0.001], [0.001, 0.999], [0.6, 0.4], [0.4, 0.6]], [0, 1, 0, 1])
+    assert evaluation.roc_auc(1) == 1.0
+    # No negatives, no AUC
+    assert StreamingEvaluation(['normal', 'tumor']).roc_auc(1) is None
+
+
+def test_compare_flags_drops_beyond_tolerance():
+    baseline = {'accuracy': 0.90, 'macro': {'roc_auc': 0.95}, 'screening': {'sensitivity': 0.97}}
+    current = {'accuracy': 0.895, 'macro': {'roc_auc': 0.90}, 'screening': {'sensitivity': 0.99}}
+    assert compare(current, baseline, tolerance=0.01) == [('macro.roc_auc', 0.95, 0.90)]
+    assert compare(current, baseline, tolerance=0.1) == []
+    # Metrics missing from either report are not compared
+    assert compare({'accuracy': 0.5}, {'macro': {'roc_auc': 1.0}}) == []
+
+
+class PixelPredictor:
+    """P(tumor) is the first pixel's value."""
+
+    name = 'pixel'
+    class_names = ['normal', 'tumor']
+    normal_class = 'normal'
+    image_size = 4
+    input_divisor = 255.0
+
+    def __init__(self, model_path, backend='keras', num_threads=None, **kwargs):
+        self.model_path = model_path
+
+    def predict_preprocessed(self, batch):
+        tumor = batch[:, 0, 0, 0].astype(np.float64)
+        return [{'all_predictions': [1.0 - p, p]} for p in tumor]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # One tumor scan looks normal (pixel 60), everything else is separable
+    for name, values in (('normal', (10, 40, 80)), ('tumor', (60, 200, 230, 250))):
+        (tmp_path / 'data' / name).mkdir(parents=True)
+        for value in values:
+            Image.new('RGB', (4, 4), (value, 0, 0)).save(tmp_path / 'data' / name / f'{value}.png')
+    return tmp_path / 'data'
+
+
+def test_cli_exits_1_on_regression(data_dir, tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(utils.evaluate.PREDICTORS, 'brain', PixelPredictor)
+    output = tmp_path / 'eval.json'
+    args = ['brain', str(data_dir), '--model-path', 'pixel.keras', '--batch-size', '3',
+            '--workers', '2', '--quiet', '--output', str(output)]
+    utils.evaluate.main(args)
+    report = json.loads(output.read_text())
+    assert report['images'] == 7 and report['failed'] == 0
+    assert report['confusion_matrix']['counts'] == [[3, 0], [1, 3]]
+    assert report['screening']['sensitivity'] == 0.75
+    # 80 is the only normal scan above a tumor scan (60)
+    assert report['classes']['tumor']['roc_auc'] == pytest.approx(11 / 12)
+
+    # Against itself: no regression, normal exit
+    utils.evaluate.main(args + ['--baseline', str(output)])
+
+    better = dict(report, accuracy=1.0, screening=dict(report['screening'], sensitivity=1.0))
+    baseline = tmp_path / 'better.json'
+    baseline.write_text(json.dumps(better))
+    with pytest.raises(SystemExit) as exited:
+        utils.evaluate.main(args + ['--baseline', str(baseline)])
+    assert exited.value.code == 1
+    assert 'REGRESSION accuracy' in capsys.readouterr().err
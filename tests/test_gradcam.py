@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+tf = pytest.importorskip('tensorflow')
+
+from utils.brain_predictor import BrainTumorPredictor
+from utils.gradcam import GradCAM, colorize, overlay
+
+SIZE = 16
+
+
+def tiny_model(size=SIZE, classes=3, seed=0):
+    """Conv blocks nested in a Sequential, like the brain model's VGG16 base."""
+    tf.keras.utils.set_random_seed(seed)
+    layers = tf.keras.layers
+    base = tf.keras.Sequential([
+        tf.keras.Input((size, size, 3)),
+        layers.Conv2D(4, 3, padding='same', activation='relu', name='conv1'),
+        layers.MaxPooling2D(2),
+        layers.Conv2D(6, 3, padding='same', activation='relu', name='conv2'),
+    ])
+    return tf.keras.Sequential([
+        tf.keras.Input((size, size, 3)),
+        base,
+        layers.GlobalAveragePooling2D(),
+        layers.Dense(classes, activation='softmax', name='head'),
+    ])
+
+
+def reference_cams(model, batch):
+    """Textbook Grad-CAM of the predicted class's logit at ``conv2``."""
+    base, pool, head = model.layers
+    features = base(batch)
+    with tf.GradientTape() as tape:
+        tape.watch(features)
+        logits = tf.matmul(pool(features), head.kernel) + head.bias
+        predicted = tf.argmax(logits, axis=-1)
+        scores = tf.reduce_sum(logits * tf.one_hot(predicted, logits.shape[-1]), axis=-1)
+    grads = tape.gradient(scores, features).numpy()
+    cams = np.maximum((grads.mean(axis=(1, 2), keepdims=True) * features.numpy()).sum(axis=-1), 0)
+    peaks = cams.max(axis=(1, 2), keepdims=True)
+    return np.where(peaks > 0, cams / np.where(peaks > 0, peaks, 1), 0)
+
+
+@pytest.fixture
+def batch():
+    return np.random.default_rng(0).uniform(0, 1, (5, SIZE, SIZE, 3)).astype(np.float32)
+
+
+def test_maps_have_feature_resolution_and_are_normalized(batch):
+    model = tiny_model()
+    gradcam = GradCAM(model, SIZE)
+    assert gradcam.layer_name == 'conv2'
+
+    probs, cams = gradcam(batch)
+    np.testing.assert_allclose(probs, model(batch).numpy(), atol=1e-5)
+    assert cams.shape == (5, SIZE // 2, SIZE // 2)
+    assert cams.min() >= 0.0 and cams.max() <= 1.0
+    # Each map is scaled so its peak is 1
+    np.testing.assert_allclose(cams.max(axis=(1, 2)), 1.0, atol=1e-4)
+    np.testing.assert_allclose(cams, reference_cams(model, batch), atol=1e-4)
+
+
+def test_explicit_layer(batch):
+    _, cams = GradCAM(tiny_model(), SIZE, layer_name='conv1')(batch)
+    assert cams.shape == (5, SIZE, SIZE)
+
+
+def test_overlay_keeps_the_image_size():
+    image = Image.new('L', (40, 30), 128)
+    cam = np.linspace(0, 1, 64, dtype=np.float32).reshape(8, 8)
+    blended = overlay(image, cam)
+    assert (blended.mode, blended.size) == ('RGB', (40, 30))
+    assert colorize(np.array([0.0, 1.0])).shape == (2, 3)
+
+
+def test_predictor_returns_a_map_per_image(tmp_path):
+    path = str(tmp_path / 'tiny.keras')
+    tiny_model(size=BrainTumorPredictor.image_size, classes=4).save(path)
+    predictor = BrainTumorPredictor(path)
+    images = [np.full((60, 60, 3), value, dtype=np.uint8) for value in (30, 220)]
+    results = predictor.predict_gradcam_batch(images)
+    plain = predictor.predict_batch(images)
+    for result, expected in zip(results, plain):
+        assert result['class_name'] == expected['class_name']
+        cam = np.asarray(result['gradcam'])
+        assert cam.shape == (64, 64)
+        assert cam.min() >= 0.0 and cam.max() <= 1.0
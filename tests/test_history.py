@@ -0,0 +1,136 @@
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from utils.history import HistoryStore, RecordingPredictor
+from utils.prediction_cache import CachedPredictor, PredictionCache, image_digest
+
+
+def result(class_name='glioma', confidence=0.9, timings=None):
+    record = {'class_name': class_name, 'class_index': 0, 'confidence': confidence,
+              'all_predictions': [confidence, 1 - confidence]}
+    if timings is not None:
+        record['timings'] = timings
+    return record
+
+
+class BrightnessPredictor:
+    """'bright' when the mean pixel is above 127; counts the images it is asked about."""
+
+    name = 'fake'
+    class_names = ['dark', 'bright']
+    model_fingerprint = 'fake.keras:1:1'
+
+    def __init__(self):
+        self.seen = 0
+
+    def predict_batch(self, images, batch_size=32):
+        self.seen += len(images)
+        results = []
+        for image in images:
+            index = int(image.mean() > 127)
+            results.append({'class_name': self.class_names[index], 'class_index': index,
+                            'confidence': 1.0, 'all_predictions': [1.0 - index, float(index)],
+                            'timings': {'infer': 2.0}})
+        return results
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history' / 'curevia.db'))
+    yield store
+    store.close()
+
+
+def test_database_is_in_wal_mode_and_readers_do_not_block(store):
+    with sqlite3.connect(store.path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    store.record('brain', 'abc', result())
+    store.flush()
+
+    # An open write transaction elsewhere does not block queries
+    writer = sqlite3.connect(store.path, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    writer.execute('DELETE FROM predictions')
+    try:
+        assert [row['digest'] for row in store.query()] == ['abc']
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
+
+
+def test_rows_are_written_in_batches_and_flushed_on_close(tmp_path):
+    store = HistoryStore(str(tmp_path / 'curevia.db'), batch_size=3, flush_interval=60)
+    for i in range(7):
+        store.record('brain', f'digest-{i}', result(timings={'infer': 1.5}), source=f'{i}.png')
+    # Two full batches go straight out; the last row waits for the interval
+    assert wait_for(lambda: len(store) == 6)
+    time.sleep(0.2)
+    assert len(store) == 6
+
+    store.close()
+    assert len(store) == 7
+    rows = store.query(limit=None)
+    assert {row['source'] for row in rows} == {f'{i}.png' for i in range(7)}
+    assert rows[0]['timings'] == {'infer': 1.5}
+    assert rows[0]['all_predictions'] == [0.9, pytest.approx(0.1)]
+    with pytest.raises(RuntimeError):
+        store.record('brain', 'late', result())
+
+
+def test_query_filters(store):
+    store.record('brain', 'a', result('glioma', 0.95), created=100)
+    store.record('brain', 'b', result('notumor', 0.6), created=200)
+    store.record('eye', 'a', result('CNV', 0.99), created=300)
+    store.flush()
+
+    assert [row['digest'] for row in store.query(model='brain')] == ['b', 'a']
+    assert [row['model'] for row in store.query(min_confidence=0.9)] == ['eye', 'brain']
+    assert [row['created'] for row in store.query(since=150, until=300)] == [200]
+    assert store.latest('a')['model'] == 'eye'
+    assert store.latest('a', model='brain')['class_name'] == 'glioma'
+    assert store.class_counts() == {'brain': {'glioma': 1, 'notumor': 1}, 'eye': {'CNV': 1}}
+
+
+def test_recording_predictor_records_batched_calls_in_order(store):
+    images = [np.full((4, 4, 3), value, dtype=np.uint8) for value in (10, 200, 30)]
+    recorder = RecordingPredictor(BrightnessPredictor(), store)
+    results = recorder.predict_batch(images, batch_size=2)
+    store.flush()
+
+    assert [result['class_name'] for result in results] == ['dark', 'bright', 'dark']
+    rows = store.query(limit=None)[::-1]
+    assert [row['digest'] for row in rows] == [image_digest(image) for image in images]
+    assert [row['class_name'] for row in rows] == ['dark', 'bright', 'dark']
+    assert {row['model'] for row in rows} == {'fake'}
+    assert rows[0]['timings'] == {'infer': 2.0}
+
+
+def test_recording_predictor_records_cache_hits(store):
+    predictor = BrightnessPredictor()
+    recorder = RecordingPredictor(
+        CachedPredictor(predictor, PredictionCache()), store, model='brain'
+    )
+    image = np.full((4, 4, 3), 220, dtype=np.uint8)
+    recorder.predict(image)
+    recorder.predict(image)
+    store.flush()
+
+    # Served once by the model and once from the cache, recorded both times
+    assert predictor.seen == 1
+    hit, miss = store.query(digest=image_digest(image))
+    assert hit['class_name'] == miss['class_name'] == 'bright'
+    assert hit['model'] == miss['model'] == 'brain'
+    # Cached results carry no stage timings of their own
+    assert (miss['timings'], hit['timings']) == ({'infer': 2.0}, None)
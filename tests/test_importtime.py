@@ -0,0 +1,29 @@
+from utils.importtime import main, page_modules
+
+
+def test_page_modules_follow_the_pages():
+    modules = page_modules()
+    for module in ('utils.gradcam', 'utils.history', 'utils.metrics', 'utils.model_registry',
+                   'utils.prediction_cache', 'utils.preprocessing', 'utils.scheduler'):
+        assert module in modules
+
+
+def test_page_modules_parses_every_import_form(tmp_path):
+    (tmp_path / 'pages').mkdir()
+    (tmp_path / 'app.py').write_text('import streamlit as st\nfrom utils.model_registry import default_registry\n')
+    (tmp_path / 'pages' / 'Scan.py').write_text(
+        'import sys\n'
+        'import utils.metrics\n'
+        'from utils import history, scheduler\n'
+        'from .local import helper\n'
+        'def later():\n'
+        '    from utils.cascade import distill\n'
+    )
+    assert page_modules(str(tmp_path)) == [
+        'utils.history', 'utils.metrics', 'utils.model_registry', 'utils.scheduler',
+    ]
+
+
+def test_page_modules_do_not_import_tensorflow_eagerly(capsys):
+    assert main(['--skip-baseline']) == 0
+    assert 'imports tensorflow' not in capsys.readouterr().out
@@ -0,0 +1,97 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from utils.metrics import CONTENT_TYPE, Histogram, Metrics, observe_stages, to_milliseconds
+
+
+def samples(text):
+    """{series: value} for every sample line of Prometheus text."""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            values[series] = float(value)
+    return values
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram('latency_seconds', 'Request latency', ('model', 'stage'), buckets=(0.5, 0.1, 1.0))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        histogram.observe(value, model='brain', stage='decode')
+    histogram.observe(0.7, model='eye', stage='infer')
+    lines = histogram.render()
+
+    assert lines[:2] == ['# HELP latency_seconds Request latency', '# TYPE latency_seconds histogram']
+    brain = [line for line in lines if 'brain' in line]
+    # Buckets sorted, upper bounds inclusive (0.1 lands in le="0.1"), +Inf last
+    assert [line.rsplit(' ', 1)[0] for line in brain] == [
+        'latency_seconds_bucket{model="brain",stage="decode",le="0.1"}',
+        'latency_seconds_bucket{model="brain",stage="decode",le="0.5"}',
+        'latency_seconds_bucket{model="brain",stage="decode",le="1.0"}',
+        'latency_seconds_bucket{model="brain",stage="decode",le="+Inf"}',
+        'latency_seconds_sum{model="brain",stage="decode"}',
+        'latency_seconds_count{model="brain",stage="decode"}',
+    ]
+    values = samples('\n'.join(lines))
+    assert [values[line.rsplit(' ', 1)[0]] for line in brain[:4]] == [2, 3, 3, 4]
+    assert values['latency_seconds_sum{model="brain",stage="decode"}'] == pytest.approx(2.45)
+    assert values['latency_seconds_count{model="brain",stage="decode"}'] == 4
+    assert values['latency_seconds_bucket{model="eye",stage="infer",le="0.5"}'] == 0
+    assert values['latency_seconds_bucket{model="eye",stage="infer",le="1.0"}'] == 1
+    assert values['latency_seconds_count{model="eye",stage="infer"}'] == 1
+
+
+def test_unlabelled_histogram_series():
+    histogram = Histogram('queue_seconds', 'Queue wait', buckets=(1.0,))
+    histogram.observe(0.25)
+    assert histogram.render()[2:] == [
+        'queue_seconds_bucket{le="1.0"} 1',
+        'queue_seconds_bucket{le="+Inf"} 1',
+        'queue_seconds_sum 0.25',
+        'queue_seconds_count 1',
+    ]
+
+
+def test_registry_renders_and_writes_every_histogram(tmp_path):
+    metrics = Metrics()
+    observe_stages('brain', {'decode': 0.002, 'infer': 0.03}, metrics=metrics)
+    stages = metrics.histogram('curevia_stage_seconds', 'ignored on reuse')
+    assert stages.label_names == ('model', 'stage')
+    metrics.histogram('curevia_request_seconds', 'Requests', ('model',)).observe(0.2, model='brain')
+
+    text = metrics.render()
+    assert text.endswith('\n')
+    values = samples(text)
+    assert values['curevia_stage_seconds_count{model="brain",stage="infer"}'] == 1
+    assert values['curevia_stage_seconds_bucket{model="brain",stage="decode",le="0.0025"}'] == 1
+    assert values['curevia_request_seconds_sum{model="brain"}'] == 0.2
+
+    path = tmp_path / 'curevia.prom'
+    metrics.write(str(path))
+    assert path.read_text() == text
+    assert [p.name for p in tmp_path.iterdir()] == ['curevia.prom']
+
+
+def test_metrics_endpoint():
+    metrics = Metrics()
+    metrics.histogram('curevia_stage_seconds', 'Stages', ('model', 'stage')).observe(
+        0.01, model='eye', stage='infer'
+    )
+    server = metrics.serve(0)
+    port = server.server_address[1]
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert response.read().decode() == metrics.render()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/other')
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_to_milliseconds():
+    assert to_milliseconds({'decode': 0.0012345, 'infer': 0.5}) == {'decode': 1.234, 'infer': 500.0}
@@ -0,0 +1,98 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from utils.model_registry import ModelRegistry, ModelSpec
+from utils.prediction_cache import model_fingerprint
+
+
+class SlowPredictor:
+    """Loads for ``load_seconds`` and counts constructions and warm-ups per path."""
+
+    class_names = ['normal', 'abnormal']
+    image_size = 8
+    load_seconds = 0.0
+    loads = {}
+    warm_ups = {}
+
+    def __init__(self, model_path, warm_up_batch_size=1):
+        self.model_path = model_path
+        self.model_fingerprint = model_fingerprint(model_path)
+        self.backend = 'keras'
+        self.model = SimpleNamespace(weights=[])
+        time.sleep(self.load_seconds)
+        SlowPredictor.loads[model_path] = SlowPredictor.loads.get(model_path, 0) + 1
+        self.warm_up(batch_size=warm_up_batch_size)
+
+    def warm_up(self, batch_size=1):
+        SlowPredictor.warm_ups[self.model_path] = SlowPredictor.warm_ups.get(self.model_path, 0) + 1
+
+
+class SlowBrain(SlowPredictor):
+    load_seconds = 1.0
+
+
+def make_registry(tmp_path):
+    SlowPredictor.loads.clear()
+    SlowPredictor.warm_ups.clear()
+    paths = {}
+    for name in ('slow', 'fast'):
+        paths[name] = str(tmp_path / f'{name}.keras')
+        with open(paths[name], 'wb') as f:
+            f.write(name.encode())
+    registry = ModelRegistry([
+        ModelSpec('slow', SlowBrain, paths['slow'], warm_up_batch_size=4),
+        ModelSpec('fast', SlowPredictor, paths['fast']),
+    ])
+    return registry, paths
+
+
+def test_loading_one_model_does_not_block_others(tmp_path):
+    registry, _ = make_registry(tmp_path)
+    registry.get('fast')
+    loader = threading.Thread(target=registry.get, args=('slow',))
+    loader.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    registry.get('fast')
+    assert time.monotonic() - start < 0.5
+    loader.join()
+
+
+def test_concurrent_callers_share_one_load_and_warm_up(tmp_path):
+    registry, paths = make_registry(tmp_path)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get('slow'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(predictor) for predictor in results}) == 1
+    assert SlowPredictor.loads[paths['slow']] == 1
+    assert SlowPredictor.warm_ups[paths['slow']] == 1
+
+
+def test_replaced_file_is_checked_at_most_once_per_interval(tmp_path, monkeypatch):
+    import utils.model_registry
+
+    registry, paths = make_registry(tmp_path)
+    registry.reload_check_seconds = 0.2
+    stats = []
+
+    def counting_fingerprint(path):
+        stats.append(path)
+        return model_fingerprint(path)
+
+    monkeypatch.setattr(utils.model_registry, 'model_fingerprint', counting_fingerprint)
+    handle = registry.handle('fast')
+    first = registry.get('fast')
+    for _ in range(100):
+        handle.warm_up
+    assert stats == []
+
+    time.sleep(0.25)
+    with open(paths['fast'], 'wb') as f:
+        f.write(b'new weights')
+    assert registry.get('fast') is not first
+    assert stats == [paths['fast']]
+    assert SlowPredictor.loads[paths['fast']] == 2
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from utils.brain_predictor import BrainTumorPredictor
+from utils.model_registry import ModelRegistry, ModelSpec
+from utils.prediction_cache import CachedPredictor, PredictionCache
+
+
+def save_model(path, seed):
+    """Save a small brain-shaped classifier whose outputs depend on ``seed``."""
+    tf.keras.utils.set_random_seed(seed)
+    size = BrainTumorPredictor.image_size
+    model = tf.keras.Sequential([
+        tf.keras.Input((size, size, 3)),
+        tf.keras.layers.Conv2D(4, 3, strides=8),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(len(BrainTumorPredictor.class_names), activation='softmax'),
+    ])
+    # Write then rename, like a model deployment
+    temporary = f'{path}.tmp.keras'
+    model.save(temporary)
+    os.replace(temporary, path)
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).integers(0, 256, (160, 160, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('disk', [False, True])
+def test_replaced_model_file_is_not_served_from_cache(tmp_path, image, disk):
+    path = str(tmp_path / 'model.keras')
+    save_model(path, seed=1)
+    # Check the file on every call; the throttle is covered in test_model_registry
+    registry = ModelRegistry([ModelSpec('brain', BrainTumorPredictor, path)], reload_check_seconds=0)
+    cache = PredictionCache(directory=str(tmp_path / 'cache') if disk else None)
+    cached = CachedPredictor(registry.handle('brain'), cache)
+
+    old = cached.predict(image)
+    assert cached.predict(image)['all_predictions'] == old['all_predictions']
+    assert cache.stats()['hits'] == 1
+
+    save_model(path, seed=2)
+    # Make sure the fingerprint changes even on coarse-timestamp filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    new = BrainTumorPredictor(path).predict(image)['all_predictions']
+    assert not np.allclose(new, old['all_predictions'])
+    assert cached.predict(image)['all_predictions'] == new
+    # And the fresh result is filed under the new model only
+    assert cached.predict(image)['all_predictions'] == new
+
+
+def test_key_follows_loaded_model_not_file(tmp_path, image):
+    path = str(tmp_path / 'model.keras')
+    save_model(path, seed=1)
+    predictor = BrainTumorPredictor(path)
+    cache = PredictionCache()
+    cached = CachedPredictor(predictor, cache)
+    old = cached.predict(image)
+
+    save_model(path, seed=2)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # The predictor still holds the old weights, so its results stay under the old key
+    assert cached.predict(image)['all_predictions'] == old['all_predictions']
+    reloaded = BrainTumorPredictor(path)
+    assert cache.key(reloaded.model_fingerprint, image) != cache.key(predictor.model_fingerprint, image)
+    assert CachedPredictor(reloaded, cache).predict(image)['all_predictions'] == \
+        reloaded.predict(image)['all_predictions']
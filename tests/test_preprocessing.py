@@ -0,0 +1,121 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.preprocessing import allocate_batch, preprocess_batch, preprocess_image
+
+# (size, divisor) of the brain and eye models
+MODEL_INPUTS = [(128, 255.0), (224, 1.0)]
+
+
+def reference(image, size, divisor, opened_by_us=True):
+    """
+    Written from the documented pipeline with plain PIL and numpy calls,
+    sharing no code with ``utils.preprocessing``.
+    """
+    img = Image.open(io.BytesIO(image)) if isinstance(image, bytes) else image
+    if opened_by_us and img.format == 'JPEG':
+        img.draft('RGB', (size, size))
+    if img.mode in ('I', 'I;16', 'F'):
+        values = np.array(img, dtype=np.float32)
+        if values.max() > 0:
+            values *= np.float32(255.0) / np.float32(values.max())
+        img = Image.fromarray(np.clip(np.rint(values), 0, 255).astype(np.uint8), 'L')
+    elif img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.Resampling.BICUBIC)
+    img = img.convert('RGB')
+    return np.array(img, dtype=np.float32) / np.float32(divisor)
+
+
+def encode(img, fmt, **params):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+def gradient(width, height):
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    return np.stack([x * y, x * (1 - y), (1 - x) * y], axis=-1)
+
+
+def samples():
+    rgb = Image.fromarray((gradient(1024, 768) * 255).astype(np.uint8), 'RGB')
+    small = rgb.resize((300, 200))
+    rng = np.random.default_rng(0)
+    wide = (gradient(300, 200)[..., 0] * 40000).astype(np.uint16)
+    return {
+        'jpeg_draft': encode(rgb, 'JPEG', quality=90),
+        'jpeg_gray': encode(rgb.convert('L'), 'JPEG'),
+        'png_rgb': encode(small, 'PNG'),
+        'png_l': encode(small.convert('L'), 'PNG'),
+        'png_rgba': encode(small.convert('RGBA'), 'PNG'),
+        'png_p': encode(small.convert('P', palette=Image.Palette.ADAPTIVE), 'PNG'),
+        'png_i16': encode(Image.fromarray(wide), 'PNG'),
+        'tiff_f': encode(Image.fromarray(rng.random((200, 300), dtype=np.float32) * 3.5), 'TIFF'),
+        'exact_size': encode(rgb.resize((128, 128)), 'PNG'),
+    }
+
+
+SAMPLES = samples()
+
+
+def test_jpeg_sample_is_draft_decoded():
+    img = Image.open(io.BytesIO(SAMPLES['jpeg_draft']))
+    img.draft('RGB', (128, 128))
+    assert img.size < (1024, 768)
+
+
+@pytest.mark.parametrize('size, divisor', MODEL_INPUTS)
+@pytest.mark.parametrize('name', sorted(SAMPLES))
+def test_matches_reference(name, size, divisor):
+    expected = reference(SAMPLES[name], size, divisor)
+    assert np.array_equal(preprocess_image(SAMPLES[name], size, divisor), expected)
+    batch = preprocess_batch([SAMPLES[name]], size, divisor)
+    assert batch.dtype == np.float32
+    assert np.array_equal(batch[0], expected)
+
+
+@pytest.mark.parametrize('size, divisor', MODEL_INPUTS)
+def test_reused_buffer_matches_reference(size, divisor):
+    names = sorted(SAMPLES)
+    out = allocate_batch(len(names), size)
+    out.fill(np.nan)
+    # Two different batches through the same buffer: nothing may leak between them
+    for batch_names in (names, names[::-1][:4]):
+        images = [SAMPLES[name] for name in batch_names]
+        batch = preprocess_batch(images, size, divisor, out=out)
+        assert np.shares_memory(batch, out)
+        for row, name in zip(batch, batch_names):
+            assert np.array_equal(row, reference(SAMPLES[name], size, divisor)), name
+
+
+@pytest.mark.parametrize('size, divisor', MODEL_INPUTS)
+@pytest.mark.parametrize('name', ['jpeg_draft', 'png_rgba', 'png_i16', 'tiff_f'])
+def test_opened_pil_image_is_not_drafted_or_modified(name, size, divisor):
+    opened = Image.open(io.BytesIO(SAMPLES[name]))
+    original = (opened.mode, opened.size)
+    expected = reference(Image.open(io.BytesIO(SAMPLES[name])), size, divisor, opened_by_us=False)
+    batch = preprocess_batch([opened], size, divisor, out=allocate_batch(2, size))
+    assert np.array_equal(batch[0], expected)
+    assert (opened.mode, opened.size) == original
+
+
+@pytest.mark.parametrize('source', ['bytes', 'file', 'path', 'array'])
+def test_input_forms_agree(tmp_path, source):
+    data = SAMPLES['png_rgb']
+    if source == 'file':
+        image = io.BytesIO(data)
+    elif source == 'path':
+        image = tmp_path / 'scan.png'
+        image.write_bytes(data)
+        image = str(image)
+    elif source == 'array':
+        image = np.array(Image.open(io.BytesIO(data)))
+    else:
+        image = data
+    assert np.array_equal(preprocess_batch([image], 128, 255.0)[0], reference(data, 128, 255.0))
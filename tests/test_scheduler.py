@@ -0,0 +1,146 @@
+import threading
+
+import numpy as np
+import pytest
+
+from utils.history import HistoryStore, RecordingPredictor
+from utils.prediction_cache import CachedPredictor, PredictionCache
+from utils.scheduler import MicroBatchScheduler
+
+
+class FakePredictor:
+    """Scores an image as its first pixel; records the batch sizes it was given."""
+
+    name = 'fake'
+    class_names = ['low', 'high']
+    image_size = 2
+    instrument = False
+    model_fingerprint = 'fake-model'
+
+    def __init__(self):
+        self.batches = []
+
+    def preprocess(self, image, timings=None):
+        if image is None:
+            raise ValueError('cannot decode')
+        value = image.flat[0] if isinstance(image, np.ndarray) else image
+        return np.full((self.image_size, self.image_size, 3), value, dtype=np.float32)
+
+    def predict_preprocessed(self, batch):
+        self.batches.append(len(batch))
+        if (batch == -1).any():
+            raise RuntimeError('model failed')
+        results = []
+        for row in batch:
+            value = float(row[0, 0, 0])
+            index = int(value > 0.5)
+            results.append({
+                'class_name': self.class_names[index], 'class_index': index,
+                'confidence': 1.0, 'all_predictions': [1.0 - index, float(index)], 'value': value,
+            })
+        return results
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = MicroBatchScheduler(FakePredictor(), max_batch_size=8, max_wait_ms=200)
+    yield scheduler
+    scheduler.close()
+
+
+def test_concurrent_calls_are_coalesced(scheduler):
+    futures = [scheduler.submit(value / 10) for value in range(8)]
+    assert [future.result(5)['value'] for future in futures] == pytest.approx(
+        [value / 10 for value in range(8)]
+    )
+    assert scheduler.predictor.batches == [8]
+
+
+def test_max_batch_size_splits_batches(scheduler):
+    scheduler.predict_batch([0.1] * 20, timeout=5)
+    assert sum(scheduler.predictor.batches) == 20
+    assert max(scheduler.predictor.batches) <= 8
+
+
+def test_preprocessing_error_only_fails_its_own_item(scheduler):
+    futures = [scheduler.submit(image) for image in (0.2, None, 0.9)]
+    assert futures[0].result(5)['class_name'] == 'low'
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert futures[2].result(5)['class_name'] == 'high'
+
+
+def test_model_error_fails_the_batch_and_worker_survives(scheduler):
+    futures = [scheduler.submit(image) for image in (0.2, -1)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(5)
+    assert scheduler.predict(0.7, timeout=5)['class_name'] == 'high'
+
+
+def test_close_while_submitting_never_strands_a_future():
+    for _ in range(20):
+        scheduler = MicroBatchScheduler(FakePredictor(), max_batch_size=4, max_wait_ms=1)
+        futures, start = [], threading.Event()
+
+        def submit_many():
+            start.wait()
+            for _ in range(200):
+                try:
+                    futures.append(scheduler.submit(0.3))
+                except RuntimeError:
+                    return
+
+        threads = [threading.Thread(target=submit_many) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        scheduler.close()
+        for thread in threads:
+            thread.join()
+        # Every accepted image ran before the worker stopped
+        for future in futures:
+            assert future.result(timeout=5)['value'] == pytest.approx(0.3)
+        with pytest.raises(RuntimeError):
+            scheduler.submit(0.3)
+
+
+def test_submit_racing_close_fails_instead_of_hanging():
+    predictor = FakePredictor()
+    preprocessing, release = threading.Event(), threading.Event()
+    original = predictor.preprocess
+
+    def slow_preprocess(image, timings=None):
+        preprocessing.set()
+        release.wait(5)
+        return original(image, timings)
+
+    predictor.preprocess = slow_preprocess
+    scheduler = MicroBatchScheduler(predictor, max_wait_ms=1)
+    outcome = []
+
+    def submit():
+        try:
+            outcome.append(scheduler.submit(0.3))
+        except RuntimeError as exc:
+            outcome.append(exc)
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    # The submit is past its first closed check when close() runs
+    assert preprocessing.wait(5)
+    scheduler.close()
+    release.set()
+    thread.join(5)
+    assert isinstance(outcome[0], RuntimeError)
+
+
+def test_wrappers_can_pass_batch_size(scheduler, tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    try:
+        wrapped = RecordingPredictor(CachedPredictor(scheduler, PredictionCache()), store)
+        images = [np.full((2, 2), value, dtype=np.float32) for value in (0.1, 0.8)]
+        results = wrapped.predict_batch(images, batch_size=4)
+        assert [result['class_name'] for result in results] == ['low', 'high']
+    finally:
+        store.close()
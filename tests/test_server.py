@@ -0,0 +1,198 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from utils.model_registry import ModelRegistry, ModelSpec
+from utils.prediction_cache import model_fingerprint
+from utils.preprocessing import preprocess_image
+from utils.server import InferenceServer
+
+
+class BrightnessPredictor:
+    """Decodes with the real preprocessing; 'bright' when the mean pixel is above 127."""
+
+    name = 'fake'
+    class_names = ['dark', 'bright']
+    image_size = 16
+    instrument = False
+
+    def __init__(self, model_path, warm_up_batch_size=1):
+        self.model_path = model_path
+        self.model_fingerprint = model_fingerprint(model_path)
+        self.backend = 'keras'
+        self.model = SimpleNamespace(weights=[])
+
+    def preprocess(self, image, timings=None):
+        return preprocess_image(image, self.image_size)
+
+    def predict_preprocessed(self, batch):
+        results = []
+        for row in batch:
+            index = int(row.mean() > 127)
+            results.append({'class_name': self.class_names[index], 'class_index': index})
+        return results
+
+
+def png(value, size=(20, 20)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (value,) * 3).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def multipart(*files):
+    boundary = 'curevia-test-boundary'
+    body = b''
+    for index, data in enumerate(files):
+        body += (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="image{index}"; filename="scan{index}.png"\r\n'
+            'Content-Type: image/png\r\n\r\n'
+        ).encode() + data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+async def request(port, method, path, body=b'', content_type='application/octet-stream'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write((
+        f'{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n'
+        f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n'
+    ).encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    if b'application/json' in head:
+        payload = json.loads(payload)
+    return status, payload
+
+
+@pytest.fixture
+def serve(tmp_path):
+    model_path = tmp_path / 'fake.keras'
+    model_path.write_bytes(b'weights')
+    registry = ModelRegistry([ModelSpec('fake', BrightnessPredictor, str(model_path))])
+    server = InferenceServer(registry, max_body_bytes=4096, max_wait_ms=1)
+
+    def run(scenario):
+        async def main():
+            listener = await asyncio.start_server(server._handle_connection, '127.0.0.1', 0)
+            port = listener.sockets[0].getsockname()[1]
+            try:
+                async with listener:
+                    await scenario(server, port)
+            finally:
+                for scheduler in server.schedulers.values():
+                    scheduler.close()
+        asyncio.run(main())
+
+    return run
+
+
+def test_health_and_readiness(serve):
+    async def scenario(server, port):
+        assert (await request(port, 'GET', '/healthz'))[0] == 200
+        status, payload = await request(port, 'GET', '/readyz')
+        assert (status, payload['status']) == (503, 'loading')
+        status, payload = await request(port, 'POST', '/v1/fake/predict', png(200))
+        assert status == 503
+
+        await server._load_in_background()
+        status, payload = await request(port, 'GET', '/readyz')
+        assert (status, payload) == (200, {'status': 'ready', 'models': ['fake']})
+    serve(scenario)
+
+
+def test_predict_raw_and_multipart(serve):
+    async def scenario(server, port):
+        await server._load_in_background()
+        status, payload = await request(port, 'POST', '/v1/fake/predict', png(220))
+        assert (status, payload['class_name']) == (200, 'bright')
+
+        body, content_type = multipart(png(10), png(240), png(30))
+        status, payload = await request(port, 'POST', '/v1/fake/predict', body, content_type)
+        assert status == 200
+        assert [result['class_name'] for result in payload] == ['dark', 'bright', 'dark']
+    serve(scenario)
+
+
+def test_client_errors(serve, monkeypatch):
+    async def scenario(server, port):
+        await server._load_in_background()
+        assert (await request(port, 'POST', '/v1/fake/predict', b'not an image'))[0] == 400
+        assert (await request(port, 'POST', '/v1/fake/predict'))[0] == 400
+        body, content_type = multipart()
+        assert (await request(port, 'POST', '/v1/fake/predict', body, content_type))[0] == 400
+        assert (await request(port, 'POST', '/v1/other/predict', png(10)))[0] == 404
+        assert (await request(port, 'GET', '/nowhere'))[0] == 404
+        assert (await request(port, 'GET', '/v1/fake/predict'))[0] == 405
+        status, payload = await request(port, 'POST', '/v1/fake/predict', b'x' * 5000)
+        assert status == 413
+
+        # Above PIL's decompression bomb limit: a client error, not a 500
+        monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+        status, payload = await request(port, 'POST', '/v1/fake/predict', png(10, size=(60, 60)))
+        assert status == 400
+        assert 'too large' in payload['error']
+    serve(scenario)
+
+
+def test_metrics_record_requests(serve):
+    async def scenario(server, port):
+        await server._load_in_background()
+        await request(port, 'POST', '/v1/fake/predict', png(200))
+        await request(port, 'POST', '/v1/fake/predict', b'garbage')
+        status, text = await request(port, 'GET', '/metrics')
+        assert status == 200
+        text = text.decode()
+        assert 'curevia_request_seconds_count{model="fake",status="200"}' in text
+        assert 'curevia_request_seconds_count{model="fake",status="400"}' in text
+    serve(scenario)
+
+
+def test_keep_alive_serves_several_requests(serve):
+    async def scenario(server, port):
+        await server._load_in_background()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for value in (20, 230):
+            body = png(value)
+            writer.write((
+                'POST /v1/fake/predict HTTP/1.1\r\nHost: test\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n'
+            ).encode() + body)
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(next(
+                line.split(b':')[1] for line in head.split(b'\r\n') if line.lower().startswith(b'content-length')
+            ))
+            payload = json.loads(await reader.readexactly(length))
+            assert payload['class_name'] == ('dark' if value < 128 else 'bright')
+        writer.close()
+    serve(scenario)
+
+
+def test_load_failure_is_reported(tmp_path):
+    registry = ModelRegistry([ModelSpec('fake', BrightnessPredictor, str(tmp_path / 'missing.keras'))])
+    server = InferenceServer(registry)
+
+    async def scenario():
+        await server._load_in_background()
+        listener = await asyncio.start_server(server._handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            status, payload = await request(port, 'GET', '/healthz')
+            assert (status, payload['status']) == (503, 'failed')
+            assert (await request(port, 'GET', '/readyz'))[0] == 503
+    asyncio.run(scenario())
+
+
+def test_parse_images_keeps_part_order():
+    body, content_type = multipart(b'first', b'second')
+    images, batched = InferenceServer._parse_images(None, {'content-type': content_type}, body)
+    assert (images, batched) == ([b'first', b'second'], True)
+    assert InferenceServer._parse_images(None, {}, b'raw') == ([b'raw'], False)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.datasets import Manifest
+from utils.shards import ShardedDataset, pack
+
+CLASS_NAMES = ['cat', 'dog']
+
+
+@pytest.fixture
+def two_class_dir(tmp_path):
+    root = tmp_path / 'images'
+    for label, name in enumerate(CLASS_NAMES):
+        (root / name).mkdir(parents=True)
+        for i in range(32):
+            Image.new('RGB', (20, 20), (label * 255, i, 0)).save(root / name / f'{i:02d}.png')
+    return root
+
+
+def test_pack_mixes_classes_across_shards(two_class_dir, tmp_path):
+    manifest = Manifest.from_directory(str(two_class_dir), CLASS_NAMES)
+    dataset = pack(manifest, str(tmp_path / 'shards'), 8, shard_size=16)
+    labels = np.asarray(dataset.labels)
+    for shard_index in range(len(dataset.shards)):
+        base = int(dataset.offsets[shard_index])
+        assert len(set(labels[base:base + len(dataset.shards[shard_index])])) == 2
+    # Pixels still line up with their labels
+    first = np.asarray(dataset.shards[0][:4])
+    assert list(first[:, 0, 0, 0] // 255) == list(labels[:4])
+
+
+def test_pack_without_seed_keeps_manifest_order(two_class_dir, tmp_path):
+    manifest = Manifest.from_directory(str(two_class_dir), CLASS_NAMES)
+    dataset = pack(manifest, str(tmp_path / 'shards'), 8, shard_size=16, seed=None)
+    assert list(np.asarray(dataset.labels)) == manifest.labels
+
+
+def test_first_shuffled_batch_mixes_labels(two_class_dir, tmp_path):
+    pytest.importorskip('tensorflow')
+    manifest = Manifest.from_directory(str(two_class_dir), CLASS_NAMES)
+    pack(manifest, str(tmp_path / 'shards'), 8, shard_size=16)
+    dataset = ShardedDataset(str(tmp_path / 'shards')).as_tf_dataset(batch_size=8, shuffle=True, seed=3)
+    _, labels = next(iter(dataset))
+    assert set(labels.numpy()) == {0, 1}
@@ -0,0 +1,112 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+tf = pytest.importorskip('tensorflow')
+
+from utils.brain_predictor import BrainTumorPredictor
+from utils.tflite_export import convert, main, representative_dataset
+
+# One solid colour per brain class: glioma red, meningioma green, notumor dark, pituitary blue
+COLOURS = {
+    'glioma': [(230, 20, 20), (180, 40, 30)],
+    'meningioma': [(20, 230, 20), (40, 170, 60)],
+    'notumor': [(10, 10, 10), (30, 25, 35)],
+    'pituitary': [(20, 20, 230), (50, 30, 190)],
+}
+
+
+def save_colour_model(path):
+    """A brain-shaped classifier that picks the class from the mean colour, with wide margins."""
+    size = BrainTumorPredictor.image_size
+    dense = tf.keras.layers.Dense(4, activation='softmax')
+    model = tf.keras.Sequential([
+        tf.keras.Input((size, size, 3)),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        dense,
+    ])
+    dense.set_weights([
+        np.array([[10, -5, 0, -5], [-5, 10, 0, -5], [-5, -5, 0, 10]], dtype=np.float32),
+        np.array([-2, -2, 0, -2], dtype=np.float32),
+    ])
+    model.save(path)
+
+
+@pytest.fixture
+def keras_path(tmp_path):
+    path = str(tmp_path / 'colour.keras')
+    save_colour_model(path)
+    return path
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    root = tmp_path / 'images'
+    for name, colours in COLOURS.items():
+        (root / name).mkdir(parents=True)
+        for index, colour in enumerate(colours):
+            Image.new('RGB', (150, 140), colour).save(root / name / f'{index}.png')
+    return root
+
+
+def images(image_dir):
+    return sorted(str(path) for path in image_dir.rglob('*.png'))
+
+
+def probabilities(predictor, paths):
+    return np.array([result['all_predictions'] for result in predictor.predict_batch(paths)])
+
+
+@pytest.mark.parametrize('quantization', ['float', 'dynamic'])
+def test_export_round_trips_through_the_tflite_backend(keras_path, image_dir, tmp_path, quantization):
+    keras_predictor = BrainTumorPredictor(keras_path)
+    path = tmp_path / f'colour_{quantization}.tflite'
+    path.write_bytes(convert(keras_predictor, quantization))
+
+    tflite_predictor = BrainTumorPredictor(str(path), backend='tflite', num_threads=1)
+    paths = images(image_dir)
+    expected = probabilities(keras_predictor, paths)
+    actual = probabilities(tflite_predictor, paths)
+    assert list(actual.argmax(axis=1)) == list(expected.argmax(axis=1))
+    assert [BrainTumorPredictor.class_names[i] for i in expected.argmax(axis=1)] == \
+        [name for name in sorted(COLOURS) for _ in COLOURS[name]]
+    np.testing.assert_allclose(actual, expected, atol=1e-4)
+
+
+def test_int8_export_is_calibrated_and_agrees(keras_path, image_dir, tmp_path):
+    keras_predictor = BrainTumorPredictor(keras_path)
+    with pytest.raises(ValueError):
+        convert(keras_predictor, 'int8')
+    with pytest.raises(ValueError):
+        convert(keras_predictor, 'fp16')
+
+    calibration = representative_dataset(keras_predictor, str(image_dir), num_samples=6)
+    batches = list(calibration())
+    assert len(batches) == 6
+    assert batches[0][0].shape == (1, 128, 128, 3)
+
+    path = tmp_path / 'colour_int8.tflite'
+    path.write_bytes(convert(keras_predictor, 'int8', calibration))
+    interpreter = tf.lite.Interpreter(model_path=str(path))
+    assert np.int8 in {detail['dtype'] for detail in interpreter.get_tensor_details()}
+
+    tflite_predictor = BrainTumorPredictor(str(path), backend='tflite', num_threads=1)
+    paths = images(image_dir)
+    assert list(probabilities(tflite_predictor, paths).argmax(axis=1)) == \
+        list(probabilities(keras_predictor, paths).argmax(axis=1))
+
+
+def test_cli_reports_accuracy_of_every_artifact(keras_path, image_dir, tmp_path):
+    report_path = tmp_path / 'report.json'
+    main(['brain', keras_path, '--calibration-dir', str(image_dir), '--eval-dir', str(image_dir),
+          '--out-dir', str(tmp_path / 'out'), '--num-calibration', '4', '--batch-size', '3',
+          '--report', str(report_path)])
+    report = json.loads(report_path.read_text())
+    assert report['num_images'] == 8
+    assert report['float']['accuracy'] == 1.0
+    for quantization in ('dynamic', 'int8'):
+        artifact = report['artifacts'][quantization]
+        assert artifact['path'].endswith(f'colour_{quantization}.tflite')
+        assert (artifact['accuracy'], artifact['agreement_with_float']) == (1.0, 1.0)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.datasets import Manifest
+from utils.preprocessing import decode_resized
+
+tf = pytest.importorskip('tensorflow')
+
+from utils.training import make_dataset  # noqa: E402
+
+CLASS_NAMES = ['cat', 'dog']
+
+
+@pytest.fixture
+def two_class_dir(tmp_path):
+    root = tmp_path / 'images'
+    rng = np.random.default_rng(0)
+    for label, name in enumerate(CLASS_NAMES):
+        (root / name).mkdir(parents=True)
+        for i in range(40):
+            pixels = rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(root / name / f'{i:02d}.jpg', quality=90)
+    # Formats tf.io.decode_image can't read, and a 16-bit scan
+    Image.fromarray(rng.integers(0, 256, (50, 60, 3), dtype=np.uint8)).save(root / 'cat' / 'scan.tif')
+    Image.fromarray(rng.integers(0, 40000, (50, 60), dtype=np.uint16)).save(root / 'dog' / 'wide.png')
+    return root
+
+
+def test_first_batch_mixes_classes(two_class_dir):
+    manifest = Manifest.from_directory(str(two_class_dir), CLASS_NAMES)
+    dataset = make_dataset(manifest, 32, batch_size=8, shuffle=True, shuffle_buffer=4, seed=1)
+    _, labels = next(iter(dataset))
+    assert set(labels.numpy()) == {0, 1}
+
+
+def test_training_decode_matches_inference(two_class_dir):
+    manifest = Manifest.from_directory(str(two_class_dir), CLASS_NAMES)
+    dataset = make_dataset(manifest, 32, batch_size=16, cache=None)
+    images = np.concatenate([batch.numpy() for batch, _ in dataset])
+    expected = np.stack([decode_resized(path, 32) for path in manifest.paths]).astype(np.float32)
+    assert any(path.endswith('.tif') for path in manifest.paths)
+    assert np.array_equal(images, expected)
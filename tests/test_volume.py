@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.preprocessing import preprocess_image
+from utils.volume import load_volume, slice_names
+
+SIZE = 32
+
+
+def gradient_volume(slices=3, height=40, width=48):
+    z, y, x = np.meshgrid(
+        np.arange(slices), np.linspace(0, 1, height), np.linspace(0, 1, width), indexing='ij'
+    )
+    return np.stack([x, y, (x + y + z) / (2 + slices)], axis=-1)
+
+
+def save(tmp_path, volume):
+    path = str(tmp_path / 'volume.npy')
+    np.save(path, volume)
+    return path
+
+
+def test_uint8_rgb_volume_matches_single_slices(tmp_path):
+    volume = (gradient_volume() * 255).astype(np.uint8)
+    names, loaded = load_volume(save(tmp_path, volume), SIZE, 255.0)
+    assert len(names) == 3
+    for index in range(3):
+        assert np.array_equal(loaded[index], preprocess_image(volume[index], SIZE, 255.0))
+
+
+@pytest.mark.parametrize('dtype, scale', [(np.int16, 4000), (np.uint16, 60000), (np.float32, 3.5)])
+def test_wide_rgb_volume_is_rescaled_per_slice(tmp_path, dtype, scale):
+    base = gradient_volume()
+    volume = (base * scale).astype(dtype)
+    _, loaded = load_volume(save(tmp_path, volume), SIZE)
+    assert loaded.shape == (3, SIZE, SIZE, 3)
+    assert loaded.max() <= 255.0 and loaded.min() >= 0.0
+    for index in range(3):
+        # Each slice is stretched to its own peak, like 8-bit data
+        peak = float(volume[index].max())
+        expected = np.rint(volume[index].astype(np.float32) * np.float32(255.0 / peak))
+        expected = preprocess_image(np.clip(expected, 0, 255).astype(np.uint8), SIZE)
+        assert np.array_equal(loaded[index], expected)
+        assert loaded[index].max() > 200
+
+
+@pytest.mark.parametrize('shape', [(2, 40, 48), (2, 40, 48, 1)])
+def test_wide_grayscale_volume(tmp_path, shape):
+    volume = (np.random.default_rng(0).random(shape) * 1000).astype(np.float32)
+    _, loaded = load_volume(save(tmp_path, volume), SIZE)
+    slice_image = Image.fromarray(volume[0].reshape(shape[1:3]))
+    assert np.array_equal(loaded[0], preprocess_image(slice_image, SIZE))
+
+
+def test_multi_frame_tiff(tmp_path):
+    frames = [Image.new('RGB', (40, 40), (value, 0, 0)) for value in (10, 120, 240)]
+    path = str(tmp_path / 'series.tif')
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    assert slice_names(path) == [f'{path}#{index}' for index in range(3)]
+    _, loaded = load_volume(path, SIZE)
+    assert list(loaded[:, 0, 0, 0]) == [10, 120, 240]
@@ -0,0 +1,104 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from utils.worker_pool import WorkerPool
+
+
+class EchoPredictor:
+    """Echoes its inputs; 'sleep' blocks. Fails to load while ``<model>.broken`` exists."""
+
+    name = 'echo'
+    class_names = ['echo']
+    image_size = 1
+    input_divisor = 1.0
+
+    def __init__(self, model_path, warm_up_batch_size=1):
+        if os.path.exists(f'{model_path}.broken'):
+            raise RuntimeError('model file is broken')
+        self.pid = os.getpid()
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images, batch_size=32):
+        if 'sleep' in images:
+            time.sleep(60)
+        return [{'image': image, 'pid': self.pid} for image in images]
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / 'echo.model'
+    path.write_bytes(b'weights')
+    return str(path)
+
+
+def make_pool(model_path, workers=2):
+    return WorkerPool(EchoPredictor, model_path, workers=workers, dispatch='round_robin',
+                      start_method='spawn', start_timeout=120)
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_worker_killed_mid_request_under_load(model_path):
+    pool = make_pool(model_path)
+    try:
+        victim = pool.stats()[0]['pid']
+        stuck = pool._workers[0]
+        future = pool.submit('predict_batch', ['sleep'])
+        assert stuck.pending
+
+        # Keep results flowing so the pool never goes idle
+        stop = threading.Event()
+
+        def steady_load():
+            while not stop.is_set():
+                try:
+                    pool.submit('predict_batch', ['ping']).result(timeout=10)
+                except RuntimeError:
+                    pass
+
+        load = threading.Thread(target=steady_load)
+        load.start()
+        try:
+            time.sleep(0.5)
+            os.kill(victim, signal.SIGKILL)
+            with pytest.raises(RuntimeError, match='died'):
+                future.result(timeout=10)
+        finally:
+            stop.set()
+            load.join()
+
+        assert wait_for(lambda: all(worker['ready'] for worker in pool.stats()))
+        assert pool.stats()[0]['pid'] != victim
+        results = pool.predict_batch(['a', 'b', 'c', 'd'], batch_size=1)
+        assert [result['image'] for result in results] == ['a', 'b', 'c', 'd']
+        assert victim not in {result['pid'] for result in results}
+    finally:
+        pool.close()
+
+
+def test_failed_replacement_gets_no_calls(model_path):
+    pool = make_pool(model_path)
+    try:
+        victim, survivor = (worker['pid'] for worker in pool.stats())
+        open(f'{model_path}.broken', 'w').close()
+        os.kill(victim, signal.SIGKILL)
+        # The replacement is spawned, fails to load and is left out
+        assert wait_for(lambda: pool._workers[0].process.pid != victim and pool._workers[0].exited)
+        assert not pool.stats()[0]['ready']
+        results = [pool.predict('x') for _ in range(6)]
+        assert {result['pid'] for result in results} == {survivor}
+    finally:
+        pool.close()
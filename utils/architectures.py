@@ -0,0 +1,89 @@
+"""
+Model architectures from the training notebooks.
+
+``build_brain_model`` is the VGG16 transfer model from
+``models/brain_tumor/brain_tumor.ipynb`` and ``build_eye_model`` the
+conv stack from ``models/eye_disease/eyecnn.ipynb``, both compiled the way
+the notebooks compile them (with sparse integer labels).
+"""
+from .brain_predictor import BrainTumorPredictor
+from .eye_predictor import EyeDiseasePredictor
+from .lazy import LazyModule
+
+tf = LazyModule('tensorflow')
+
+
+def build_brain_model(weights='imagenet', num_classes=len(BrainTumorPredictor.class_names),
+                      image_size=BrainTumorPredictor.image_size):
+    """
+    VGG16 base (last 4 layers trainable) + Flatten -> Dense(128) head.
+
+    Args:
+        weights: VGG16 weights, 'imagenet' for training or None for an
+            untrained architecture-equivalent model
+        num_classes: Size of the softmax output
+        image_size: Square input side length
+    """
+    layers = tf.keras.layers
+    base_model = tf.keras.applications.VGG16(
+        input_shape=(image_size, image_size, 3), include_top=False, weights=weights
+    )
+    # Freeze all layers first, then unfreeze the last block for fine-tuning
+    for layer in base_model.layers:
+        layer.trainable = False
+    for layer in base_model.layers[-4:]:
+        layer.trainable = True
+
+    model = tf.keras.Sequential([
+        layers.Input(shape=(image_size, image_size, 3)),
+        base_model,
+        layers.Flatten(),
+        layers.Dropout(0.3),
+        layers.Dense(128, activation='relu'),
+        layers.Dropout(0.2),
+        layers.Dense(num_classes, activation='softmax'),
+    ])
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=0.0001),
+        loss='sparse_categorical_crossentropy',
+        metrics=['sparse_categorical_accuracy'],
+    )
+    return model
+
+
+def build_eye_model(num_classes=len(EyeDiseasePredictor.class_names),
+                    image_size=EyeDiseasePredictor.image_size):
+    """
+    64/128/256-filter conv stack + Dense(256) -> Dense(64) head.
+
+    Args:
+        num_classes: Size of the softmax output
+        image_size: Square input side length
+    """
+    layers = tf.keras.layers
+
+    def conv(filters):
+        return layers.Conv2D(filters, (3, 3), padding='same', activation='relu')
+
+    model = tf.keras.Sequential([
+        layers.Input(shape=(image_size, image_size, 3)),
+        conv(64), conv(64),
+        layers.MaxPooling2D((2, 2)),
+        conv(128), conv(128), conv(128),
+        layers.MaxPooling2D((2, 2)),
+        conv(256), conv(256), conv(256), conv(256),
+        layers.MaxPooling2D((2, 2)),
+        layers.Flatten(),
+        layers.Dense(256, activation='relu'),
+        layers.Dense(64, activation='relu'),
+        layers.Dense(num_classes, activation='softmax'),
+    ])
+    model.compile(
+        optimizer=tf.keras.optimizers.Adamax(learning_rate=0.001),
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy'],
+    )
+    return model
+
+
+BUILDERS = {'brain': build_brain_model, 'eye': build_eye_model}
@@ -0,0 +1,363 @@
+import time
+
+import numpy as np
+
+from .gradcam import GradCAM
+from .lazy import LazyModule
+from .metrics import observe_stages, to_milliseconds
+from .mmap_backend import MappedModel
+from .prediction_cache import model_fingerprint
+from .preprocessing import (
+    adjust_brightness_contrast, allocate_batch, decode_resized, open_image, preprocess_batch,
+    preprocess_image, tta_factors,
+)
+from .tflite_backend import TFLiteModel
+
+tf = LazyModule('tensorflow')
+
+
+class BasePredictor:
+    """Shared loading and batched inference for the Curevia classifiers.
+
+    Subclasses set ``name``, ``class_names``, ``normal_class`` (the class
+    meaning "nothing found"), ``image_size`` and ``input_divisor`` (255.0
+    for models trained on [0, 1] inputs, 1.0 for raw pixel values);
+    preprocessing itself is shared, see ``utils.preprocessing``.
+    """
+
+    name = None
+    class_names = []
+    normal_class = None
+    image_size = None
+    input_divisor = 1.0
+
+    def __init__(self, model_path, backend='keras', num_threads=None, jit_compile=False,
+                 instrument=False, gate_path=None, gate_threshold=0.95, warm_up_batch_size=1):
+        """
+        Initialize the predictor with model path.
+
+        With the default Keras backend, inference goes through a
+        ``tf.function`` traced once here with a fixed
+        (None, image_size, image_size, 3) float32 signature, instead of
+        ``model.predict`` and its per-call data-adapter/callback setup. A
+        warm-up pass runs before the constructor returns.
+
+        Args:
+            model_path: Path to the saved ``.keras`` model, to a ``.tflite``
+                flatbuffer when ``backend='tflite'``, or to a ``.mmap`` file
+                when ``backend='mmap'``
+            backend: 'keras', 'tflite' or 'mmap' (weights memory-mapped and
+                shared by every process on the host; see ``utils.mmap_backend``)
+            num_threads: CPU threads for the TFLite interpreter
+            jit_compile: Compile the Keras serving function with XLA. XLA
+                compiles once per distinct batch size, so this pays off for
+                fixed-size batch workloads.
+            instrument: Time every stage (decode, resize, normalize, infer,
+                postprocess), add a ``timings`` dict in milliseconds to each
+                result and record the stages in ``utils.metrics``
+            gate_path: Triage gate from ``python -m utils.cascade distill``.
+                Images it scores as normal with at least ``gate_threshold``
+                skip the full model; see ``utils.cascade``
+            gate_threshold: Gate score needed to skip the full model
+            warm_up_batch_size: Size of the synthetic warm-up batch
+        """
+        self.model_path = model_path
+        # Taken before loading: a file replaced mid-load is seen as changed later
+        self.model_fingerprint = model_fingerprint(model_path)
+        self.backend = backend
+        self.instrument = instrument
+        self._gradcam = None
+        if backend == 'tflite':
+            self.model = TFLiteModel(model_path, num_threads=num_threads)
+            self._serve = self.model
+        elif backend == 'mmap':
+            self.model = MappedModel(model_path)
+            self._serve = self.model
+        elif backend == 'keras':
+            self.model = tf.keras.models.load_model(model_path)
+            self._serve = tf.function(
+                self._forward,
+                input_signature=[tf.TensorSpec(
+                    (None, self.image_size, self.image_size, 3), tf.float32
+                )],
+                jit_compile=jit_compile,
+            )
+        else:
+            raise ValueError(f"Unknown backend {backend!r}; expected 'keras', 'tflite' or 'mmap'")
+        self.gate = None
+        if gate_path is not None:
+            from .cascade import TriageGate
+
+            self.gate = TriageGate(gate_path, self.image_size, gate_threshold)
+        self.warm_up(batch_size=warm_up_batch_size)
+
+    @property
+    def cache_variant(self):
+        """Prediction cache variant, set when a triage gate can answer instead of the model."""
+        if self.gate is None:
+            return None
+        from .cascade import gate_variant
+
+        return gate_variant(self.gate.fingerprint, self.gate.threshold)
+
+    def _forward(self, batch):
+        return self.model(batch, training=False)
+
+    def load_image(self, image):
+        """Open an image given in any form accepted by ``preprocessing.open_image``."""
+        return open_image(image)
+
+    def preprocess(self, image, timings=None):
+        """
+        Decode, resize and normalize one image for the model.
+
+        Args:
+            image: Image in any form accepted by ``load_image``
+            timings: Optional dict that receives the seconds spent per stage
+
+        Returns:
+            np.ndarray: float32 array of shape (image_size, image_size, 3)
+        """
+        return preprocess_image(image, self.image_size, self.input_divisor, timings=timings)
+
+    def predict(self, image):
+        """
+        Predict the class of a single image.
+
+        Args:
+            image: Image in any form accepted by ``load_image``
+
+        Returns:
+            dict: Prediction results with class name, index, and confidence
+        """
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images, batch_size=32):
+        """
+        Predict the classes of many images with one forward pass per chunk.
+
+        Args:
+            images: Iterable of images in any form accepted by ``load_image``
+            batch_size: Maximum number of images per forward pass
+
+        Returns:
+            list: One result dict per image, in input order, shaped like ``predict``
+        """
+        return self._predict_chunks(images, batch_size, self.predict_preprocessed)
+
+    def _predict_chunks(self, images, batch_size, run):
+        images = list(images)
+        # One buffer reused by every chunk; each image is normalized straight into its row
+        buffer = allocate_batch(min(batch_size, len(images)), self.image_size)
+        results = []
+        for start in range(0, len(images), batch_size):
+            timings = [] if self.instrument else None
+            batch = preprocess_batch(
+                images[start:start + batch_size], self.image_size, self.input_divisor,
+                out=buffer, timings=timings,
+            )
+            batch_results = run(batch)
+            if timings is not None:
+                for result, image_timings in zip(batch_results, timings):
+                    self.add_timings(result, image_timings)
+            results.extend(batch_results)
+        return results
+
+    def predict_preprocessed(self, batch):
+        """
+        Run one forward pass over an already preprocessed batch.
+
+        Args:
+            batch: float32 array of shape (N, image_size, image_size, 3)
+
+        Returns:
+            list: One result dict per row of ``batch``. With a triage gate,
+                each result also has ``triage`` ('gate' or 'full') and
+                ``gate_score``
+        """
+        if self.gate is not None:
+            return self._predict_triaged(batch)
+        return self._predict_full(batch)
+
+    def predict_probabilities(self, batch):
+        """
+        Full-model class probabilities for an already preprocessed batch.
+
+        The triage gate is never consulted, and nothing is timed or
+        recorded; ``utils.cascade`` distills and calibrates gates against this.
+
+        Args:
+            batch: float32 array of shape (N, image_size, image_size, 3)
+
+        Returns:
+            np.ndarray: Array of shape (N, len(class_names))
+        """
+        return np.asarray(self._serve(batch))
+
+    def _predict_full(self, batch):
+        if not self.instrument:
+            predictions = self.predict_probabilities(batch)
+            return [self._format_result(probs) for probs in predictions]
+        start = time.perf_counter()
+        predictions = self.predict_probabilities(batch)
+        inferred = time.perf_counter()
+        results = [self._format_result(probs) for probs in predictions]
+        return self._add_batch_timings(results, start, inferred)
+
+    def _predict_triaged(self, batch):
+        start = time.perf_counter()
+        scores = self.gate.scores(batch)
+        gated = time.perf_counter()
+        escalate = np.flatnonzero(scores < self.gate.threshold)
+        results = [None] * len(batch)
+        if len(escalate):
+            # Only the uncertain or abnormal rows go through the full model, as one batch
+            rows = batch if len(escalate) == len(batch) else batch[escalate]
+            for index, result in zip(escalate, self._predict_full(rows)):
+                results[index] = result
+        normal = self.class_names.index(self.normal_class)
+        for index, score in enumerate(scores):
+            score = float(score)
+            if results[index] is None:
+                # The gate only scores normal vs. abnormal; the rest is spread over the other classes
+                rest = (1.0 - score) / (len(self.class_names) - 1)
+                results[index] = {
+                    'class_name': self.normal_class,
+                    'class_index': normal,
+                    'confidence': score,
+                    'all_predictions': [score if i == normal else rest
+                                        for i in range(len(self.class_names))],
+                    'triage': 'gate',
+                }
+            else:
+                results[index]['triage'] = 'full'
+            results[index]['gate_score'] = score
+        if self.instrument:
+            timings = {'gate': gated - start}
+            observe_stages(self.name, timings)
+            for result in results:
+                result['timings'] = {**to_milliseconds(timings), **result.get('timings', {})}
+        return results
+
+    def predict_gradcam(self, image):
+        """
+        Predict one image and explain it with a Grad-CAM map.
+
+        Returns:
+            dict: Like ``predict``, plus ``gradcam``: the predicted class's
+                activation map in [0, 1] as nested lists (rows), at the
+                resolution of the last conv block. See ``gradcam.overlay``.
+        """
+        return self.predict_gradcam_batch([image])[0]
+
+    def predict_gradcam_batch(self, images, batch_size=32):
+        """Batched ``predict_gradcam``: one taped forward pass per chunk."""
+        return self._predict_chunks(images, batch_size, self.predict_gradcam_preprocessed)
+
+    def predict_gradcam_preprocessed(self, batch):
+        """``predict_preprocessed`` that also returns a ``gradcam`` map per result."""
+        if self._gradcam is None:
+            if self.backend != 'keras':
+                raise ValueError('Grad-CAM needs the keras backend (gradients through the model)')
+            self._gradcam = GradCAM(self.model, self.image_size)
+        start = time.perf_counter()
+        predictions, cams = self._gradcam(batch)
+        inferred = time.perf_counter()
+        results = []
+        for probs, cam in zip(predictions, cams):
+            result = self._format_result(probs)
+            result['gradcam'] = np.round(cam, 4).tolist()
+            results.append(result)
+        if not self.instrument:
+            return results
+        return self._add_batch_timings(results, start, inferred)
+
+    def _add_batch_timings(self, results, start, inferred):
+        timings = {'infer': inferred - start, 'postprocess': time.perf_counter() - inferred}
+        observe_stages(self.name, timings)
+        for result in results:
+            result['timings'] = to_milliseconds(timings)
+        return results
+
+    def predict_tta(self, image, n=8, seed=0, lower=0.8, upper=1.2):
+        """
+        Predict with test-time augmentation in a single forward pass.
+
+        The image is decoded once and expanded into ``n`` seeded
+        brightness/contrast variants (the training augmentation; the first
+        variant is the unmodified image), which run as one batch. The same
+        image and seed always give the same result.
+
+        Args:
+            image: Image in any form accepted by ``load_image``
+            n: Number of augmented views
+            seed: Seed for the augmentation factors
+            lower: Smallest brightness/contrast factor
+            upper: Largest brightness/contrast factor
+
+        Returns:
+            dict: Like ``predict``, with ``all_predictions`` averaged over the
+                views, plus ``variance`` (per-class variance across views, an
+                uncertainty signal) and ``tta_views``
+        """
+        timings = {} if self.instrument else None
+        pixels = decode_resized(image, self.image_size, timings=timings)
+        if timings is not None:
+            start = time.perf_counter()
+        brightness, contrast = tta_factors(n, seed, lower, upper)
+        batch = adjust_brightness_contrast(pixels, brightness, contrast)
+        if self.input_divisor != 1.0:
+            np.divide(batch, np.float32(self.input_divisor), out=batch)
+        if timings is not None:
+            augmented = time.perf_counter()
+            timings['augment'] = augmented - start
+        probs = self.predict_probabilities(batch)
+        if timings is not None:
+            inferred = time.perf_counter()
+            timings['infer'] = inferred - augmented
+        result = self._format_result(probs.mean(axis=0))
+        result['variance'] = [float(v) for v in probs.var(axis=0)]
+        result['tta_views'] = n
+        if timings is not None:
+            timings['postprocess'] = time.perf_counter() - inferred
+            self.add_timings(result, timings)
+        return result
+
+    def predict_volume(self, source, batch_size=32, workers=None):
+        """
+        Classify every slice of a study (directory, multi-frame TIFF or ``.npy`` volume).
+
+        See ``utils.volume.predict_volume``.
+        """
+        from .volume import predict_volume
+
+        return predict_volume(self, source, batch_size=batch_size, workers=workers)
+
+    def add_timings(self, result, timings):
+        """
+        Record per-image stage timings and prepend them to ``result['timings']``.
+
+        Args:
+            result: Result dict from ``predict_preprocessed``
+            timings: {stage: seconds} measured outside the forward pass
+        """
+        observe_stages(self.name, timings)
+        result['timings'] = {**to_milliseconds(timings), **result.get('timings', {})}
+        return result
+
+    def warm_up(self, batch_size=1):
+        """Run a throwaway forward pass so the first real request doesn't pay for graph setup."""
+        batch = np.zeros(
+            (batch_size, self.image_size, self.image_size, 3), dtype=np.float32
+        )
+        # Straight to the serving function, so warm-up never shows up in the metrics
+        np.asarray(self._serve(batch))
+
+    def _format_result(self, probs):
+        predicted_index = int(np.argmax(probs))
+        return {
+            'class_name': self.class_names[predicted_index],
+            'class_index': predicted_index,
+            'confidence': float(probs[predicted_index]),
+            'all_predictions': [float(p) for p in probs]
+        }
@@ -0,0 +1,312 @@
+"""
+Inference benchmarks for the Curevia predictors.
+
+    python -m utils.benchmark --output bench.json
+    python -m utils.benchmark brain --backend tflite --baseline bench.json
+
+The trained weights aren't in the repository, so by default every model is
+benchmarked with an architecture-equivalent stand-in built from
+``utils.architectures`` (VGG16 at 128px with the notebook head for brain,
+the conv stack at 224px with 8 classes for eye), randomly initialized with
+a fixed seed. Pass ``--brain-model`` / ``--eye-model`` to benchmark real
+model files instead.
+
+Each model runs in a fresh process so that load time and peak RSS are
+cold numbers. Inputs are synthetic JPEG-encoded images, so latencies
+cover decode, resize, normalize and inference, like an upload in the
+pages. Results are written as JSON; with ``--baseline`` every metric is
+compared against a previous run and the exit status is 1 if any metric
+regressed by more than ``--tolerance``.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .model_registry import PREDICTORS
+from .preprocessing import preprocess_batch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Builder arguments that make a stand-in: no pretrained download for VGG16
+STAND_IN_OPTIONS = {'brain': {'weights': None}, 'eye': {}}
+# Source resolution of the synthetic inputs (MRI slices are RGB JPEGs, OCT scans grayscale)
+SAMPLE_SHAPES = {'brain': (512, 512, 3), 'eye': (496, 512)}
+# Metrics where a larger value is better; everything else is lower-is-better
+HIGHER_IS_BETTER = ('throughput', 'model_throughput')
+
+
+def build_stand_in(name, directory, backend='keras', seed=0):
+    """
+    Build and save a randomly initialized, architecture-equivalent model.
+
+    Args:
+        name: 'brain' or 'eye'
+        directory: Where to write the model file
+        backend: 'keras' writes a .keras file, 'tflite' a float .tflite
+            file, 'mmap' a memory-mapped model file
+        seed: Weight initialization seed
+
+    Returns:
+        str: Path of the saved model
+    """
+    import tensorflow as tf
+
+    from .architectures import BUILDERS
+    from .tflite_export import convert
+
+    os.makedirs(directory, exist_ok=True)
+    keras_path = os.path.join(directory, f'{name}_stand_in.keras')
+    if not os.path.exists(keras_path):
+        tf.keras.utils.set_random_seed(seed)
+        BUILDERS[name](**STAND_IN_OPTIONS[name]).save(keras_path)
+    if backend == 'keras':
+        return keras_path
+    if backend == 'mmap':
+        from .mmap_backend import export
+
+        mmap_path = os.path.join(directory, f'{name}_stand_in.mmap')
+        if not os.path.exists(mmap_path):
+            export(PREDICTORS[name](keras_path), mmap_path)
+        return mmap_path
+    tflite_path = os.path.join(directory, f'{name}_stand_in.tflite')
+    if not os.path.exists(tflite_path):
+        flatbuffer = convert(PREDICTORS[name](keras_path), 'float')
+        with open(tflite_path, 'wb') as f:
+            f.write(flatbuffer)
+    return tflite_path
+
+
+def sample_images(name, count, seed=0):
+    """Synthetic JPEG-encoded inputs at a realistic source resolution."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, SAMPLE_SHAPES[name], dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_model(name, model_path, backend='keras', num_threads=None, batch_sizes=(1, 8, 32),
+              iterations=100, min_seconds=2.0):
+    """
+    Benchmark one model in the current process.
+
+    Call this in a fresh process: ``import_s``, ``load_s`` and
+    ``peak_rss_mb`` are only meaningful when nothing else was loaded first.
+
+    Args:
+        name: 'brain' or 'eye'
+        model_path: Model file for the predictor
+        backend: Predictor backend
+        num_threads: TFLite interpreter threads
+        batch_sizes: Batch sizes for the throughput runs
+        iterations: Single-image predictions for the latency percentiles
+        min_seconds: Minimum duration of every throughput run
+
+    Returns:
+        dict: Timings in seconds (``*_s``), milliseconds (``*_ms``) and
+            images per second, keyed by metric
+    """
+    start = time.perf_counter()
+    import tensorflow as tf
+    import_s = time.perf_counter() - start
+
+    predictor_cls = PREDICTORS[name]
+    start = time.perf_counter()
+    predictor = predictor_cls(model_path, backend=backend, num_threads=num_threads)
+    load_s = time.perf_counter() - start
+
+    images = sample_images(name, max(batch_sizes + (8,)))
+    start = time.perf_counter()
+    predictor.predict(images[0])
+    first_call_ms = (time.perf_counter() - start) * 1000
+
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        predictor.predict(images[i % len(images)])
+        latencies[i] = (time.perf_counter() - start) * 1000
+
+    throughput, model_throughput = {}, {}
+    for batch_size in batch_sizes:
+        batch_images = images[:batch_size]
+        throughput[str(batch_size)] = _images_per_second(
+            lambda: predictor.predict_batch(batch_images, batch_size=batch_size),
+            batch_size, min_seconds,
+        )
+        batch = preprocess_batch(batch_images, predictor.image_size, predictor.input_divisor)
+        model_throughput[str(batch_size)] = _images_per_second(
+            lambda: predictor.predict_preprocessed(batch), batch_size, min_seconds,
+        )
+
+    return {
+        'model_path': model_path,
+        'backend': backend,
+        'tensorflow': tf.__version__,
+        'import_s': import_s,
+        'load_s': load_s,
+        'first_call_ms': first_call_ms,
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+        },
+        'throughput': throughput,
+        'model_throughput': model_throughput,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _images_per_second(call, batch_size, min_seconds):
+    call()
+    count, start = 0, time.perf_counter()
+    while True:
+        call()
+        count += batch_size
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return count / elapsed
+
+
+def flatten(results, prefix=''):
+    """Flatten nested metric dicts to {'brain.latency_ms.p95': value, ...}."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Compare two benchmark runs.
+
+    Args:
+        current: ``models`` section of the new run
+        baseline: ``models`` section of the saved run
+        tolerance: Allowed relative slowdown, e.g. 0.1 for 10%
+
+    Returns:
+        list: (metric, baseline value, current value, relative change) for
+            every metric that regressed by more than ``tolerance``
+    """
+    now, before = flatten(current), flatten(baseline)
+    regressions = []
+    for metric in sorted(now.keys() & before.keys()):
+        old, new = before[metric], now[metric]
+        if not old:
+            continue
+        change = (new - old) / old
+        higher_is_better = metric.split('.')[1] in HIGHER_IS_BETTER
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Curevia predictors')
+    parser.add_argument('models', nargs='*', metavar='{brain,eye}',
+                        help='Models to benchmark (default: all)')
+    parser.add_argument('--brain-model', help='Benchmark this model file instead of a stand-in')
+    parser.add_argument('--eye-model', help='Benchmark this model file instead of a stand-in')
+    parser.add_argument('--backend', choices=('keras', 'tflite', 'mmap'), default='keras')
+    parser.add_argument('--num-threads', type=int, default=None, help='TFLite interpreter threads')
+    parser.add_argument('--batch-sizes', default='1,8,32',
+                        help='Comma-separated batch sizes for the throughput runs')
+    parser.add_argument('--iterations', type=int, default=100,
+                        help='Single-image predictions for the latency percentiles')
+    parser.add_argument('--min-seconds', type=float, default=2.0,
+                        help='Minimum duration of each throughput run')
+    parser.add_argument('--stand-in-dir', help='Keep stand-in models here between runs '
+                                               '(default: a temporary directory)')
+    parser.add_argument('--output', '-o', help='Write the JSON results here (default: stdout)')
+    parser.add_argument('--baseline', help='Previous results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed relative regression per metric')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.models) - set(PREDICTORS)
+    if unknown:
+        parser.error(f'unknown models {sorted(unknown)}, choose from {sorted(PREDICTORS)}')
+    batch_sizes = tuple(int(size) for size in args.batch_sizes.split(','))
+    model_paths = {'brain': args.brain_model, 'eye': args.eye_model}
+    # spawn, so every model is measured in a process that hasn't loaded TensorFlow
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        stand_in_dir = args.stand_in_dir or tmp
+        results = {}
+        for name in args.models or sorted(PREDICTORS):
+            path = model_paths[name]
+            if path is None:
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    path = executor.submit(
+                        build_stand_in, name, stand_in_dir, args.backend
+                    ).result()
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                results[name] = executor.submit(
+                    run_model, name, path, args.backend, args.num_threads, batch_sizes,
+                    args.iterations, args.min_seconds,
+                ).result()
+            results[name]['stand_in'] = model_paths[name] is None
+            print(f'{name}: p50 {results[name]["latency_ms"]["p50"]:.1f} ms, '
+                  f'load {results[name]["load_s"]:.2f} s', file=sys.stderr)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {
+            'node': platform.node(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+        },
+        'models': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['models'], args.tolerance)
+        for metric, old, new, change in regressions:
+            print(f'REGRESSION {metric}: {old:.4g} -> {new:.4g} ({change:+.1%})', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%} against {args.baseline}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
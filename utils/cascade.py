@@ -0,0 +1,296 @@
+"""
+Two-stage triage cascade: a small gate model in front of the full classifier.
+
+Most MRI uploads are ``notumor`` and most OCT scans ``NORMAL``, yet every
+image pays for the full VGG16 / deep conv forward pass. The gate is a
+tiny conv net (about 25k parameters) that takes the same preprocessed batch as
+the full model, downsamples it internally, and scores P(normal). Images
+with a score of at least ``threshold`` are answered by the gate. The
+rest go through the full model as one smaller batch:
+
+    BrainTumorPredictor(path, gate_path='models/brain_tumor/gate.keras', gate_threshold=0.98)
+
+The gate is distilled from the full model, which labels the training
+images itself, so no extra annotation is needed. ``calibrate`` measures,
+on a labelled folder, how many images every threshold lets the gate
+answer, how many abnormal images it would miss and the resulting
+throughput gain. Pick the operating point from that report:
+
+    python -m utils.cascade distill brain --data-dir "Mri Images/Training" --output models/brain_tumor/gate.keras
+    python -m utils.cascade calibrate brain --gate models/brain_tumor/gate.keras --data-dir "Mri Images/Testing"
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .lazy import LazyModule
+from .model_registry import DEFAULT_MODEL_PATHS, PREDICTORS
+from .prediction_cache import model_fingerprint
+from .shards import ShardedDataset, open_labelled, pack
+
+tf = LazyModule('tensorflow')
+
+DEFAULT_THRESHOLDS = (0.5, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.999)
+
+
+def build_gate_model(image_size, input_divisor=1.0, gate_size=64):
+    """
+    Small binary "is this normal?" classifier.
+
+    Args:
+        image_size: Input side length, the full model's ``image_size``
+        input_divisor: The full model's ``input_divisor``; inputs are
+            rescaled to [0, 1] inside the model
+        gate_size: Side length the gate downsamples its input to
+    """
+    layers = tf.keras.layers
+
+    def conv(filters):
+        return layers.Conv2D(filters, (3, 3), strides=2, padding='same', activation='relu')
+
+    model = tf.keras.Sequential([
+        layers.Input(shape=(image_size, image_size, 3)),
+        layers.Rescaling(input_divisor / 255.0),
+        layers.Resizing(gate_size, gate_size, interpolation='area'),
+        conv(16), conv(32), conv(64),
+        layers.GlobalAveragePooling2D(),
+        layers.Dense(1, activation='sigmoid'),
+    ])
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+                  loss='binary_crossentropy')
+    return model
+
+
+def gate_variant(fingerprint, threshold):
+    """Prediction cache variant of a gated predictor: results depend on the gate and its threshold."""
+    return f'gate:{fingerprint}@{threshold}'
+
+
+class TriageGate:
+    """A loaded gate model that scores preprocessed batches for P(normal)."""
+
+    def __init__(self, model_path, image_size, threshold=0.95):
+        """
+        Args:
+            model_path: Saved ``.keras`` gate from ``distill``
+            image_size: Input side length, the full model's ``image_size``
+            threshold: Scores at or above this are answered as normal by the gate
+        """
+        self.model_path = model_path
+        self.fingerprint = model_fingerprint(model_path)
+        self.threshold = threshold
+        self.model = tf.keras.models.load_model(model_path)
+        self._serve = tf.function(
+            lambda batch: self.model(batch, training=False),
+            input_signature=[tf.TensorSpec((None, image_size, image_size, 3), tf.float32)],
+        )
+        self.scores(np.zeros((1, image_size, image_size, 3), dtype=np.float32))
+
+    def scores(self, batch):
+        """P(normal) for every row of a preprocessed batch, as a float32 array."""
+        return np.asarray(self._serve(batch))[:, 0]
+
+
+def distill(predictor, dataset, output, epochs=5, batch_size=32, gate_size=64, seed=0):
+    """
+    Train a gate on the full model's P(normal) for every image of ``dataset``.
+
+    Args:
+        predictor: Full predictor (without a gate) acting as the teacher
+        dataset: ShardedDataset at the predictor's input size; labels are not used
+        output: Where to save the gate ``.keras`` file
+        epochs: Passes over the dataset
+        batch_size: Images per training step
+        gate_size: See ``build_gate_model``
+        seed: Initialization and shuffling seed
+
+    Returns:
+        dict: Training summary (images, teacher normal rate, final loss)
+    """
+    normal = predictor.class_names.index(predictor.normal_class)
+    targets = np.empty(len(dataset), dtype=np.float32)
+    offset = 0
+    for batch, _ in dataset.iter_normalized(batch_size, predictor.input_divisor):
+        probs = predictor.predict_probabilities(batch)
+        targets[offset:offset + len(batch)] = probs[:, normal]
+        offset += len(batch)
+
+    tf.keras.utils.set_random_seed(seed)
+    gate = build_gate_model(predictor.image_size, predictor.input_divisor, gate_size)
+    rng = np.random.default_rng(seed)
+    divisor = np.float32(predictor.input_divisor)
+    for epoch in range(epochs):
+        losses = []
+        for shard_index in rng.permutation(len(dataset.shards)):
+            shard = dataset.shards[shard_index]
+            base = int(dataset.offsets[shard_index])
+            rows = rng.permutation(len(shard))
+            for start in range(0, len(rows), batch_size):
+                chunk = np.sort(rows[start:start + batch_size])
+                images = shard[chunk].astype(np.float32) / divisor
+                losses.append(float(gate.train_on_batch(images, targets[base + chunk])))
+        print(f'epoch {epoch + 1}/{epochs}: loss {np.mean(losses):.4f}', file=sys.stderr)
+    gate.save(output)
+    return {
+        'images': len(dataset),
+        'teacher_normal_rate': float((targets >= 0.5).mean()),
+        'loss': float(np.mean(losses)) if epochs else None,
+    }
+
+
+def calibrate(predictor, gate, source, thresholds=DEFAULT_THRESHOLDS, batch_size=32):
+    """
+    Measure the cascade on a labelled dataset for several gate thresholds.
+
+    Both stages run on every image once, so each threshold is evaluated
+    from the same scores.
+
+    Args:
+        predictor: Full predictor (without a gate)
+        gate: TriageGate for the same input size
+        source: Labelled Manifest or ShardedDataset
+        thresholds: Gate thresholds to report
+        batch_size: Images per forward pass
+
+    Returns:
+        dict: Per-image stage costs, full-model error rates and, per
+            threshold, ``gated`` (fraction answered by the gate),
+            ``miss_rate`` (abnormal images answered "normal" by the cascade,
+            the full model's own misses included), ``accuracy`` and
+            ``speedup`` (estimated from the per-image stage costs)
+    """
+    normal = predictor.class_names.index(predictor.normal_class)
+    scores, predicted, labels = [], [], []
+    gate_seconds = full_seconds = 0.0
+    for batch, batch_labels in _iter_labelled(predictor, source, batch_size):
+        start = time.perf_counter()
+        scores.append(gate.scores(batch))
+        gated = time.perf_counter()
+        predicted.append(predictor.predict_probabilities(batch).argmax(axis=1))
+        full_seconds += time.perf_counter() - gated
+        gate_seconds += gated - start
+        labels.append(np.asarray(batch_labels))
+    scores, predicted, labels = (np.concatenate(values) for values in (scores, predicted, labels))
+    count = len(labels)
+    abnormal = labels != normal
+    gate_cost, full_cost = gate_seconds / count, full_seconds / count
+
+    def miss_rate(called_normal):
+        return float((called_normal & abnormal).sum() / max(abnormal.sum(), 1))
+
+    rows = []
+    for threshold in thresholds:
+        gated = scores >= threshold
+        cascade = np.where(gated, normal, predicted)
+        fraction = float(gated.mean())
+        rows.append({
+            'threshold': threshold,
+            'gated': fraction,
+            'miss_rate': miss_rate(cascade == normal),
+            'gate_misses': int((gated & abnormal).sum()),
+            'accuracy': float((cascade == labels).mean()),
+            'speedup': full_cost / (gate_cost + (1.0 - fraction) * full_cost),
+        })
+    return {
+        'images': count,
+        'abnormal_images': int(abnormal.sum()),
+        'gate_ms_per_image': gate_cost * 1000,
+        'full_ms_per_image': full_cost * 1000,
+        'full_model': {
+            'miss_rate': miss_rate(predicted == normal),
+            'accuracy': float((predicted == labels).mean()),
+        },
+        'thresholds': rows,
+    }
+
+
+def recommend(report, max_miss_rate):
+    """The threshold that gates the most images within ``max_miss_rate``, or None."""
+    allowed = [row for row in report['thresholds'] if row['miss_rate'] <= max_miss_rate]
+    if not allowed:
+        return None
+    return max(allowed, key=lambda row: (row['gated'], row['threshold']))['threshold']
+
+
+def _iter_labelled(predictor, source, batch_size):
+    if isinstance(source, ShardedDataset):
+        yield from source.iter_normalized(batch_size, predictor.input_divisor)
+        return
+    from .preprocessing import allocate_batch, preprocess_batch
+
+    buffer = allocate_batch(batch_size, predictor.image_size)
+    for start in range(0, len(source), batch_size):
+        batch = preprocess_batch(
+            source.paths[start:start + batch_size], predictor.image_size,
+            predictor.input_divisor, out=buffer,
+        )
+        yield batch, source.labels[start:start + batch_size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Distill and calibrate triage gates')
+    commands = parser.add_subparsers(dest='command', required=True)
+    distill_parser = commands.add_parser('distill', help='Train a gate from the full model')
+    calibrate_parser = commands.add_parser('calibrate', help='Report gate thresholds on labelled data')
+    for command in (distill_parser, calibrate_parser):
+        command.add_argument('model', choices=sorted(PREDICTORS))
+        command.add_argument('--model-path', help='Full model file (default: the registry path)')
+        command.add_argument('--data-dir', required=True,
+                             help='One sub-directory per class, or a packed shard directory')
+        command.add_argument('--batch-size', type=int, default=32)
+    distill_parser.add_argument('--output', required=True, help='Where to save the gate .keras file')
+    distill_parser.add_argument('--epochs', type=int, default=5)
+    distill_parser.add_argument('--gate-size', type=int, default=64)
+    distill_parser.add_argument('--seed', type=int, default=0)
+    calibrate_parser.add_argument('--gate', required=True, help='Gate .keras file from distill')
+    calibrate_parser.add_argument('--thresholds', default=','.join(map(str, DEFAULT_THRESHOLDS)),
+                                  help='Comma-separated gate thresholds to evaluate')
+    calibrate_parser.add_argument('--max-miss-rate', type=float, default=0.01,
+                                  help='Recommend the threshold gating most images within this miss rate')
+    calibrate_parser.add_argument('--output', '-o', help='Write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    predictor_cls = PREDICTORS[args.model]
+    predictor = predictor_cls(args.model_path or DEFAULT_MODEL_PATHS[args.model])
+    try:
+        source = open_labelled(args.data_dir, predictor_cls)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    if args.command == 'distill':
+        with tempfile.TemporaryDirectory() as tmp:
+            if not isinstance(source, ShardedDataset):
+                # Decode once; every epoch then streams from the memory maps
+                source = pack(
+                    source, os.path.join(tmp, 'shards'), predictor_cls.image_size, seed=args.seed
+                )
+            summary = distill(
+                predictor, source, args.output, epochs=args.epochs,
+                batch_size=args.batch_size, gate_size=args.gate_size, seed=args.seed,
+            )
+        print(json.dumps(summary, indent=2))
+        return
+
+    gate = TriageGate(args.gate, predictor_cls.image_size)
+    thresholds = tuple(float(value) for value in args.thresholds.split(','))
+    report = calibrate(predictor, gate, source, thresholds, args.batch_size)
+    report['max_miss_rate'] = args.max_miss_rate
+    report['recommended_threshold'] = recommend(report, args.max_miss_rate)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    for row in report['thresholds']:
+        print(f'threshold {row["threshold"]:<6} gated {row["gated"]:6.1%}  '
+              f'miss rate {row["miss_rate"]:6.2%}  speedup {row["speedup"]:.2f}x', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Helpers for finding images on disk and listing labelled datasets.
+
+Labelled datasets use the same layout as the training notebooks: one
+sub-directory per class, named exactly like the predictor's class names
+(e.g. ``Testing/glioma/*.jpg`` or ``test/CNV/*.jpeg``).
+"""
+import json
+import os
+import random
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def is_image_file(path):
+    """Return True if ``path`` has one of the supported image extensions."""
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_image_files(root):
+    """
+    Yield every image file below ``root`` in a stable (sorted) order.
+
+    Args:
+        root: Directory to walk recursively
+
+    Yields:
+        str: Path of each image file
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if is_image_file(filename):
+                yield os.path.join(dirpath, filename)
+
+
+def labelled_images(root, class_names):
+    """
+    List the images of a labelled directory.
+
+    Args:
+        root: Directory containing one sub-directory per class
+        class_names: Class names of the model, in model output order
+
+    Returns:
+        list: (path, class_index) pairs, grouped by class
+
+    Raises:
+        ValueError: If ``root`` contains a class directory the model doesn't know
+    """
+    class_dirs = sorted(
+        name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))
+    )
+    unknown = [name for name in class_dirs if name not in class_names]
+    if unknown:
+        raise ValueError(
+            f'{root} has class directories {unknown} that are not in {list(class_names)}'
+        )
+    samples = []
+    for name in class_dirs:
+        class_index = list(class_names).index(name)
+        for path in iter_image_files(os.path.join(root, name)):
+            samples.append((path, class_index))
+    return samples
+
+
+class Manifest:
+    """
+    Image paths and integer labels of a labelled dataset, listed once.
+
+    The notebooks re-list the class directories for every batch
+    (``encode_label`` calls ``os.listdir(train_dir)``), and ``os.listdir`` order
+    isn't guaranteed to match the predictors' class order. A manifest is
+    built once, labels against an explicit class list, and can be saved
+    next to the data.
+    """
+
+    def __init__(self, paths, labels, class_names):
+        if len(paths) != len(labels):
+            raise ValueError('paths and labels must have the same length')
+        self.paths = list(paths)
+        self.labels = [int(label) for label in labels]
+        self.class_names = list(class_names)
+
+    @classmethod
+    def from_directory(cls, root, class_names):
+        """Build a manifest from a directory with one sub-directory per class."""
+        samples = labelled_images(root, class_names)
+        return cls([path for path, _ in samples], [label for _, label in samples], class_names)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['paths'], data['labels'], data['class_names'])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(
+                {'class_names': self.class_names, 'paths': self.paths, 'labels': self.labels}, f
+            )
+
+    def __len__(self):
+        return len(self.paths)
+
+    def class_counts(self):
+        """Number of images per class name."""
+        counts = dict.fromkeys(self.class_names, 0)
+        for label in self.labels:
+            counts[self.class_names[label]] += 1
+        return counts
+
+    def shuffled(self, seed=0):
+        """Return a copy with the samples in a seeded random order."""
+        order = list(range(len(self)))
+        random.Random(seed).shuffle(order)
+        return Manifest(
+            [self.paths[i] for i in order], [self.labels[i] for i in order], self.class_names
+        )
+
+    def split(self, fractions, seed=42):
+        """
+        Stratified split, like the eye notebook's ``train_test_split(..., stratify=...)``.
+
+        Args:
+            fractions: Fraction of every class per split, e.g. (0.8, 0.1, 0.1)
+            seed: Shuffle seed
+
+        Returns:
+            list: One shuffled Manifest per fraction
+        """
+        rng = random.Random(seed)
+        parts = [([], []) for _ in fractions]
+        for label in range(len(self.class_names)):
+            members = [path for path, l in zip(self.paths, self.labels) if l == label]
+            rng.shuffle(members)
+            start = 0
+            for i, fraction in enumerate(fractions):
+                end = len(members) if i == len(fractions) - 1 else start + round(fraction * len(members))
+                parts[i][0].extend(members[start:end])
+                parts[i][1].extend([label] * (end - start))
+                start = end
+        return [
+            Manifest(paths, labels, self.class_names).shuffled(seed + i)
+            for i, (paths, labels) in enumerate(parts)
+        ]
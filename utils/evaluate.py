@@ -0,0 +1,344 @@
+"""
+Streaming evaluation of a model on a held-out labelled folder.
+
+    python -m utils.evaluate brain "Mri Images/Testing" --output brain_eval.json
+    python -m utils.evaluate eye shards/eye_test --backend tflite \\
+        --model-path models/eye_disease/Trained_Model_int8.tflite --baseline eye_eval.json
+
+The folder holds one sub-directory per class, or is a packed shard
+directory (``utils.shards``). Images are decoded on a thread pool and run
+through ``predict_preprocessed`` in fixed-size batches. ``StreamingEvaluation``
+folds every batch into fixed-size accumulators, so memory stays flat however
+large the test set is:
+
+- a class x class confusion matrix (accuracy, per-class precision, recall, F1);
+- per class, histograms of the predicted probability's log-odds for the
+  images of that class and for all others, from which the one-vs-rest
+  ROC-AUC is computed (log-odds bins keep confident scores near 0 and 1
+  apart; only pairs that share a bin are counted as ties);
+- a log-spaced histogram of batch latencies (mean and p50/p95/p99).
+
+The JSON report also has throughput and, for models with a normal class,
+screening sensitivity and specificity (abnormal vs. normal). With
+``--baseline`` the run is compared with an earlier report and exits 1 if
+accuracy, macro ROC-AUC or sensitivity dropped by more than ``--tolerance``.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .model_registry import DEFAULT_MODEL_PATHS, PREDICTORS, gate_kwargs
+from .preprocessing import allocate_batch, normalize_into
+from .screen import Progress, decode_ordered
+from .shards import ShardedDataset, open_labelled
+
+# Log-odds range of the ROC histograms; float32 probabilities saturate around +-16
+LOGIT_RANGE = 16.0
+SCORE_BINS = 4096
+# Batch latency buckets, 10 us to 100 s in ~2% steps
+LATENCY_EDGES = np.geomspace(1e-5, 100.0, 800)
+# Report metrics checked against a baseline (all higher-is-better)
+GATED_METRICS = ('accuracy', 'macro.roc_auc', 'screening.sensitivity')
+
+
+def _ratio(numerator, denominator):
+    return float(numerator / denominator) if denominator else None
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return float(np.mean(values)) if values else None
+
+
+class StreamingEvaluation:
+    """Constant-memory accumulator of classification metrics and latency."""
+
+    def __init__(self, class_names, normal_class=None, score_bins=SCORE_BINS):
+        """
+        Args:
+            class_names: The model's class names, in output order
+            normal_class: Class meaning "nothing found"; enables the
+                screening (abnormal vs. normal) metrics
+            score_bins: Log-odds bins per class for ROC-AUC
+        """
+        self.class_names = list(class_names)
+        self.normal_class = normal_class
+        self.score_bins = score_bins
+        classes = len(self.class_names)
+        self.confusion = np.zeros((classes, classes), dtype=np.int64)
+        self.positive_scores = np.zeros((classes, score_bins), dtype=np.int64)
+        self.negative_scores = np.zeros((classes, score_bins), dtype=np.int64)
+        self.latency_counts = np.zeros(len(LATENCY_EDGES) + 1, dtype=np.int64)
+        self.batches = 0
+        self.images = 0
+        self.model_seconds = 0.0
+
+    def update(self, probabilities, labels):
+        """
+        Add one batch of predictions.
+
+        Args:
+            probabilities: float array of shape (batch, classes)
+            labels: True class indices, shape (batch,)
+        """
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.int64)
+        classes = len(self.class_names)
+        predicted = probabilities.argmax(axis=1)
+        self.confusion += np.bincount(
+            labels * classes + predicted, minlength=classes * classes
+        ).reshape(classes, classes)
+
+        clipped = np.clip(probabilities, 1e-12, 1.0 - 1e-12)
+        logits = np.log(clipped) - np.log1p(-clipped)
+        bins = ((logits + LOGIT_RANGE) * (self.score_bins / (2 * LOGIT_RANGE))).astype(np.int64)
+        np.clip(bins, 0, self.score_bins - 1, out=bins)
+        # One bincount per batch: row c of the flat index space is class c's histogram
+        flat = bins + np.arange(classes) * self.score_bins
+        positive = labels[:, None] == np.arange(classes)
+        size = classes * self.score_bins
+        self.positive_scores += np.bincount(flat[positive], minlength=size).reshape(classes, -1)
+        self.negative_scores += np.bincount(flat[~positive], minlength=size).reshape(classes, -1)
+        self.images += len(labels)
+
+    def observe_batch(self, seconds):
+        """Record the inference time of one batch."""
+        self.latency_counts[np.searchsorted(LATENCY_EDGES, seconds)] += 1
+        self.batches += 1
+        self.model_seconds += seconds
+
+    def roc_auc(self, class_index):
+        """One-vs-rest ROC-AUC of a class, or None without both positives and negatives."""
+        positive = self.positive_scores[class_index].astype(np.float64)
+        negative = self.negative_scores[class_index].astype(np.float64)
+        if not positive.sum() or not negative.sum():
+            return None
+        # P(positive scores higher than negative), ties within a bin count half
+        below = np.cumsum(negative) - negative
+        return float((positive * (below + 0.5 * negative)).sum() / (positive.sum() * negative.sum()))
+
+    def latency_quantile(self, q):
+        """Batch latency quantile in seconds (upper edge of its bucket), or None."""
+        if not self.batches:
+            return None
+        index = int(np.searchsorted(np.cumsum(self.latency_counts), q * self.batches))
+        return float(LATENCY_EDGES[min(index, len(LATENCY_EDGES) - 1)])
+
+    def report(self):
+        """Every metric as a JSON-serializable dict."""
+        confusion = self.confusion
+        correct = np.diag(confusion)
+        classes = {}
+        for index, name in enumerate(self.class_names):
+            # A class that is never predicted has precision 0; one absent from
+            # the data has no recall and stays out of the macro averages
+            precision = _ratio(correct[index], confusion[:, index].sum()) or 0.0
+            recall = _ratio(correct[index], confusion[index].sum())
+            f1 = None
+            if recall is not None:
+                f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            classes[name] = {
+                'support': int(confusion[index].sum()),
+                'precision': precision,
+                'recall': recall,
+                'f1': f1,
+                'roc_auc': self.roc_auc(index),
+            }
+        report = {
+            'images': int(self.images),
+            'accuracy': _ratio(correct.sum(), confusion.sum()),
+            'macro': {
+                metric: _mean([row[metric] for row in classes.values() if row['support']])
+                for metric in ('precision', 'recall', 'f1', 'roc_auc')
+            },
+            'classes': classes,
+            'confusion_matrix': {'labels': self.class_names, 'counts': confusion.tolist()},
+        }
+        if self.normal_class is not None:
+            normal = self.class_names.index(self.normal_class)
+            abnormal = np.ones(len(self.class_names), dtype=bool)
+            abnormal[normal] = False
+            missed = int(confusion[abnormal, normal].sum())
+            report['screening'] = {
+                'normal_class': self.normal_class,
+                'sensitivity': _ratio(confusion[abnormal].sum() - missed, confusion[abnormal].sum()),
+                'specificity': _ratio(confusion[normal, normal], confusion[normal].sum()),
+                'missed_abnormal': missed,
+            }
+        if self.batches:
+            report['latency'] = {
+                'batches': self.batches,
+                'batch_ms_mean': self.model_seconds / self.batches * 1000,
+                'batch_ms_p50': self.latency_quantile(0.50) * 1000,
+                'batch_ms_p95': self.latency_quantile(0.95) * 1000,
+                'batch_ms_p99': self.latency_quantile(0.99) * 1000,
+                'ms_per_image': self.model_seconds / max(self.images, 1) * 1000,
+            }
+        return report
+
+
+def _iter_batches(predictor, source, batch_size, workers, failures):
+    # (float32 batch, labels) in order; undecodable images are skipped and counted
+    if isinstance(source, ShardedDataset):
+        yield from source.iter_normalized(batch_size, predictor.input_divisor)
+        return
+    buffer = allocate_batch(batch_size, predictor.image_size)
+    labels = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        decoded = decode_ordered(
+            executor, source.paths, predictor.image_size, window=batch_size * 4
+        )
+        for (path, pixels, error), label in zip(decoded, source.labels):
+            if error is not None:
+                failures.append({'path': path, 'error': error})
+                continue
+            normalize_into(buffer[len(labels)], pixels, predictor.input_divisor)
+            labels.append(label)
+            if len(labels) == batch_size:
+                yield buffer, labels
+                labels = []
+        if labels:
+            yield buffer[:len(labels)], labels
+
+
+def evaluate(predictor, source, batch_size=32, workers=4, progress=None):
+    """
+    Run a predictor over a labelled dataset and report its metrics.
+
+    Args:
+        predictor: BrainTumorPredictor, EyeDiseasePredictor, ... (any backend,
+            with or without a triage gate)
+        source: Labelled Manifest or ShardedDataset (see ``shards.open_labelled``)
+        batch_size: Images per forward pass
+        workers: Decode threads for image folders
+        progress: Optional ``screen.Progress``
+
+    Returns:
+        dict: ``StreamingEvaluation.report()`` plus ``failed`` (images that
+            could not be decoded) and ``throughput`` (wall-clock and
+            model-only images per second)
+    """
+    evaluation = StreamingEvaluation(
+        predictor.class_names, getattr(predictor, 'normal_class', None)
+    )
+    failures = []
+    start = time.perf_counter()
+    for batch, labels in _iter_batches(predictor, source, batch_size, workers, failures):
+        batch_start = time.perf_counter()
+        results = predictor.predict_preprocessed(batch)
+        evaluation.observe_batch(time.perf_counter() - batch_start)
+        evaluation.update([result['all_predictions'] for result in results], labels)
+        if progress:
+            progress.update(len(labels))
+    seconds = time.perf_counter() - start
+    if progress:
+        progress.finish()
+
+    report = evaluation.report()
+    report['failed'] = len(failures)
+    if failures:
+        report['failures'] = failures[:20]
+    report['throughput'] = {
+        'seconds': seconds,
+        'images_per_second': evaluation.images / seconds if seconds else None,
+        'model_images_per_second': (
+            evaluation.images / evaluation.model_seconds if evaluation.model_seconds else None
+        ),
+    }
+    return report
+
+
+def _lookup(report, metric):
+    value = report
+    for key in metric.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(current, baseline, tolerance=0.01):
+    """
+    Quality metrics that dropped by more than ``tolerance`` (absolute).
+
+    Returns:
+        list: (metric, baseline value, current value) for every regression
+    """
+    regressions = []
+    for metric in GATED_METRICS:
+        old, new = _lookup(baseline, metric), _lookup(current, metric)
+        if old is not None and new is not None and old - new > tolerance:
+            regressions.append((metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate a model on a labelled test folder')
+    parser.add_argument('model', choices=sorted(PREDICTORS))
+    parser.add_argument('data_dir', help='One sub-directory per class, or a packed shard directory')
+    parser.add_argument('--model-path', help='Model file (default: the registry path)')
+    parser.add_argument('--backend', choices=('keras', 'tflite', 'mmap'), default='keras')
+    parser.add_argument('--num-threads', type=int, default=None,
+                        help='TFLite interpreter threads')
+    parser.add_argument('--gate', help='Evaluate through this triage gate (utils.cascade)')
+    parser.add_argument('--gate-threshold', type=float, default=0.95)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=4, help='Decode threads')
+    parser.add_argument('--output', '-o', help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='Earlier report to check for quality regressions')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help='Allowed absolute drop in accuracy, macro ROC-AUC and sensitivity')
+    parser.add_argument('--quiet', action='store_true', help='No progress output')
+    args = parser.parse_args(argv)
+
+    predictor_cls = PREDICTORS[args.model]
+    model_path = args.model_path or DEFAULT_MODEL_PATHS[args.model]
+    try:
+        source = open_labelled(args.data_dir, predictor_cls)
+    except ValueError as exc:
+        parser.error(str(exc))
+    predictor = predictor_cls(
+        model_path, backend=args.backend, num_threads=args.num_threads,
+        **gate_kwargs(args.gate, args.gate_threshold),
+    )
+    report = {
+        'model': args.model,
+        'model_path': model_path,
+        'backend': args.backend,
+        'gate': args.gate,
+        'data_dir': args.data_dir,
+        'batch_size': args.batch_size,
+    }
+    report.update(evaluate(
+        predictor, source, batch_size=args.batch_size, workers=args.workers,
+        progress=None if args.quiet else Progress(),
+    ))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    summary = [(label, _lookup(report, metric)) for label, metric in (
+        ('accuracy', 'accuracy'), ('macro ROC-AUC', 'macro.roc_auc'),
+        ('sensitivity', 'screening.sensitivity'), ('img/s', 'throughput.images_per_second'),
+    )]
+    print(', '.join(f'{label} {value:.4f}' for label, value in summary if value is not None)
+          or 'no images evaluated', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for metric, old, new in regressions:
+            print(f'REGRESSION {metric}: {old:.4f} -> {new:.4f}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Grad-CAM class-activation maps for the Keras-backed predictors.
+
+Both models are plain layer chains (the brain model nests the VGG16
+functional model inside a Sequential), so the chain is flattened into its
+leaf layers and split at the last convolutional feature map. One
+``tf.function`` then runs the whole forward pass, with the layers after
+that split point under a ``GradientTape``, and returns the class
+probabilities and the Grad-CAM map of the predicted class together. The
+prediction and its explanation cost one pass, not two.
+
+    probs, cams = GradCAM(predictor.model, predictor.image_size)(batch)
+    overlay(image, cams[0]).save('heatmap.png')
+"""
+import numpy as np
+from PIL import Image
+
+from .lazy import LazyModule
+
+tf = LazyModule('tensorflow')
+
+
+def flatten_layers(model):
+    """
+    List the leaf layers of a chain of (possibly nested) Keras models in call order.
+
+    Input layers are skipped.
+    """
+    layers = []
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            layers.extend(flatten_layers(layer))
+        elif not isinstance(layer, tf.keras.layers.InputLayer):
+            layers.append(layer)
+    return layers
+
+
+class GradCAM:
+    """Probabilities plus Grad-CAM maps of the predicted classes in one taped pass."""
+
+    def __init__(self, model, image_size, layer_name=None):
+        """
+        Args:
+            model: Keras model that is a chain of layers (nested models allowed)
+            image_size: Square model input side length
+            layer_name: Feature layer to explain (default: the last
+                convolution, i.e. the last layer with weights and a spatial output)
+
+        Raises:
+            ValueError: If the model isn't a simple chain, so the flattened
+                layers don't reproduce its output
+        """
+        self.layers = flatten_layers(model)
+        spatial = []
+        x = tf.zeros((1, image_size, image_size, 3))
+        for layer in self.layers:
+            x = layer(x, training=False)
+            spatial.append(len(x.shape) == 4 and bool(layer.weights))
+        if layer_name is None:
+            self.split = max(i for i, is_conv in enumerate(spatial) if is_conv)
+        else:
+            self.split = [layer.name for layer in self.layers].index(layer_name)
+        self.layer_name = self.layers[self.split].name
+
+        probe = tf.random.uniform((1, image_size, image_size, 3), 0.0, 1.0, seed=0)
+        if not np.allclose(model(probe, training=False), self._chain(probe), atol=1e-5):
+            raise ValueError('Grad-CAM needs a model that is a plain chain of layers')
+
+        self._compute = tf.function(
+            self._forward,
+            input_signature=[tf.TensorSpec((None, image_size, image_size, 3), tf.float32)],
+        )
+
+    def _chain(self, x):
+        for layer in self.layers:
+            x = layer(x, training=False)
+        return x
+
+    def _forward(self, batch):
+        features = batch
+        for layer in self.layers[:self.split + 1]:
+            features = layer(features, training=False)
+        with tf.GradientTape() as tape:
+            tape.watch(features)
+            x = features
+            head, last = self.layers[self.split + 1:-1], self.layers[-1]
+            for layer in head:
+                x = layer(x, training=False)
+            if isinstance(last, tf.keras.layers.Dense) and \
+                    last.activation is tf.keras.activations.softmax:
+                # Explain the pre-softmax score; softmax saturates the gradients
+                logits = tf.matmul(x, last.kernel) + last.bias
+                probs = tf.nn.softmax(logits)
+            else:
+                logits = probs = last(x, training=False)
+            predicted = tf.argmax(probs, axis=-1)
+            scores = tf.gather(logits, predicted, batch_dims=1)
+        grads = tape.gradient(scores, features)
+        weights = tf.reduce_mean(grads, axis=(1, 2), keepdims=True)
+        cams = tf.nn.relu(tf.reduce_sum(weights * features, axis=-1))
+        cams = cams / (tf.reduce_max(cams, axis=(1, 2), keepdims=True) + 1e-8)
+        return probs, cams
+
+    def __call__(self, batch):
+        """
+        Args:
+            batch: float32 array of shape (N, image_size, image_size, 3),
+                preprocessed for the model
+
+        Returns:
+            tuple: (probabilities (N, num_classes), maps (N, h, w) in [0, 1]
+                at the resolution of the explained layer)
+        """
+        probs, cams = self._compute(batch)
+        return np.asarray(probs), np.asarray(cams)
+
+
+def colorize(cam):
+    """Map values in [0, 1] to RGB uint8 with a jet-like colormap."""
+    cam = np.asarray(cam, dtype=np.float32)[..., None]
+    centers = np.array([0.75, 0.5, 0.25], dtype=np.float32)  # red, green, blue
+    rgb = np.clip(1.5 - np.abs(4.0 * (cam - centers)), 0.0, 1.0)
+    return (rgb * 255).astype(np.uint8)
+
+
+def overlay(image, cam, alpha=0.45):
+    """
+    Blend a Grad-CAM map over an image.
+
+    Args:
+        image: PIL image (any mode) the map was computed for
+        cam: 2-D map in [0, 1], any resolution (e.g. a result's ``gradcam``)
+        alpha: Heatmap opacity
+
+    Returns:
+        PIL.Image.Image: RGB image the size of ``image``
+    """
+    base = image.convert('RGB')
+    heat = Image.fromarray(np.asarray(cam, dtype=np.float32))
+    heat = np.clip(np.asarray(heat.resize(base.size, Image.Resampling.BICUBIC)), 0.0, 1.0)
+    return Image.blend(base, Image.fromarray(colorize(heat)), alpha)
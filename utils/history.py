@@ -0,0 +1,301 @@
+"""
+SQLite-backed history of every prediction, for audit and follow-up.
+
+Each row holds the image hash, model, predicted class, confidence, the full
+probability vector, stage timings, an optional source name (file name or
+client) and the time. The database runs in WAL mode, so the history page
+and other readers never block the writer. Inserts are queued and
+written in batches by one background thread, so the inference path
+never waits on disk:
+
+    store = HistoryStore('history/curevia.db')
+    store.record('brain', digest, result, source='scan_017.jpg')
+    store.query(model='brain', class_name='glioma', min_confidence=0.9, since=week_ago)
+    store.latest(digest)                  # previous result for this image
+
+``default_history()`` opens the database named by ``CUREVIA_HISTORY_DB``
+and returns None when it is unset, so nothing is persisted unless it's
+configured. ``RecordingPredictor`` wraps any predictor and records
+everything it returns.
+"""
+import atexit
+import contextlib
+import datetime
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from .prediction_cache import image_digest
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    model TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    source TEXT,
+    class_name TEXT NOT NULL,
+    class_index INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    all_predictions TEXT NOT NULL,
+    timings TEXT
+);
+CREATE INDEX IF NOT EXISTS predictions_digest ON predictions (digest, created);
+CREATE INDEX IF NOT EXISTS predictions_class ON predictions (model, class_name, created);
+CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created);
+"""
+_INSERT = (
+    'INSERT INTO predictions (created, model, digest, source, class_name, class_index, '
+    'confidence, all_predictions, timings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+_STOP = object()
+
+
+def _timestamp(value):
+    # Unix seconds from a number or a datetime
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class HistoryStore:
+    """Prediction history in one SQLite file, written in batches from a background thread."""
+
+    def __init__(self, path, batch_size=256, flush_interval=1.0, max_pending=10000):
+        """
+        Args:
+            path: SQLite database file (created with its directory if needed)
+            batch_size: Most rows written per transaction
+            flush_interval: Longest a recorded row waits before it is written, in seconds
+            max_pending: Queued rows beyond this are dropped (and counted in
+                ``dropped``) rather than blocking the caller
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._write_loop, name='curevia-history', daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # Durable at checkpoints; WAL keeps the file consistent either way
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, model, digest, result, source=None, created=None):
+        """
+        Queue one prediction for writing; never blocks.
+
+        Args:
+            model: Model name, e.g. 'brain'
+            digest: Image hash (``prediction_cache.image_digest``)
+            result: Result dict from a predictor
+            source: Optional file name or client description
+            created: Unix time or datetime (default: now)
+        """
+        if self._closed:
+            raise RuntimeError('HistoryStore is closed')
+        row = (
+            time.time() if created is None else _timestamp(created),
+            model, digest, source,
+            result['class_name'], result['class_index'], result['confidence'],
+            json.dumps(result['all_predictions']),
+            json.dumps(result['timings']) if 'timings' in result else None,
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning('History writer is behind; %d predictions dropped', self.dropped)
+
+    def record_many(self, model, digests, results, sources=None):
+        """``record`` for parallel lists of digests, results and (optionally) sources."""
+        sources = sources or [None] * len(results)
+        for digest, result, source in zip(digests, results, sources):
+            self.record(model, digest, result, source)
+
+    def flush(self):
+        """Block until every queued prediction has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Write what is queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            rows = [row for row in batch if row is not _STOP]
+            try:
+                if rows:
+                    with conn:
+                        conn.executemany(_INSERT, rows)
+            except sqlite3.Error:
+                logger.exception('Could not write %d predictions to %s', len(rows), self.path)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def query(self, model=None, class_name=None, min_confidence=None, max_confidence=None,
+              since=None, until=None, digest=None, source=None, limit=100, offset=0):
+        """
+        Recorded predictions matching every given filter, newest first.
+
+        Args:
+            model: Model name
+            class_name: Predicted class
+            min_confidence: Lowest confidence (inclusive)
+            max_confidence: Highest confidence (inclusive)
+            since: Earliest time, Unix seconds or datetime (inclusive)
+            until: Latest time, Unix seconds or datetime (exclusive)
+            digest: Image hash
+            source: Exact source name
+            limit: Most rows returned (None for all)
+            offset: Rows skipped, for paging
+
+        Returns:
+            list: Dicts with the stored columns; ``all_predictions`` and
+                ``timings`` decoded
+        """
+        where, params = self._filters(
+            model=model, class_name=class_name, min_confidence=min_confidence,
+            max_confidence=max_confidence, since=since, until=until, digest=digest, source=source,
+        )
+        sql = f'SELECT * FROM predictions{where} ORDER BY created DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [limit, offset]
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def latest(self, digest, model=None):
+        """The most recent prediction for an image hash, or None."""
+        rows = self.query(model=model, digest=digest, limit=1)
+        return rows[0] if rows else None
+
+    def class_counts(self, model=None, since=None, until=None):
+        """
+        Number of predictions per (model, class).
+
+        Returns:
+            dict: {model: {class_name: count}}
+        """
+        where, params = self._filters(model=model, since=since, until=until)
+        sql = f'SELECT model, class_name, COUNT(*) FROM predictions{where} GROUP BY model, class_name'
+        counts = {}
+        with contextlib.closing(self._connect()) as conn:
+            for row_model, class_name, count in conn.execute(sql, params):
+                counts.setdefault(row_model, {})[class_name] = count
+        return counts
+
+    def __len__(self):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+    @staticmethod
+    def _filters(model=None, class_name=None, min_confidence=None, max_confidence=None,
+                 since=None, until=None, digest=None, source=None):
+        clauses, params = [], []
+        for column, operator, value in (
+            ('model', '=', model),
+            ('class_name', '=', class_name),
+            ('digest', '=', digest),
+            ('source', '=', source),
+            ('confidence', '>=', min_confidence),
+            ('confidence', '<=', max_confidence),
+            ('created', '>=', None if since is None else _timestamp(since)),
+            ('created', '<', None if until is None else _timestamp(until)),
+        ):
+            if value is not None:
+                clauses.append(f'{column} {operator} ?')
+                params.append(value)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    @staticmethod
+    def _decode(row):
+        record = dict(row)
+        record['all_predictions'] = json.loads(record['all_predictions'])
+        if record['timings'] is not None:
+            record['timings'] = json.loads(record['timings'])
+        return record
+
+
+class RecordingPredictor:
+    """Record every result of a predictor (or scheduler, cache, pool) in a HistoryStore."""
+
+    def __init__(self, predictor, store, model=None):
+        """
+        Args:
+            predictor: Anything with ``predict_batch``
+            store: HistoryStore
+            model: Model name to record (default: the predictor's ``name``)
+        """
+        self.predictor = predictor
+        self.store = store
+        self.model = model or predictor.name
+
+    def __getattr__(self, name):
+        return getattr(self.predictor, name)
+
+    def predict(self, image):
+        """Predict one image and record the result."""
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images, **kwargs):
+        """Predict many images and record every result."""
+        images = list(images)
+        results = self.predictor.predict_batch(images, **kwargs)
+        self.store.record_many(self.model, [image_digest(image) for image in images], results)
+        return results
+
+
+_default_history = None
+_default_history_lock = threading.Lock()
+
+
+def default_history():
+    """
+    Return the process-wide HistoryStore, or None if history is off:
+
+        CUREVIA_HISTORY_DB   SQLite file to record predictions in
+    """
+    global _default_history
+    with _default_history_lock:
+        path = os.environ.get('CUREVIA_HISTORY_DB')
+        if _default_history is None and path:
+            _default_history = HistoryStore(path)
+            atexit.register(_default_history.close)
+        return _default_history
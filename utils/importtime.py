@@ -0,0 +1,117 @@
+"""
+Cold-start import report for the modules the Streamlit pages import.
+
+By default the modules are read off the ``utils`` imports of ``app.py`` and
+``pages/*.py``, so the report follows the pages as they change. Each module is imported in a fresh interpreter under ``python -X importtime``
+and the cumulative import time of every top-level import is summed. The
+report also says whether TensorFlow was pulled in, and shows the cost of
+``import tensorflow`` itself for comparison:
+
+    python -m utils.importtime
+
+Exits non-zero if any of the page modules imports TensorFlow eagerly.
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The Streamlit entry point and its pages, relative to the repository root
+PAGE_SCRIPTS = ('app.py', os.path.join('pages', '*.py'))
+BASELINE_MODULE = 'tensorflow'
+
+
+def page_modules(root=REPO_ROOT):
+    """
+    The ``utils`` modules that the Streamlit app and pages import at the top level.
+
+    Args:
+        root: Repository root holding ``app.py`` and ``pages/``
+
+    Returns:
+        list: Sorted dotted module names, e.g. ['utils.gradcam', ...]
+    """
+    modules = set()
+    for pattern in PAGE_SCRIPTS:
+        for path in glob.glob(os.path.join(root, pattern)):
+            with open(path, encoding='utf-8') as f:
+                tree = ast.parse(f.read(), filename=path)
+            for node in tree.body:
+                if isinstance(node, ast.ImportFrom) and node.module == 'utils':
+                    names = [f'utils.{alias.name}' for alias in node.names]
+                elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                    names = [node.module]
+                elif isinstance(node, ast.Import):
+                    names = [alias.name for alias in node.names]
+                else:
+                    continue
+                modules.update(name for name in names if name.startswith('utils.'))
+    return sorted(modules)
+
+
+def measure(module):
+    """
+    Import ``module`` in a fresh interpreter.
+
+    Args:
+        module: Dotted module name, importable from the current directory
+
+    Returns:
+        dict: total_ms (summed cumulative time of top-level imports),
+            tensorflow_loaded, and the five slowest top-level imports
+    """
+    code = f'import sys, {module}; print("tensorflow" in sys.modules)'
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, check=True,
+    )
+    top_level = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the package that triggered them
+        if not name.startswith('  '):
+            top_level.append((name.strip(), int(cumulative) / 1000))
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return {
+        'total_ms': round(sum(ms for _, ms in top_level), 1),
+        'tensorflow_loaded': proc.stdout.strip().splitlines()[-1] == 'True',
+        'slowest': [{'module': name, 'ms': round(ms, 1)} for name, ms in top_level[:5]],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report cold import time of the page modules')
+    parser.add_argument('modules', nargs='*',
+                        help='Modules to time (default: what app.py and pages/*.py import)')
+    parser.add_argument('--json', action='store_true', help='Print the raw JSON report')
+    parser.add_argument('--skip-baseline', action='store_true',
+                        help=f"Don't time 'import {BASELINE_MODULE}' for comparison")
+    args = parser.parse_args(argv)
+    args.modules = args.modules or page_modules()
+
+    report = {module: measure(module) for module in args.modules}
+    if not args.skip_baseline:
+        report[BASELINE_MODULE] = measure(BASELINE_MODULE)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, result in report.items():
+            tf_note = 'imports tensorflow' if result['tensorflow_loaded'] else 'no tensorflow'
+            print(f"{module:<28} {result['total_ms']:>9.1f} ms  ({tf_note})")
+
+    eager = [m for m in args.modules if report[m]['tensorflow_loaded']]
+    if eager:
+        print(f'TensorFlow is imported eagerly by: {", ".join(eager)}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+Deferred imports for heavy dependencies.
+
+Importing TensorFlow takes seconds and hundreds of MB of RSS, which the
+Home/About sections of the Streamlit pages never need. Modules in ``utils``
+therefore bind ``tf = LazyModule('tensorflow')`` instead of importing it, and
+the real import happens on the first attribute access, i.e. when a model is
+actually loaded.
+"""
+import importlib
+import sys
+
+
+class LazyModule:
+    """Module proxy that imports the named module on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded() else 'not loaded'
+        return f'<LazyModule {self._name!r} ({state})>'
+
+    def is_loaded(self):
+        """Return True once the underlying module has been imported (by anyone)."""
+        return self._module is not None or self._name in sys.modules
@@ -0,0 +1,187 @@
+"""
+In-process latency histograms with Prometheus text exposition.
+
+Instrumented predictors (``instrument=True``) time every hot-path stage and
+record it here; the numbers can be scraped or dumped without any extra
+dependency:
+
+    curevia_stage_seconds{model="brain",stage="decode"}   per image
+    curevia_stage_seconds{model="brain",stage="infer"}    per forward pass
+
+``default_metrics()`` is configured from the environment:
+
+    CUREVIA_METRICS_PORT      serve GET /metrics on this local port
+    CUREVIA_METRICS_FILE      rewrite this file in Prometheus text format...
+    CUREVIA_METRICS_INTERVAL  ...every N seconds (default 15)
+
+The HTTP server in ``utils.server`` exposes the same registry at ``/metrics``.
+"""
+import bisect
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond normalization up to multi-second cold inference
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label combination."""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record one observation for the series identified by ``labels``."""
+        key = tuple(str(labels[name]) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        """Prometheus text lines for every series."""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, key))
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {values[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class Metrics:
+    """Named collection of histograms that renders to Prometheus text format."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        """Return the histogram called ``name``, creating it on first use."""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, help_text, label_names, buckets)
+            return self._histograms[name]
+
+    def render(self):
+        """The whole registry in Prometheus text exposition format."""
+        with self._lock:
+            histograms = list(self._histograms.values())
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically replace ``path`` with the current metrics (e.g. for node_exporter's textfile collector)."""
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_file_dump(self, path, interval=15.0):
+        """Rewrite ``path`` every ``interval`` seconds from a daemon thread."""
+        def dump():
+            while not stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError:
+                    logger.exception('Could not write metrics to %s', path)
+
+        stop = threading.Event()
+        threading.Thread(target=dump, name='curevia-metrics-dump', daemon=True).start()
+        return stop
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve ``GET /metrics`` on a daemon thread; returns the HTTP server."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=self._server.serve_forever, name='curevia-metrics-http', daemon=True
+        ).start()
+        return self._server
+
+
+def observe_stages(model, timings, metrics=None):
+    """
+    Record stage durations in ``curevia_stage_seconds``.
+
+    Args:
+        model: Value of the ``model`` label, e.g. 'brain'
+        timings: {stage: seconds}
+        metrics: Metrics to record into (default: ``default_metrics()``)
+    """
+    histogram = (metrics or default_metrics()).histogram(
+        'curevia_stage_seconds', 'Time spent per inference stage', ('model', 'stage')
+    )
+    for stage, seconds in timings.items():
+        histogram.observe(seconds, model=model, stage=stage)
+
+
+def to_milliseconds(timings):
+    """Convert {stage: seconds} to the {stage: milliseconds} shape of a result's ``timings``."""
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def default_metrics():
+    """Return the process-wide Metrics, starting the exporters configured in the environment."""
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+            port = os.environ.get('CUREVIA_METRICS_PORT')
+            if port:
+                try:
+                    _default_metrics.serve(int(port))
+                except OSError:
+                    logger.exception('Could not serve metrics on port %s', port)
+            path = os.environ.get('CUREVIA_METRICS_FILE')
+            if path:
+                _default_metrics.start_file_dump(
+                    path, float(os.environ.get('CUREVIA_METRICS_INTERVAL', 15))
+                )
+        return _default_metrics
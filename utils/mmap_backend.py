@@ -0,0 +1,211 @@
+"""
+Memory-mapped model files whose weights are shared by every process on a host.
+
+``tf.keras.models.load_model`` gives each process a private copy of every
+weight, so N Streamlit or worker processes hold the VGG16 brain model and
+the eye conv stack N times. A ``.mmap`` file holds the model as a frozen
+inference graph plus one flat, aligned blob of weights:
+
+    python -m utils.mmap_backend brain models/brain_tumor/my_model.keras
+    BrainTumorPredictor("models/brain_tumor/my_model.mmap", backend="mmap")
+
+``MappedModel`` maps the file copy-on-write and hands the weights to the
+graph as zero-copy tensor views of the mapping, so they are read from the
+page cache and never copied: every process serving the same file shares
+the same physical pages, loading it takes milliseconds, and an extra
+process costs its activations, not another copy of the weights. Outputs
+match the Keras model exactly.
+
+Replace a model file with a new one (``export`` writes a temporary file
+and renames it) rather than rewriting it in place, so processes that
+still map the old file keep reading the old weights.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from .lazy import LazyModule
+
+tf = LazyModule('tensorflow')
+
+MAGIC = b'CVMMAP01'
+# Weights are page-aligned as a whole and 64-byte aligned each (Eigen's alignment)
+PAGE_SIZE = 4096
+TENSOR_ALIGNMENT = 64
+# Smaller constants (shapes, axes, ...) stay inside the graph
+MIN_MAPPED_BYTES = 1024
+
+
+def _align(offset, alignment):
+    return -(-offset // alignment) * alignment
+
+
+def _layout(header_bytes, graph_bytes):
+    # File layout: magic, header length, JSON header, GraphDef, then the
+    # page-aligned weights; returns (graph offset, weights offset)
+    graph_offset = len(MAGIC) + 8 + header_bytes
+    return graph_offset, _align(graph_offset + graph_bytes, PAGE_SIZE)
+
+
+def _read_header(buffer):
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError('Not a Curevia memory-mapped model file')
+    length = int.from_bytes(bytes(buffer[len(MAGIC):len(MAGIC) + 8]), 'little')
+    start = len(MAGIC) + 8
+    return length, json.loads(bytes(buffer[start:start + length]))
+
+
+def export(predictor, path):
+    """
+    Write a Keras-backed predictor's model as a memory-mapped model file.
+
+    Args:
+        predictor: Predictor created with the default 'keras' backend
+        path: Destination ``.mmap`` file; replaced atomically
+
+    Returns:
+        dict: Number of mapped tensors, weight bytes and file size
+    """
+    from tensorflow.python.framework.convert_to_constants import (
+        convert_variables_to_constants_v2,
+    )
+
+    serve = tf.function(lambda batch: predictor.model(batch, training=False))
+    concrete = serve.get_concrete_function(tf.TensorSpec(
+        (None, predictor.image_size, predictor.image_size, 3), tf.float32
+    ))
+    frozen = convert_variables_to_constants_v2(concrete)
+    graph_def = frozen.graph.as_graph_def()
+
+    # Every sizeable constant becomes a placeholder fed from the mapping
+    tensors, arrays, offset = [], [], 0
+    for node in graph_def.node:
+        if node.op != 'Const':
+            continue
+        value = tf.make_ndarray(node.attr['value'].tensor)
+        if value.nbytes < MIN_MAPPED_BYTES:
+            continue
+        dtype = node.attr['dtype'].type
+        node.op = 'Placeholder'
+        node.attr.clear()
+        node.attr['dtype'].type = dtype
+        node.attr['shape'].shape.CopyFrom(tf.TensorShape(value.shape).as_proto())
+        offset = _align(offset, TENSOR_ALIGNMENT)
+        tensors.append({
+            'name': f'{node.name}:0',
+            'dtype': value.dtype.str,
+            'shape': list(value.shape),
+            'offset': offset,
+        })
+        arrays.append(np.ascontiguousarray(value))
+        offset += value.nbytes
+
+    graph = graph_def.SerializeToString()
+    header = {
+        'input': frozen.inputs[0].name,
+        'output': frozen.outputs[0].name,
+        'image_size': predictor.image_size,
+        'graph_bytes': len(graph),
+        'tensors': tensors,
+    }
+    encoded = json.dumps(header).encode()
+    _, data_offset = _layout(len(encoded), len(graph))
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(8, 'little'))
+        f.write(encoded)
+        f.write(graph)
+        for spec, value in zip(tensors, arrays):
+            f.seek(data_offset + spec['offset'])
+            f.write(value.tobytes())
+    os.replace(temporary, path)
+    return {
+        'tensors': len(tensors),
+        'weight_bytes': sum(value.nbytes for value in arrays),
+        'file_bytes': os.path.getsize(path),
+    }
+
+
+class MappedModel:
+    """
+    Callable inference graph over a memory-mapped model file.
+
+    Calling it with a float32 batch returns the class probabilities, like
+    the Keras serving function.
+    """
+
+    def __init__(self, model_path):
+        """
+        Args:
+            model_path: Path to a ``.mmap`` file written by ``export``
+        """
+        self.model_path = model_path
+        # Copy-on-write: the file is never modified, and pages nobody
+        # writes to stay shared with the page cache
+        self._buffer = np.memmap(model_path, mode='c', dtype=np.uint8)
+        header_bytes, header = _read_header(self._buffer)
+        graph_offset, data_offset = _layout(header_bytes, header['graph_bytes'])
+        graph_def = tf.compat.v1.GraphDef()
+        graph_def.ParseFromString(
+            bytes(self._buffer[graph_offset:graph_offset + header['graph_bytes']])
+        )
+
+        self.weights = []
+        self.nbytes = 0
+        for spec in header['tensors']:
+            dtype = np.dtype(spec['dtype'])
+            start = data_offset + spec['offset']
+            size = int(np.prod(spec['shape'], dtype=np.int64)) * dtype.itemsize
+            view = self._buffer[start:start + size].view(dtype).reshape(spec['shape'])
+            # DLPack hands TensorFlow the mapped memory itself; tf.constant would copy it
+            self.weights.append(tf.experimental.dlpack.from_dlpack(view.__dlpack__()))
+            self.nbytes += size
+
+        wrapped = tf.compat.v1.wrap_function(
+            lambda: tf.compat.v1.import_graph_def(graph_def, name=''), []
+        )
+        feeds = [wrapped.graph.get_tensor_by_name(header['input'])] + [
+            wrapped.graph.get_tensor_by_name(spec['name']) for spec in header['tensors']
+        ]
+        self._function = wrapped.prune(feeds, wrapped.graph.get_tensor_by_name(header['output']))
+
+    def __call__(self, batch):
+        return self._function(tf.convert_to_tensor(batch, dtype=tf.float32), *self.weights)
+
+
+def main(argv=None):
+    from .model_registry import PREDICTORS
+
+    parser = argparse.ArgumentParser(description='Export a Keras model as a memory-mapped model file')
+    parser.add_argument('model', choices=sorted(PREDICTORS))
+    parser.add_argument('keras_path', help='Path to the trained .keras model')
+    parser.add_argument('--output', '-o', help='Destination (default: <model>.mmap next to the Keras model)')
+    args = parser.parse_args(argv)
+
+    predictor_cls = PREDICTORS[args.model]
+    output = args.output or os.path.splitext(args.keras_path)[0] + '.mmap'
+    keras_predictor = predictor_cls(args.keras_path)
+    report = {'keras_model': args.keras_path, 'path': output}
+    report.update(export(keras_predictor, output))
+
+    # Same graph, same weights: the outputs must agree
+    batch = np.random.default_rng(0).uniform(
+        0, 255 / keras_predictor.input_divisor,
+        (4, keras_predictor.image_size, keras_predictor.image_size, 3),
+    ).astype(np.float32)
+    mapped = MappedModel(output)
+    report['max_abs_difference'] = float(np.abs(
+        np.asarray(mapped(batch)) - keras_predictor.predict_probabilities(batch)
+    ).max())
+    print(json.dumps(report, indent=2))
+    if report['max_abs_difference'] > 1e-5:
+        print('warning: mapped model output differs from the Keras model', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
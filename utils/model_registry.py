@@ -0,0 +1,264 @@
+"""
+Central registry of the Curevia models.
+
+The registry knows every model's path, class list and input size, loads
+predictors eagerly or on first use, warms each one up with a synthetic batch,
+reloads a predictor when its model file is replaced, and evicts the least
+recently used predictors once the loaded weights exceed a memory budget.
+The Streamlit pages and the HTTP server get their predictors from
+``default_registry()``, which is configured from the environment:
+
+    CUREVIA_BRAIN_MODEL, CUREVIA_EYE_MODEL   model paths
+    CUREVIA_BACKEND                          'keras' (default), 'tflite' or 'mmap'
+    CUREVIA_PRELOAD                          comma-separated names, or 'all'
+    CUREVIA_MODEL_MEMORY_MB                  memory budget for loaded weights
+    CUREVIA_INSTRUMENT                       '0' turns off per-stage timings
+    CUREVIA_BRAIN_GATE, CUREVIA_EYE_GATE     triage gate paths (see ``utils.cascade``)
+    CUREVIA_GATE_THRESHOLD                   gate score needed to skip the full model
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .brain_predictor import BrainTumorPredictor
+from .eye_predictor import EyeDiseasePredictor
+from .prediction_cache import model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+PREDICTORS = {'brain': BrainTumorPredictor, 'eye': EyeDiseasePredictor}
+DEFAULT_MODEL_PATHS = {
+    'brain': 'models/brain_tumor/my_model.keras',
+    'eye': 'models/eye_disease/Trained_Model.keras',
+}
+
+
+class ModelSpec:
+    """Everything the registry needs to build one predictor."""
+
+    def __init__(self, name, predictor_cls, path, preload=False, warm_up_batch_size=1,
+                 **predictor_kwargs):
+        """
+        Args:
+            name: Registry key, e.g. 'brain'
+            predictor_cls: BrainTumorPredictor, EyeDiseasePredictor, ...
+            path: Model file passed to the predictor
+            preload: Load this model in ``ModelRegistry.preload``
+            warm_up_batch_size: Size of the synthetic warm-up batch
+            **predictor_kwargs: Extra predictor arguments (backend, num_threads, ...)
+        """
+        self.name = name
+        self.predictor_cls = predictor_cls
+        self.path = path
+        self.preload = preload
+        self.warm_up_batch_size = warm_up_batch_size
+        self.predictor_kwargs = predictor_kwargs
+
+    @property
+    def class_names(self):
+        return self.predictor_cls.class_names
+
+    @property
+    def image_size(self):
+        return self.predictor_cls.image_size
+
+    def load(self):
+        """Build the predictor; its constructor runs the warm-up batch."""
+        return self.predictor_cls(
+            self.path, warm_up_batch_size=self.warm_up_batch_size, **self.predictor_kwargs
+        )
+
+
+class ModelHandle:
+    """
+    Stand-in for a registry model that resolves the predictor on every use.
+
+    Long-lived wrappers such as ``MicroBatchScheduler`` hold a handle rather
+    than a predictor, so they keep working (reloading on demand) after the
+    registry has evicted the model. Static metadata comes from the spec
+    without loading anything.
+    """
+
+    def __init__(self, registry, name):
+        spec = registry.specs[name]
+        self.registry = registry
+        self.name = name
+        self.model_path = spec.path
+        self.class_names = spec.class_names
+        self.image_size = spec.image_size
+
+    def __getattr__(self, attr):
+        return getattr(self.registry.get(self.name), attr)
+
+
+class ModelRegistry:
+    """Thread-safe LRU cache of loaded predictors with an optional memory budget."""
+
+    def __init__(self, specs, memory_budget_mb=None, reload_check_seconds=1.0):
+        """
+        Args:
+            specs: Iterable of ModelSpec
+            memory_budget_mb: Evict least recently used predictors once their
+                weights exceed this many MB (None means unbounded). The most
+                recently used model is always kept.
+            reload_check_seconds: Look for a replaced model file at most this
+                often per model. ``get`` runs on every predictor attribute
+                access through a ModelHandle, so checking each time would
+                put an ``os.stat`` on the serving path.
+        """
+        self.specs = {spec.name: spec for spec in specs}
+        self.memory_budget = memory_budget_mb * 2**20 if memory_budget_mb else None
+        self.reload_check_seconds = reload_check_seconds
+        self._loaded = OrderedDict()  # name -> (predictor, weight bytes)
+        self._checked = {}  # name -> monotonic time of the last file check
+        self._lock = threading.RLock()
+        self._loading = {}  # name -> Lock held while that model loads
+
+    def get(self, name):
+        """Return the loaded predictor for ``name``, loading it if needed."""
+        with self._lock:
+            predictor = self._current(name)
+            if predictor is not None:
+                return predictor
+            if name not in self.specs:
+                raise KeyError(f'Unknown model {name!r}; registered: {sorted(self.specs)}')
+            loading = self._loading.setdefault(name, threading.Lock())
+        # Load outside the registry lock so the other models keep serving;
+        # concurrent callers for this model wait here for a single load
+        with loading:
+            with self._lock:
+                predictor = self._current(name)
+                if predictor is not None:
+                    return predictor
+            predictor = self.specs[name].load()
+            size = _weight_bytes(predictor)
+            with self._lock:
+                self._loaded[name] = (predictor, size)
+                self._checked[name] = time.monotonic()
+                logger.info('Loaded %s model (%.1f MB of weights)', name, size / 2**20)
+                self._evict_over_budget()
+            return predictor
+
+    def handle(self, name):
+        """Return a ModelHandle for ``name`` without loading the model."""
+        return ModelHandle(self, name)
+
+    def preload(self, background=False):
+        """
+        Load every model whose spec has ``preload=True``.
+
+        Args:
+            background: Load in a daemon thread and return it immediately
+        """
+        names = [name for name, spec in self.specs.items() if spec.preload]
+        if not background:
+            for name in names:
+                self.get(name)
+            return None
+        thread = threading.Thread(
+            target=lambda: [self.get(name) for name in names],
+            name='curevia-preload', daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def evict(self, name):
+        """Drop a loaded predictor; it is reloaded on its next use."""
+        with self._lock:
+            self._loaded.pop(name, None)
+
+    def loaded(self):
+        """Names of the loaded models, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
+
+    def memory_usage(self):
+        """Bytes of model weights currently held by the registry."""
+        with self._lock:
+            return sum(size for _, size in self._loaded.values())
+
+    def _current(self, name):
+        # The loaded, up-to-date predictor, marked most recently used; or None
+        if name not in self._loaded:
+            return None
+        if self._replaced(name):
+            # Dropped right away: the next check may be throttled and pass it
+            del self._loaded[name]
+            return None
+        self._loaded.move_to_end(name)
+        return self._loaded[name][0]
+
+    def _replaced(self, name):
+        # A file swapped on disk since loading means the predictor is stale
+        now = time.monotonic()
+        if now - self._checked.get(name, float('-inf')) < self.reload_check_seconds:
+            return False
+        self._checked[name] = now
+        try:
+            current = model_fingerprint(self.specs[name].path)
+        except OSError:
+            return False  # Keep serving the loaded model while the file is missing
+        if current == self._loaded[name][0].model_fingerprint:
+            return False
+        logger.info('%s model file changed on disk; reloading', name)
+        return True
+
+    def _evict_over_budget(self):
+        if self.memory_budget is None:
+            return
+        while len(self._loaded) > 1 and self.memory_usage() > self.memory_budget:
+            name, (_, size) = self._loaded.popitem(last=False)
+            logger.info('Evicted %s model to free %.1f MB', name, size / 2**20)
+
+
+def _weight_bytes(predictor):
+    if predictor.backend in ('tflite', 'mmap'):
+        return os.path.getsize(predictor.model_path)
+    return sum(
+        int(np.prod(weight.shape)) * np.dtype(weight.dtype).itemsize
+        for weight in predictor.model.weights
+    )
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def gate_kwargs(gate_path, gate_threshold):
+    """Predictor arguments that enable the triage cascade, or none without a gate."""
+    if not gate_path:
+        return {}
+    return {'gate_path': gate_path, 'gate_threshold': gate_threshold}
+
+
+def default_registry():
+    """Return the process-wide registry configured from the environment."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            preload = os.environ.get('CUREVIA_PRELOAD', '')
+            preload = set(PREDICTORS) if preload == 'all' else set(filter(None, preload.split(',')))
+            budget = os.environ.get('CUREVIA_MODEL_MEMORY_MB')
+            instrument = os.environ.get('CUREVIA_INSTRUMENT', '1') != '0'
+            gate_threshold = float(os.environ.get('CUREVIA_GATE_THRESHOLD', 0.95))
+            backend = os.environ.get('CUREVIA_BACKEND', 'keras')
+            _default_registry = ModelRegistry(
+                [
+                    ModelSpec(
+                        name, predictor_cls,
+                        os.environ.get(f'CUREVIA_{name.upper()}_MODEL', DEFAULT_MODEL_PATHS[name]),
+                        preload=name in preload,
+                        backend=backend,
+                        instrument=instrument,
+                        **gate_kwargs(os.environ.get(f'CUREVIA_{name.upper()}_GATE'), gate_threshold),
+                    )
+                    for name, predictor_cls in PREDICTORS.items()
+                ],
+                memory_budget_mb=float(budget) if budget else None,
+            )
+            _default_registry.preload(background=True)
+        return _default_registry
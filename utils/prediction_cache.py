@@ -0,0 +1,288 @@
+"""
+Content-addressed cache of prediction results.
+
+Entries are keyed by a SHA-256 of the image content plus the fingerprint
+(path, size and modification time) the model file had when the predictor
+loaded it, so re-uploading the same scan returns the stored result without
+a forward pass, and a model reloaded from a replaced file gets fresh
+entries. There is an in-memory LRU tier
+and an optional on-disk tier (a directory of small JSON files) with size-
+and TTL-based eviction.
+"""
+import copy
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def image_digest(image):
+    """
+    Hash the content of an image in any form the predictors accept.
+
+    Paths, bytes and file-like objects hash their encoded bytes. Decoded PIL
+    images and arrays hash their pixels, shape and mode, so the same pixels
+    always map to the same key.
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    if isinstance(image, Image.Image):
+        digest.update(f'{image.mode}:{image.size}'.encode())
+        digest.update(image.tobytes())
+    elif isinstance(image, np.ndarray):
+        digest.update(f'{image.dtype}:{image.shape}'.encode())
+        digest.update(np.ascontiguousarray(image).tobytes())
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        digest.update(image)
+    elif hasattr(image, 'read'):
+        image.seek(0)
+        for block in iter(lambda: image.read(io.DEFAULT_BUFFER_SIZE), b''):
+            digest.update(block)
+        image.seek(0)
+    else:
+        with open(image, 'rb') as f:
+            for block in iter(lambda: f.read(io.DEFAULT_BUFFER_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def model_fingerprint(model_path):
+    """Identify a model file by path, size and modification time."""
+    stat = os.stat(model_path)
+    return f'{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+class PredictionCache:
+    """Two-tier (memory LRU + optional JSON directory) store of result dicts."""
+
+    def __init__(self, max_entries=1024, directory=None, max_disk_entries=10000,
+                 ttl_seconds=None):
+        """
+        Args:
+            max_entries: Size of the in-memory LRU tier
+            directory: Enables the on-disk tier in this directory
+            max_disk_entries: Oldest disk entries are pruned beyond this count
+            ttl_seconds: Entries older than this are treated as misses
+                (None keeps them until evicted by size)
+        """
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self._disk_count = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, fingerprint, image, variant=None):
+        """
+        Cache key for ``image`` scored by the model with ``fingerprint``.
+
+        ``fingerprint`` is the predictor's ``model_fingerprint``, taken when
+        it loaded the model, so results are filed under the weights that
+        produced them. ``variant`` separates different kinds of result for
+        the same image and model, e.g. 'gradcam'.
+        """
+        if variant:
+            fingerprint = f'{fingerprint}|{variant}'
+        return hashlib.sha256(f'{fingerprint}|{image_digest(image)}'.encode()).hexdigest()
+
+    def get(self, key):
+        """Return a copy of the cached result for ``key``, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[0], now):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self._memory.pop(key, None)
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return copy.deepcopy(entry[1])
+
+    def put(self, key, result):
+        """Store ``result`` under ``key`` in every enabled tier."""
+        entry = (time.time(), copy.deepcopy(result))
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def stats(self):
+        """Hit/miss counters and tier sizes."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': self._disk_count,
+            }
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self.directory:
+                for name in os.listdir(self.directory):
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(self.directory, name))
+                self._disk_count = 0
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _read_disk(self, key, now):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(stored['stored_at'], now):
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None
+        return stored['stored_at'], stored['result']
+
+    def _write_disk(self, key, entry):
+        if not self.directory:
+            return
+        # Write-then-rename so concurrent readers never see a partial file
+        tmp_path = f'{self._path(key)}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'stored_at': entry[0], 'result': entry[1]}, f)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            if self._disk_count is None:
+                self._disk_count = sum(
+                    name.endswith('.json') for name in os.listdir(self.directory)
+                )
+            else:
+                self._disk_count += 1
+            if self._disk_count > self.max_disk_entries:
+                self._prune_disk()
+
+    def _prune_disk(self):
+        # Prune to 90% of the limit so we don't list the directory on every put
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        entries.sort()
+        excess = len(entries) - int(self.max_disk_entries * 0.9)
+        for _, path in entries[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._disk_count = len(entries) - max(excess, 0)
+
+
+class CachedPredictor:
+    """
+    Serve repeat images from a PredictionCache in front of any predictor.
+
+    Wraps a predictor, MicroBatchScheduler or ModelHandle; only cache misses
+    reach the wrapped object, and those still go through as one batch.
+    """
+
+    def __init__(self, predictor, cache):
+        self.predictor = predictor
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.predictor, name)
+
+    def predict(self, image):
+        """Predict one image, returning the cached result when available."""
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images, **kwargs):
+        """Predict many images; misses are forwarded in a single predict_batch call."""
+        # Non-None when results depend on more than the model file (e.g. a triage gate)
+        variant = getattr(self.predictor, 'cache_variant', None)
+        return self._cached(images, self.predictor.predict_batch, variant, **kwargs)
+
+    def predict_gradcam(self, image):
+        """``predict_gradcam`` with cached maps, so Streamlit reruns don't recompute them."""
+        return self.predict_gradcam_batch([image])[0]
+
+    def predict_gradcam_batch(self, images, **kwargs):
+        """Cached ``predict_gradcam_batch``; misses are forwarded in a single call."""
+        return self._cached(images, self.predictor.predict_gradcam_batch, 'gradcam', **kwargs)
+
+    def _cached(self, images, predict_batch, variant, **kwargs):
+        images = list(images)
+        keys = [self.cache.key(self.predictor.model_fingerprint, image, variant) for image in images]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fresh = predict_batch([images[i] for i in missing], **kwargs)
+            for i, result in zip(missing, fresh):
+                # Stage timings describe this run only; hits are served without them
+                self.cache.put(
+                    keys[i], {key: value for key, value in result.items() if key != 'timings'}
+                )
+                results[i] = result
+        return results
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    Return the process-wide cache, configured from the environment:
+
+        CUREVIA_CACHE_ENTRIES   in-memory LRU size (default 1024)
+        CUREVIA_CACHE_DIR       enables the on-disk tier
+        CUREVIA_CACHE_TTL       entry lifetime in seconds
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            ttl = os.environ.get('CUREVIA_CACHE_TTL')
+            _default_cache = PredictionCache(
+                max_entries=int(os.environ.get('CUREVIA_CACHE_ENTRIES', 1024)),
+                directory=os.environ.get('CUREVIA_CACHE_DIR') or None,
+                ttl_seconds=float(ttl) if ttl else None,
+            )
+        return _default_cache
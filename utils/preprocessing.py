@@ -0,0 +1,268 @@
+"""
+Image preprocessing shared by every predictor.
+
+One pipeline for both models:
+
+1. open the image from whatever form the caller has (path, bytes,
+   file-like, PIL image or array);
+2. for JPEGs we opened ourselves, ask the decoder for a reduced-size
+   decode with ``draft()`` (DCT scaling), so a 2048px scan headed for a
+   128px model input never gets decoded at full resolution;
+3. convert modes consistently: palette / alpha / CMYK images become RGB,
+   16-bit and float MRIs are rescaled to 8-bit first, grayscale is
+   expanded to RGB after the resize;
+4. resize once, with an explicit filter, to the model's square input;
+5. cast and normalize in place into a caller-provided float32 buffer.
+
+``preprocess_into`` (the batch path) and ``preprocess_image`` (the
+allocating path) share steps 1-4 and apply the same float32 operations.
+``tests/test_preprocessing.py`` checks both bit-for-bit against an
+independently written PIL/numpy reference of this pipeline.
+
+Every step accepts an optional ``timings`` dict that receives the seconds
+spent in the 'decode', 'resize' and 'normalize' stages; nothing is timed
+when it is None.
+"""
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+RESAMPLE = Image.Resampling.BICUBIC
+
+# Modes whose samples don't fit in 8 bits; rescaled to 8-bit grayscale first
+_WIDE_MODES = ('I', 'I;16', 'I;16B', 'I;16L', 'I;16N', 'F')
+
+
+def open_image(image):
+    """
+    Open an image from any of the in-memory or on-disk forms we accept.
+
+    Already decoded images are returned as-is, so callers that have opened
+    an upload once (e.g. the Streamlit pages) don't pay for a second decode
+    or a temporary file.
+
+    Args:
+        image: PIL image, HxW / HxWxC uint8 array, encoded image bytes,
+            a binary file-like object, or a path to an image file
+
+    Returns:
+        PIL.Image.Image: The opened (possibly not yet decoded) image
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(image))
+    if hasattr(image, 'seek'):
+        image.seek(0)
+    return Image.open(image)
+
+
+def _to_8bit(img):
+    pixels = np.asarray(img, dtype=np.float32)
+    peak = float(pixels.max()) if pixels.size else 0.0
+    if peak > 0:
+        pixels = pixels * np.float32(255.0 / peak)
+    return Image.fromarray(np.clip(np.rint(pixels), 0, 255).astype(np.uint8), 'L')
+
+
+def decode_resized(image, size, draft=True, timings=None):
+    """
+    Decode, mode-convert and resize one image to a (size, size, 3) uint8 array.
+
+    Args:
+        image: Image in any form accepted by ``open_image``
+        size: Side length of the square output
+        draft: Allow reduced-size JPEG decoding for images opened here.
+            Caller-provided PIL images are never modified.
+        timings: Optional dict; 'decode' and 'resize' seconds are added to it
+
+    Returns:
+        np.ndarray: uint8 array of shape (size, size, 3)
+    """
+    if timings is not None:
+        start = time.perf_counter()
+    img = open_image(image)
+    if draft and img is not image and img.format == 'JPEG':
+        # Only scales by powers of two and never below the requested size
+        img.draft('RGB', (size, size))
+    if timings is not None:
+        # PIL decodes lazily; force it so decode and resize are timed apart
+        img.load()
+        decoded = time.perf_counter()
+        timings['decode'] = timings.get('decode', 0.0) + decoded - start
+
+    if img.mode in _WIDE_MODES:
+        img = _to_8bit(img)
+    elif img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+
+    if img.size != (size, size):
+        img = img.resize((size, size), RESAMPLE)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    pixels = np.asarray(img)
+    if timings is not None:
+        timings['resize'] = timings.get('resize', 0.0) + time.perf_counter() - decoded
+    return pixels
+
+
+def thumbnail(image, max_side=768):
+    """
+    Decode a downscaled display copy of an image, keeping its aspect ratio.
+
+    Uses the same reduced-size JPEG decode and mode handling as
+    ``decode_resized``, so showing a 4K upload costs a fraction of a full
+    decode.
+
+    Args:
+        image: Image in any form accepted by ``open_image``
+        max_side: Longest side of the result; smaller images keep their size
+
+    Returns:
+        PIL.Image.Image: Decoded 'L' or 'RGB' image
+    """
+    img = open_image(image)
+    if img is not image and img.format == 'JPEG':
+        img.draft('RGB', (max_side, max_side))
+    if img.mode in _WIDE_MODES:
+        img = _to_8bit(img)
+    elif img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    else:
+        img = img.copy() if img is image else img
+    img.thumbnail((max_side, max_side), RESAMPLE)
+    return img
+
+
+def normalize_into(out, pixels, divisor=1.0):
+    """
+    Write ``pixels / divisor`` into the float32 array ``out`` without temporaries.
+
+    Args:
+        out: float32 destination, e.g. one row of a batch buffer
+        pixels: uint8 array of the same shape
+        divisor: 255.0 for models trained on [0, 1] inputs, 1.0 for raw pixels
+    """
+    out[...] = pixels
+    if divisor != 1.0:
+        np.divide(out, np.float32(divisor), out=out)
+    return out
+
+
+def preprocess_into(out, image, size, divisor=1.0, draft=True, timings=None):
+    """Decode, resize and normalize ``image`` directly into ``out`` (shape (size, size, 3))."""
+    pixels = decode_resized(image, size, draft=draft, timings=timings)
+    if timings is None:
+        return normalize_into(out, pixels, divisor)
+    start = time.perf_counter()
+    normalize_into(out, pixels, divisor)
+    timings['normalize'] = timings.get('normalize', 0.0) + time.perf_counter() - start
+    return out
+
+
+def preprocess_image(image, size, divisor=1.0, draft=True, timings=None):
+    """
+    Reference (allocating) version of ``preprocess_into``.
+
+    Returns:
+        np.ndarray: New float32 array of shape (size, size, 3)
+    """
+    pixels = decode_resized(image, size, draft=draft, timings=timings)
+    if timings is not None:
+        start = time.perf_counter()
+    pixels = pixels.astype(np.float32)
+    if divisor != 1.0:
+        pixels = pixels / np.float32(divisor)
+    if timings is not None:
+        timings['normalize'] = timings.get('normalize', 0.0) + time.perf_counter() - start
+    return pixels
+
+
+# ITU-R 601-2 luma weights, as used by PIL's convert('L')
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def adjust_brightness_contrast(pixels, brightness, contrast, out=None):
+    """
+    Apply several brightness/contrast variants of one image at once.
+
+    Numpy twin of ``utils.training.adjust_brightness_contrast`` (and so of
+    PIL ``ImageEnhance.Brightness`` then ``ImageEnhance.Contrast``), so
+    test-time augmentation sees exactly what training augmentation produced.
+
+    Args:
+        pixels: uint8 array of shape (H, W, 3)
+        brightness: N brightness factors
+        contrast: N contrast factors
+        out: Optional float32 buffer of shape (N, H, W, 3)
+
+    Returns:
+        np.ndarray: float32 (N, H, W, 3), whole values in [0, 255]
+    """
+    brightness = np.asarray(brightness, dtype=np.float32)[:, None, None, None]
+    contrast = np.asarray(contrast, dtype=np.float32)[:, None, None, None]
+    if out is None:
+        out = np.empty((len(brightness),) + pixels.shape, dtype=np.float32)
+    np.multiply(pixels, brightness, out=out)
+    np.clip(out, 0.0, 255.0, out=out)
+    np.floor(out, out=out)
+    # Contrast blends towards each variant's mean grey level
+    mean = np.floor(np.mean(out @ _LUMA, axis=(1, 2), dtype=np.float32) + np.float32(0.5))
+    mean = mean[:, None, None, None]
+    out -= mean
+    out *= contrast
+    out += mean
+    np.clip(out, 0.0, 255.0, out=out)
+    return np.floor(out, out=out)
+
+
+def tta_factors(n, seed=0, lower=0.8, upper=1.2):
+    """
+    Deterministic brightness and contrast factors for ``n`` TTA views.
+
+    The first view is always the unmodified image.
+
+    Returns:
+        tuple: (brightness, contrast) float32 arrays of length ``n``
+    """
+    rng = np.random.default_rng(seed)
+    factors = rng.uniform(lower, upper, size=(2, n)).astype(np.float32)
+    factors[:, 0] = 1.0
+    return factors[0], factors[1]
+
+
+def allocate_batch(batch_size, size):
+    """Allocate an uninitialized float32 (batch_size, size, size, 3) batch buffer."""
+    return np.empty((batch_size, size, size, 3), dtype=np.float32)
+
+
+def preprocess_batch(images, size, divisor=1.0, out=None, draft=True, timings=None):
+    """
+    Preprocess several images into one contiguous float32 batch.
+
+    Args:
+        images: Sequence of images accepted by ``open_image``
+        size: Model input side length
+        divisor: See ``normalize_into``
+        out: Optional preallocated buffer with at least ``len(images)`` rows;
+            a view of its first rows is returned
+        draft: See ``decode_resized``
+        timings: Optional list; one dict of stage seconds is appended per image
+
+    Returns:
+        np.ndarray: float32 array of shape (len(images), size, size, 3)
+    """
+    if out is None:
+        out = allocate_batch(len(images), size)
+    batch = out[:len(images)]
+    for row, image in zip(batch, images):
+        image_timings = None
+        if timings is not None:
+            image_timings = {}
+            timings.append(image_timings)
+        preprocess_into(row, image, size, divisor, draft=draft, timings=image_timings)
+    return batch
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from .preprocessing import allocate_batch
+
+_STOP = object()
+
+
+class MicroBatchScheduler:
+    """
+    Coalesce concurrent predict calls into batched forward passes.
+
+    Streamlit runs every browser session in its own thread, so a single
+    cached predictor sees many simultaneous one-image calls. The scheduler
+    preprocesses each image in the caller's thread, queues it, and a single
+    worker thread drains the queue into batches of up to ``max_batch_size``
+    images, waiting at most ``max_wait_ms`` after the first queued image
+    before running the forward pass. Each caller gets its own result back
+    through a ``concurrent.futures.Future``. With an instrumented predictor
+    the time each image waited in the queue is reported as the 'queue' stage.
+    """
+
+    def __init__(self, predictor, max_batch_size=16, max_wait_ms=10):
+        """
+        Args:
+            predictor: BrainTumorPredictor / EyeDiseasePredictor to wrap
+            max_batch_size: Largest batch handed to the model at once
+            max_wait_ms: How long to hold the first queued image while
+                waiting for more to arrive
+        """
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        # Held to check _closed and enqueue at once, so nothing lands after _STOP
+        self._lock = threading.Lock()
+        self._buffer = None  # Batch buffer, only touched by the worker thread
+        self._worker = threading.Thread(
+            target=self._run, name='curevia-batcher', daemon=True
+        )
+        self._worker.start()
+
+    def __getattr__(self, name):
+        # Expose class_names, image_size, model_path, ... of the wrapped predictor
+        return getattr(self.predictor, name)
+
+    def submit(self, image):
+        """
+        Queue one image for inference.
+
+        Args:
+            image: Image in any form accepted by the predictor's ``load_image``
+
+        Returns:
+            concurrent.futures.Future: Resolves to the predictor's result dict
+        """
+        if self._closed:
+            raise RuntimeError('MicroBatchScheduler is closed')
+        future = Future()
+        timings = {} if self.predictor.instrument else None
+        try:
+            array = self.predictor.preprocess(image, timings=timings)
+        except Exception as exc:
+            future.set_exception(exc)
+            return future
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('MicroBatchScheduler is closed')
+            self._queue.put((array, timings, time.perf_counter(), future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """Predict a single image, blocking until its batch has run."""
+        return self.submit(image).result(timeout)
+
+    def predict_batch(self, images, timeout=None, batch_size=None):
+        """
+        Predict many images; they are batched together with other callers' work.
+
+        ``batch_size`` is accepted for compatibility with the predictors'
+        ``predict_batch`` and ignored: batches are sized by ``max_batch_size``.
+        """
+        futures = [self.submit(image) for image in images]
+        return [future.result(timeout) for future in futures]
+
+    def close(self):
+        """Finish queued work and stop the worker thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._worker.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            pending = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                pending.append(item)
+            self._dispatch(pending)
+
+    def _dispatch(self, pending):
+        dispatched = time.perf_counter()
+        # Drop requests whose caller cancelled while they were queued
+        pending = [item for item in pending if item[-1].set_running_or_notify_cancel()]
+        if not pending:
+            return
+        try:
+            if self._buffer is None:
+                self._buffer = allocate_batch(self.max_batch_size, self.predictor.image_size)
+            batch = np.stack(
+                [item[0] for item in pending], out=self._buffer[:len(pending)]
+            )
+            results = self.predictor.predict_preprocessed(batch)
+        except Exception as exc:
+            for item in pending:
+                item[-1].set_exception(exc)
+            return
+        for (_, timings, queued, future), result in zip(pending, results):
+            if timings is not None:
+                timings['queue'] = dispatched - queued
+                self.predictor.add_timings(result, timings)
+            future.set_result(result)
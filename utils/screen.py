@@ -0,0 +1,240 @@
+"""
+Bulk screening of image folders and ZIP archives (``curevia-screen``).
+
+    python -m utils.screen brain exports/mri_study/ --output results.jsonl
+    python -m utils.screen eye oct_export.zip --format csv --workers 8 --processes
+
+Images are decoded and resized on a thread (or process) pool, fed to the
+model in fixed-size batches, and each result row (path, class_name,
+confidence, all_predictions) is written as soon as its batch finishes, so
+output never accumulates in memory. Progress and images/sec go to stderr.
+"""
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .datasets import is_image_file, iter_image_files
+from .model_registry import DEFAULT_MODEL_PATHS, PREDICTORS
+from .preprocessing import allocate_batch, decode_resized, normalize_into
+
+CSV_FIELDS = ('path', 'class_name', 'class_index', 'confidence', 'all_predictions', 'error')
+
+# Per-thread / per-process cache of open archives for the decode workers
+_archives = threading.local()
+
+
+def iter_items(paths):
+    """
+    Expand input paths into decodable items.
+
+    Yields:
+        str | tuple: An image path, or (zip_path, member) for archive entries
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from iter_image_files(path)
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                members = sorted(
+                    info.filename for info in archive.infolist()
+                    if not info.is_dir() and is_image_file(info.filename)
+                )
+            for member in members:
+                yield (path, member)
+        else:
+            yield path
+
+
+def item_name(item):
+    """Display path of an item; archive members are shown as ``archive.zip/member``."""
+    return item if isinstance(item, str) else f'{item[0]}/{item[1]}'
+
+
+def _read_item(item):
+    if isinstance(item, str):
+        return item
+    zip_path, member = item
+    open_archives = getattr(_archives, 'open', None)
+    if open_archives is None:
+        open_archives = _archives.open = {}
+    if zip_path not in open_archives:
+        open_archives[zip_path] = zipfile.ZipFile(zip_path)
+    return open_archives[zip_path].read(member)
+
+
+def decode_item(item, size):
+    """Decode one item to a (size, size, 3) uint8 array, or return the error message."""
+    try:
+        return decode_resized(_read_item(item), size), None
+    except Exception as exc:
+        return None, f'{type(exc).__name__}: {exc}'
+
+
+def decode_ordered(executor, items, size, window):
+    """
+    Decode items on ``executor`` and yield (item, pixels, error) in input order.
+
+    At most ``window`` decodes are in flight, so memory stays bounded no
+    matter how many images the input holds.
+    """
+    pending = collections.deque()
+    items = iter(items)
+    for item in items:
+        pending.append((item, executor.submit(decode_item, item, size)))
+        if len(pending) >= window:
+            break
+    while pending:
+        item, future = pending.popleft()
+        next_item = next(items, None)
+        if next_item is not None:
+            pending.append((next_item, executor.submit(decode_item, next_item, size)))
+        pixels, error = future.result()
+        yield item, pixels, error
+
+
+class ResultWriter:
+    """Stream result rows as JSON lines or CSV."""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            self._csv.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            row = dict(row)
+            if row.get('all_predictions') is not None:
+                row['all_predictions'] = json.dumps(row['all_predictions'])
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(row) + '\n')
+        self.stream.flush()
+
+
+class Progress:
+    """Periodic ``N images, X img/s`` line on stderr."""
+
+    def __init__(self, interval=1.0, stream=sys.stderr):
+        self.interval = interval
+        self.stream = stream
+        self.count = 0
+        self.errors = 0
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def update(self, count, errors=0):
+        self.count += count
+        self.errors += errors
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._print(now, end='\r')
+
+    def finish(self):
+        self._print(time.perf_counter(), end='\n')
+
+    def _print(self, now, end):
+        rate = self.count / max(now - self.start, 1e-9)
+        self.stream.write(
+            f'{self.count} images ({self.errors} failed), {rate:.1f} img/s{end}'
+        )
+        self.stream.flush()
+
+
+def screen(predictor, items, writer, batch_size=32, workers=4, processes=False,
+           progress=None):
+    """
+    Screen every item and stream one result row per item to ``writer``.
+
+    Args:
+        predictor: Loaded predictor (any backend)
+        items: Iterable from ``iter_items``
+        writer: Object with a ``write(row)`` method
+        batch_size: Images per forward pass
+        workers: Decode pool size
+        processes: Decode on a process pool instead of threads
+        progress: Optional Progress
+    """
+    executor_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    buffer = allocate_batch(batch_size, predictor.image_size)
+    batch_items = []
+
+    def flush():
+        batch = buffer[:len(batch_items)]
+        results = predictor.predict_preprocessed(batch)
+        for item, result in zip(batch_items, results):
+            writer.write({'path': item_name(item), **result})
+        if progress:
+            progress.update(len(batch_items))
+        batch_items.clear()
+
+    with executor_cls(max_workers=workers) as executor:
+        decoded = decode_ordered(
+            executor, items, predictor.image_size, window=batch_size * 4
+        )
+        for item, pixels, error in decoded:
+            if error is not None:
+                writer.write({'path': item_name(item), 'error': error})
+                if progress:
+                    progress.update(1, errors=1)
+                continue
+            normalize_into(buffer[len(batch_items)], pixels, predictor.input_divisor)
+            batch_items.append(item)
+            if len(batch_items) == batch_size:
+                flush()
+        if batch_items:
+            flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='curevia-screen',
+        description='Screen folders or ZIP archives of MRI/OCT images',
+    )
+    parser.add_argument('model', choices=sorted(PREDICTORS))
+    parser.add_argument('inputs', nargs='+', help='Image files, directories or ZIP archives')
+    parser.add_argument('--model-path', help='Model file (default: the registry path)')
+    parser.add_argument('--backend', choices=('keras', 'tflite', 'mmap'), default='keras')
+    parser.add_argument('--num-threads', type=int, default=None,
+                        help='TFLite interpreter threads')
+    parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None,
+                        help='Default: from the output extension, else jsonl')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--processes', action='store_true',
+                        help='Decode on a process pool instead of threads')
+    parser.add_argument('--quiet', action='store_true', help='No progress output')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if (args.output or '').endswith('.csv') else 'jsonl')
+    predictor = PREDICTORS[args.model](
+        args.model_path or DEFAULT_MODEL_PATHS[args.model],
+        backend=args.backend, num_threads=args.num_threads,
+    )
+    progress = None if args.quiet else Progress()
+    stream = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        screen(
+            predictor, iter_items(args.inputs), ResultWriter(stream, fmt),
+            batch_size=args.batch_size, workers=args.workers,
+            processes=args.processes, progress=progress,
+        )
+    finally:
+        if args.output:
+            stream.close()
+        if progress:
+            progress.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Standalone HTTP inference service for the Curevia models.
+
+Run from the repository root:
+
+    python -m utils.server --host 0.0.0.0 --port 8080
+
+Endpoints:
+    POST /v1/brain/predict, POST /v1/eye/predict
+        Raw image bytes in the body return a single result dict (the same
+        dict ``predict`` returns). A multipart/form-data body with one image
+        per part returns a list of result dicts in part order.
+    GET /healthz
+        Liveness plus loading state; 503 only if model loading failed.
+    GET /readyz
+        200 once every model is loaded and warmed up, 503 before that.
+    GET /metrics
+        Per-stage and per-request latency histograms in Prometheus text format.
+
+With ``--history-db`` (or ``CUREVIA_HISTORY_DB``) every served prediction
+is also recorded in a ``utils.history.HistoryStore``.
+"""
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import json
+import logging
+import time
+from http import HTTPStatus
+
+from PIL import Image, UnidentifiedImageError
+
+from .metrics import CONTENT_TYPE, default_metrics
+from .history import HistoryStore, RecordingPredictor, default_history
+from .model_registry import DEFAULT_MODEL_PATHS, PREDICTORS, ModelRegistry, ModelSpec, gate_kwargs
+from .prediction_cache import CachedPredictor, default_cache
+from .scheduler import MicroBatchScheduler
+from .worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    """Error that is reported to the client with the given status code."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class InferenceServer:
+    """
+    Minimal asyncio HTTP/1.1 server in front of the predictor classes.
+
+    Each registry model is loaded once per process and wrapped in a
+    ``MicroBatchScheduler``, so concurrent connections share forward passes,
+    and optionally in a ``CachedPredictor`` so repeat images skip inference.
+    Decoding and inference run off the event loop in the default executor.
+    """
+
+    def __init__(self, registry, cache=None, max_batch_size=16, max_wait_ms=10,
+                 max_body_bytes=MAX_BODY_BYTES, workers=0, history=None):
+        """
+        Args:
+            registry: ModelRegistry; each spec name (e.g. 'brain') becomes
+                the ``/v1/<name>/predict`` endpoint
+            cache: Optional PredictionCache consulted before inference
+            max_batch_size: Largest batch each scheduler hands its model
+            max_wait_ms: Scheduler batching window
+            max_body_bytes: Requests with a larger body are rejected with 413
+            workers: With N > 0, serve each model from a WorkerPool of N
+                replica processes instead of one in-process scheduler; a
+                request's images are then decoded and run inside a worker.
+                Stage timings stay in the workers; ``/metrics`` then reports
+                request latency only.
+            history: Optional HistoryStore; every result served (cache hits
+                included) is recorded in it
+        """
+        self.registry = registry
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_body_bytes = max_body_bytes
+        self.workers = workers
+        self.history = history
+        self.metrics = default_metrics()
+        self._request_seconds = self.metrics.histogram(
+            'curevia_request_seconds', 'End-to-end predict request latency', ('model', 'status')
+        )
+        self.schedulers = {}
+        self.pools = {}
+        self.predictors = {}
+        self.state = 'loading'
+        self.error = None
+
+    def load_models(self):
+        """Load and warm up every model. Blocking; runs once per process."""
+        for name, spec in self.registry.specs.items():
+            if self.workers:
+                backend = self.pools[name] = WorkerPool(
+                    spec.predictor_cls, spec.path, workers=self.workers,
+                    warm_up_batch_size=spec.warm_up_batch_size, **spec.predictor_kwargs
+                )
+            else:
+                self.registry.get(name)
+                backend = self.schedulers[name] = MicroBatchScheduler(
+                    self.registry.handle(name),
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms,
+                )
+            predictor = CachedPredictor(backend, self.cache) if self.cache else backend
+            if self.history is not None:
+                predictor = RecordingPredictor(predictor, self.history, model=name)
+            self.predictors[name] = predictor
+            logger.info('Loaded and warmed up %s model', name)
+
+    async def serve(self, host, port):
+        """Accept connections immediately and load the models in the background."""
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info('Listening on http://%s:%s', host, port)
+        loading = asyncio.create_task(self._load_in_background())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            loading.cancel()
+            for backend in [*self.schedulers.values(), *self.pools.values()]:
+                backend.close()
+            if self.history is not None:
+                self.history.close()
+
+    async def _load_in_background(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.load_models)
+        except Exception as exc:
+            logger.exception('Model loading failed')
+            self.state = 'failed'
+            self.error = str(exc)
+        else:
+            self.state = 'ready'
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    status, payload = await self._route(method, path, headers, body)
+                except HTTPError as exc:
+                    status, payload = exc.status, {'error': str(exc)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception:
+                    logger.exception('Unhandled error while serving request')
+                    status, payload = 500, {'error': 'internal server error'}
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as exc:
+            if not exc.partial:
+                return None  # Client closed an idle keep-alive connection
+            raise
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, 'request headers too large')
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, 'malformed request line')
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        if 'transfer-encoding' in headers:
+            raise HTTPError(411, 'chunked bodies are not supported; send Content-Length')
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, 'invalid Content-Length')
+        if length > self.max_body_bytes:
+            raise HTTPError(413, f'body exceeds {self.max_body_bytes} bytes')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target.split('?', 1)[0], headers, body
+
+    async def _route(self, method, path, headers, body):
+        if path in ('/healthz', '/readyz'):
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            payload = {'status': self.state, 'models': sorted(self.predictors)}
+            if self.error:
+                payload['error'] = self.error
+            if path == '/healthz':
+                return (503 if self.state == 'failed' else 200), payload
+            return (200 if self.state == 'ready' else 503), payload
+
+        if path == '/metrics':
+            if method != 'GET':
+                raise HTTPError(405, 'use GET')
+            return 200, self.metrics.render()
+
+        parts = path.strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'v1' and parts[2] == 'predict':
+            name = parts[1]
+            if name not in self.registry.specs:
+                raise HTTPError(404, f'unknown model {name!r}')
+            if method != 'POST':
+                raise HTTPError(405, 'use POST')
+            if self.state != 'ready':
+                raise HTTPError(503, f'models are {self.state}')
+            start = time.perf_counter()
+            status = 500
+            try:
+                images, batched = self._parse_images(headers, body)
+                loop = asyncio.get_running_loop()
+                try:
+                    results = await loop.run_in_executor(
+                        None, self.predictors[name].predict_batch, images
+                    )
+                except Image.DecompressionBombError as exc:
+                    # Not an OSError: PIL refuses images above its pixel limit
+                    raise HTTPError(400, f'image too large: {exc}')
+                except (UnidentifiedImageError, OSError, ValueError) as exc:
+                    raise HTTPError(400, f'could not decode image: {exc}')
+                status = 200
+            except HTTPError as exc:
+                status = exc.status
+                raise
+            finally:
+                self._request_seconds.observe(
+                    time.perf_counter() - start, model=name, status=status
+                )
+            return 200, (results if batched else results[0])
+
+        raise HTTPError(404, f'no route for {path}')
+
+    def _parse_images(self, headers, body):
+        content_type = headers.get('content-type', 'application/octet-stream')
+        if content_type.startswith('multipart/'):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body
+            )
+            if not message.is_multipart():
+                raise HTTPError(400, 'malformed multipart body')
+            images = [part.get_payload(decode=True) for part in message.iter_parts()]
+            images = [image for image in images if image]
+            if not images:
+                raise HTTPError(400, 'multipart body contains no images')
+            return images, True
+        if not body:
+            raise HTTPError(400, 'empty request body')
+        return [body], False
+
+    def _write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            data, content_type = payload.encode('utf-8'), CONTENT_TYPE
+        else:
+            data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        head = (
+            f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(data)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            '\r\n'
+        )
+        writer.write(head.encode('latin-1') + data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Curevia HTTP inference server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    for name in PREDICTORS:
+        parser.add_argument(f'--{name}-model', default=DEFAULT_MODEL_PATHS[name])
+        parser.add_argument(f'--{name}-gate', help='Triage gate in front of the model (utils.cascade)')
+    parser.add_argument('--backend', choices=('keras', 'tflite', 'mmap'), default='keras',
+                        help="Model format of the --*-model files ('mmap' shares weights across processes)")
+    parser.add_argument('--gate-threshold', type=float, default=0.95,
+                        help='Gate score needed to skip the full model')
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Disable the prediction cache (configured via CUREVIA_CACHE_*)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Serve each model from N replica processes (0: one in-process model)')
+    parser.add_argument('--history-db',
+                        help='Record every prediction in this SQLite file (default: CUREVIA_HISTORY_DB)')
+    parser.add_argument('--no-instrument', action='store_true',
+                        help='Skip per-stage timings (request latency is still recorded)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    registry = ModelRegistry([
+        ModelSpec(name, predictor_cls, getattr(args, f'{name}_model'),
+                  preload=True, warm_up_batch_size=args.max_batch_size,
+                  backend=args.backend, instrument=not args.no_instrument,
+                  **gate_kwargs(getattr(args, f'{name}_gate'), args.gate_threshold))
+        for name, predictor_cls in PREDICTORS.items()
+    ])
+    server = InferenceServer(
+        registry,
+        cache=None if args.no_cache else default_cache(),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        workers=args.workers,
+        history=HistoryStore(args.history_db) if args.history_db else default_history(),
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+Preprocessed, memory-mapped dataset shards.
+
+Decoding tens of thousands of JPEGs every epoch (and holding the whole
+decoded test set in RAM for evaluation) dominates training and evaluation
+time. ``pack`` decodes and resizes a labelled directory once, with the
+same pipeline as inference, into uint8 ``.npy`` shards plus a label and
+index manifest:
+
+    python -m utils.shards pack brain "Mri Images/Training" shards/brain_train
+    python -m utils.shards info shards/brain_train
+
+``ShardedDataset`` opens the shards with ``np.memmap`` (via
+``np.load(mmap_mode='r')``), so batches are zero-copy slices and a full
+pass over the 84k-image OCT set only touches the page cache.
+
+Layout of a packed directory::
+
+    index.json        image_size, class_names, shard file names and sizes, source paths
+    labels.npy        int32 label per image
+    shard-00000.npy   uint8 (N, image_size, image_size, 3)
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .datasets import Manifest
+from .lazy import LazyModule
+from .model_registry import PREDICTORS
+from .preprocessing import allocate_batch, decode_resized, normalize_into
+
+tf = LazyModule('tensorflow')
+
+INDEX_FILE = 'index.json'
+LABELS_FILE = 'labels.npy'
+
+
+def _decode_or_none(path, image_size):
+    try:
+        return decode_resized(path, image_size)
+    except Exception:
+        return None
+
+
+def pack(manifest, out_dir, image_size, shard_size=4096, workers=None, seed=0):
+    """
+    Decode, resize and write a manifest's images into uint8 shards.
+
+    Images that fail to decode are skipped and listed under ``failed`` in
+    the index. Manifests list their samples grouped by class, so they are
+    written in a seeded random order: every shard then mixes the classes,
+    and shuffling shards and rows (``as_tf_dataset``) gives mixed batches.
+
+    Args:
+        manifest: Manifest of the images to pack
+        out_dir: Output directory (created if needed)
+        image_size: Square side length, the predictor's ``image_size``
+        shard_size: Images per shard file
+        workers: Decode threads (default: CPU count)
+        seed: Seed of the write order; None keeps the manifest's order
+
+    Returns:
+        ShardedDataset: The packed dataset, opened
+    """
+    if seed is not None:
+        manifest = manifest.shuffled(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    shards, paths, labels, failed = [], [], [], []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(manifest), shard_size):
+            chunk_paths = manifest.paths[start:start + shard_size]
+            chunk_labels = manifest.labels[start:start + shard_size]
+            decoded = executor.map(lambda p: _decode_or_none(p, image_size), chunk_paths)
+            file_name = f'shard-{len(shards):05d}.npy'
+            shard = np.lib.format.open_memmap(
+                os.path.join(out_dir, file_name), mode='w+', dtype=np.uint8,
+                shape=(len(chunk_paths), image_size, image_size, 3),
+            )
+            count = 0
+            for path, label, pixels in zip(chunk_paths, chunk_labels, decoded):
+                if pixels is None:
+                    failed.append(path)
+                    continue
+                shard[count] = pixels
+                paths.append(path)
+                labels.append(label)
+                count += 1
+            shard.flush()
+            del shard
+            if count < len(chunk_paths):
+                _truncate_shard(os.path.join(out_dir, file_name), count)
+            shards.append({'file': file_name, 'count': count})
+
+    np.save(os.path.join(out_dir, LABELS_FILE), np.asarray(labels, dtype=np.int32))
+    with open(os.path.join(out_dir, INDEX_FILE), 'w') as f:
+        json.dump({
+            'image_size': image_size,
+            'class_names': manifest.class_names,
+            'shards': shards,
+            'paths': paths,
+            'failed': failed,
+        }, f)
+    return ShardedDataset(out_dir)
+
+
+def _truncate_shard(path, count):
+    # Rewrite a shard that lost rows to failed decodes with its real length
+    full = np.load(path, mmap_mode='r')
+    kept = np.array(full[:count])
+    del full
+    np.save(path, kept)
+
+
+class ShardedDataset:
+    """Read-only, memory-mapped view of a packed dataset."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.image_size = index['image_size']
+        self.class_names = index['class_names']
+        self.paths = index['paths']
+        self.labels = np.load(os.path.join(directory, LABELS_FILE), mmap_mode='r')
+        self.shards = [
+            np.load(os.path.join(directory, shard['file']), mmap_mode='r')
+            for shard in index['shards']
+        ]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    @staticmethod
+    def is_packed(directory):
+        """True if ``directory`` holds a packed dataset."""
+        return os.path.isfile(os.path.join(directory, INDEX_FILE))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def class_counts(self):
+        """Number of images per class name."""
+        counts = np.bincount(np.asarray(self.labels), minlength=len(self.class_names))
+        return dict(zip(self.class_names, counts.tolist()))
+
+    def manifest(self):
+        """Manifest of the source images that were packed."""
+        return Manifest(self.paths, self.labels.tolist(), self.class_names)
+
+    def batch(self, start, stop):
+        """
+        Images and labels in [start, stop).
+
+        A zero-copy view of the memory map when the range lies inside one
+        shard; ranges spanning shards are concatenated into a new array.
+        """
+        first = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        last = int(np.searchsorted(self.offsets, stop - 1, side='right')) - 1
+        labels = self.labels[start:stop]
+        if first == last:
+            base = self.offsets[first]
+            return self.shards[first][start - base:stop - base], labels
+        parts = []
+        for shard_index in range(first, last + 1):
+            base = self.offsets[shard_index]
+            parts.append(self.shards[shard_index][max(start - base, 0):stop - base])
+        return np.concatenate(parts), labels
+
+    def iter_batches(self, batch_size):
+        """
+        Yield (uint8 images, labels) in order as zero-copy slices.
+
+        Batches never span shards, so the last batch of each shard may be short.
+        """
+        for shard_index, shard in enumerate(self.shards):
+            base = int(self.offsets[shard_index])
+            for start in range(0, len(shard), batch_size):
+                stop = min(start + batch_size, len(shard))
+                yield shard[start:stop], self.labels[base + start:base + stop]
+
+    def iter_normalized(self, batch_size, divisor=1.0):
+        """
+        Yield (float32 batch, labels) ready for ``predict_preprocessed``.
+
+        The float32 batch is a reused buffer; copy it if you keep it past
+        the next iteration.
+        """
+        buffer = allocate_batch(batch_size, self.image_size)
+        for images, labels in self.iter_batches(batch_size):
+            batch = buffer[:len(images)]
+            normalize_into(batch, images, divisor)
+            yield batch, labels
+
+    def as_tf_dataset(self, batch_size=32, divisor=1.0, augment=False, shuffle=False, seed=None):
+        """
+        Training dataset streamed from the memory maps.
+
+        With ``shuffle`` the shard order and the order within each shard
+        are re-drawn every epoch; rows are gathered in sorted order so
+        reads stay mostly sequential.
+        """
+        from .training import finish_batches
+
+        size = self.image_size
+        # One generator for the dataset's lifetime, so every epoch draws a new order
+        rng = np.random.default_rng(seed)
+
+        def generate():
+            order = rng.permutation(len(self.shards)) if shuffle else range(len(self.shards))
+            for shard_index in order:
+                shard = self.shards[shard_index]
+                base = int(self.offsets[shard_index])
+                rows = rng.permutation(len(shard)) if shuffle else np.arange(len(shard))
+                for start in range(0, len(rows), batch_size):
+                    chunk = np.sort(rows[start:start + batch_size])
+                    yield shard[chunk], np.asarray(self.labels[base + chunk])
+
+        dataset = tf.data.Dataset.from_generator(
+            generate,
+            output_signature=(
+                tf.TensorSpec((None, size, size, 3), tf.uint8),
+                tf.TensorSpec((None,), tf.int32),
+            ),
+        )
+        # Batches never span shards; tell Keras the epoch length up front
+        num_batches = sum(-(-len(shard) // batch_size) for shard in self.shards)
+        dataset = dataset.apply(tf.data.experimental.assert_cardinality(num_batches))
+        return finish_batches(dataset, divisor, augment, seed)
+
+
+def open_labelled(directory, predictor_cls):
+    """
+    Open a labelled dataset for a model: a packed shard directory as a
+    ``ShardedDataset``, otherwise a class-per-sub-directory folder as a ``Manifest``.
+
+    Raises:
+        ValueError: If the shards were packed at another size than the
+            model's input, or a sub-directory is not one of its classes
+    """
+    if ShardedDataset.is_packed(directory):
+        dataset = ShardedDataset(directory)
+        if dataset.image_size != predictor_cls.image_size:
+            raise ValueError(f'{directory} was packed at {dataset.image_size}px, '
+                             f'the model needs {predictor_cls.image_size}px')
+        return dataset
+    return Manifest.from_directory(directory, predictor_cls.class_names)
+
+
+def predict_shards(predictor, dataset, batch_size=64):
+    """
+    Run a predictor over a packed dataset.
+
+    Yields:
+        tuple: (list of result dicts, int32 labels) per batch
+    """
+    if dataset.image_size != predictor.image_size:
+        raise ValueError(
+            f'Shards are {dataset.image_size}px but the model expects {predictor.image_size}px'
+        )
+    for batch, labels in dataset.iter_normalized(batch_size, predictor.input_divisor):
+        yield predictor.predict_preprocessed(batch), np.asarray(labels)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack datasets into memory-mapped shards')
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack_parser = commands.add_parser('pack', help='Decode a labelled directory into shards')
+    pack_parser.add_argument('model', choices=sorted(PREDICTORS),
+                             help='Model whose class names and input size to use')
+    pack_parser.add_argument('data_dir', help='One sub-directory per class')
+    pack_parser.add_argument('out_dir')
+    pack_parser.add_argument('--shard-size', type=int, default=4096)
+    pack_parser.add_argument('--workers', type=int, default=None)
+    pack_parser.add_argument('--seed', type=int, default=0, help='Seed of the order images are written in')
+    info_parser = commands.add_parser('info', help='Summarize a packed directory')
+    info_parser.add_argument('directory')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        predictor_cls = PREDICTORS[args.model]
+        manifest = Manifest.from_directory(args.data_dir, predictor_cls.class_names)
+        dataset = pack(
+            manifest, args.out_dir, predictor_cls.image_size,
+            shard_size=args.shard_size, workers=args.workers, seed=args.seed,
+        )
+    else:
+        dataset = ShardedDataset(args.directory)
+    print(json.dumps({
+        'directory': dataset.directory,
+        'images': len(dataset),
+        'image_size': dataset.image_size,
+        'shards': len(dataset.shards),
+        'bytes': int(sum(shard.nbytes for shard in dataset.shards)),
+        'class_counts': dataset.class_counts(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
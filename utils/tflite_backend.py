@@ -0,0 +1,80 @@
+"""
+TensorFlow Lite inference backend for the predictor classes.
+
+Uses the standalone LiteRT / tflite-runtime interpreter when installed, so
+CPU-only inference nodes don't need full TensorFlow, and falls back to
+``tf.lite.Interpreter`` otherwise.
+"""
+import threading
+
+import numpy as np
+
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        Interpreter = None
+
+
+def _interpreter_class():
+    if Interpreter is not None:
+        return Interpreter
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """
+    Callable wrapper around a TFLite interpreter.
+
+    Calling it with a float32 batch returns the float32 class probabilities,
+    like the Keras serving function. Quantized (int8/uint8) input and output
+    tensors are (de)quantized here, and the input tensor is resized when the
+    batch size changes.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        """
+        Args:
+            model_path: Path to a ``.tflite`` flatbuffer
+            num_threads: Interpreter CPU threads (None lets TFLite decide)
+        """
+        self.model_path = model_path
+        self._interpreter = _interpreter_class()(
+            model_path=model_path, num_threads=num_threads
+        )
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # Interpreters are not thread-safe; serialize invocations
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self._lock:
+            if len(batch) != self._batch_size:
+                shape = [len(batch)] + list(self._input['shape'][1:])
+                self._interpreter.resize_tensor_input(self._input['index'], shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self._interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index'])
+        return self._dequantize(output)
+
+    def _quantize(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return np.ascontiguousarray(batch, dtype=np.float32)
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        quantized = np.round(batch / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self._output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
@@ -0,0 +1,162 @@
+"""
+Export the Keras models to quantized TFLite and measure the accuracy cost.
+
+Run from the repository root, e.g.:
+
+    python -m utils.tflite_export brain models/brain_tumor/my_model.keras \\
+        --calibration-dir "Mri Images/Training" --eval-dir "Mri Images/Testing"
+
+Writes ``<stem>_dynamic.tflite`` (int8 weights, float activations) and
+``<stem>_int8.tflite`` (int8 weights and activations, calibrated on a
+representative sample of ``--calibration-dir``) next to the Keras model.
+If ``--eval-dir`` is given, each artifact is scored on that labelled folder
+and its accuracy delta against the float model is reported as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from .datasets import iter_image_files, labelled_images
+from .lazy import LazyModule
+from .model_registry import PREDICTORS
+
+tf = LazyModule('tensorflow')
+
+
+def representative_dataset(predictor, image_dir, num_samples=200, seed=0):
+    """
+    Build the calibration generator for full-integer quantization.
+
+    Args:
+        predictor: Predictor whose ``preprocess`` defines the model input
+        image_dir: Directory of representative images (searched recursively)
+        num_samples: Number of images to sample for calibration
+        seed: Seed for the random sample
+
+    Returns:
+        callable: Generator function yielding single-image input batches
+    """
+    paths = list(iter_image_files(image_dir))
+    if not paths:
+        raise ValueError(f'No calibration images found in {image_dir}')
+    random.Random(seed).shuffle(paths)
+    paths = paths[:num_samples]
+
+    def generator():
+        for path in paths:
+            yield [predictor.preprocess(path)[None]]
+
+    return generator
+
+
+def convert(predictor, quantization, representative_data=None):
+    """
+    Convert a Keras-backed predictor's model to a TFLite flatbuffer.
+
+    Args:
+        predictor: Predictor created with the default 'keras' backend
+        quantization: 'float', 'dynamic' or 'int8'
+        representative_data: Calibration generator, required for 'int8'
+
+    Returns:
+        bytes: The serialized TFLite model
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(predictor.model)
+    if quantization in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        if representative_data is None:
+            raise ValueError('int8 quantization needs a representative dataset')
+        converter.representative_dataset = representative_data
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization not in ('float', 'dynamic'):
+        raise ValueError(f'Unknown quantization {quantization!r}')
+    return converter.convert()
+
+
+def predicted_indices(predictor, samples, batch_size=32):
+    """Return the predicted class index of every (path, label) sample, and seconds per image."""
+    indices = []
+    start_time = time.perf_counter()
+    for start in range(0, len(samples), batch_size):
+        paths = [path for path, _ in samples[start:start + batch_size]]
+        results = predictor.predict_batch(paths, batch_size=batch_size)
+        indices.extend(result['class_index'] for result in results)
+    return indices, (time.perf_counter() - start_time) / max(len(samples), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export Curevia models to TFLite')
+    parser.add_argument('model', choices=sorted(PREDICTORS))
+    parser.add_argument('keras_path', help='Path to the trained .keras model')
+    parser.add_argument('--calibration-dir',
+                        help='Representative images for int8 calibration; '
+                             'without it only the dynamic-range model is written')
+    parser.add_argument('--eval-dir', help='Labelled held-out folder for the accuracy report')
+    parser.add_argument('--out-dir', help='Where to write the .tflite files '
+                                          '(default: next to the Keras model)')
+    parser.add_argument('--num-calibration', type=int, default=200)
+    parser.add_argument('--num-threads', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--report', help='Also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    predictor_cls = PREDICTORS[args.model]
+    float_predictor = predictor_cls(args.keras_path)
+    out_dir = args.out_dir or os.path.dirname(os.path.abspath(args.keras_path))
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(args.keras_path))[0]
+
+    artifacts = {}
+    variants = ['dynamic'] + (['int8'] if args.calibration_dir else [])
+    for quantization in variants:
+        representative_data = None
+        if quantization == 'int8':
+            representative_data = representative_dataset(
+                float_predictor, args.calibration_dir, args.num_calibration
+            )
+        flatbuffer = convert(float_predictor, quantization, representative_data)
+        path = os.path.join(out_dir, f'{stem}_{quantization}.tflite')
+        with open(path, 'wb') as f:
+            f.write(flatbuffer)
+        artifacts[quantization] = path
+
+    report = {'keras_model': args.keras_path, 'artifacts': {}}
+    for quantization, path in artifacts.items():
+        report['artifacts'][quantization] = {
+            'path': path,
+            'size_mb': os.path.getsize(path) / 2**20,
+        }
+
+    if args.eval_dir:
+        samples = labelled_images(args.eval_dir, predictor_cls.class_names)
+        labels = [label for _, label in samples]
+        float_indices, float_seconds = predicted_indices(float_predictor, samples, args.batch_size)
+        float_accuracy = sum(p == t for p, t in zip(float_indices, labels)) / len(samples)
+        report['eval_dir'] = args.eval_dir
+        report['num_images'] = len(samples)
+        report['float'] = {'accuracy': float_accuracy, 'ms_per_image': float_seconds * 1000}
+        for quantization, path in artifacts.items():
+            predictor = predictor_cls(path, backend='tflite', num_threads=args.num_threads)
+            indices, seconds = predicted_indices(predictor, samples, args.batch_size)
+            accuracy = sum(p == t for p, t in zip(indices, labels)) / len(samples)
+            report['artifacts'][quantization].update({
+                'accuracy': accuracy,
+                'accuracy_delta': accuracy - float_accuracy,
+                'agreement_with_float': sum(
+                    p == q for p, q in zip(indices, float_indices)
+                ) / len(samples),
+                'ms_per_image': seconds * 1000,
+            })
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+tf.data training pipelines for both models.
+
+    python -m utils.training brain --train-dir "Mri Images/Training" \\
+        --val-dir "Mri Images/Testing" --epochs 5 --output models/brain_tumor/my_model.keras
+    python -m utils.training eye --train-dir RetinalOCT_Dataset/test \\
+        --val-fraction 0.1 --epochs 10 --output models/eye_disease/Trained_Model.keras
+
+Replaces the notebook generators: files and labels are listed once into a
+``Manifest`` and shuffled as a whole, images are decoded and resized in
+parallel inside tf.data with the inference preprocessing, the decoded
+uint8 images are cached (in memory or in a cache file), the notebook's
+brightness/contrast augmentation is applied to whole batches at once, and
+batches are prefetched while the model trains.
+
+``--train-dir`` and ``--val-dir`` also accept directories packed with
+``python -m utils.shards pack``; those are streamed from memory-mapped
+uint8 shards instead of decoding JPEGs.
+"""
+import argparse
+
+from .architectures import BUILDERS
+from .datasets import Manifest
+from .lazy import LazyModule
+from .model_registry import PREDICTORS
+from .preprocessing import decode_resized
+from .shards import ShardedDataset
+
+tf = LazyModule('tensorflow')
+
+# ITU-R 601-2 luma weights, as used by PIL's convert('L')
+_LUMA = (0.299, 0.587, 0.114)
+
+
+def decode_and_resize(path, image_size):
+    """
+    Decode and resize one image file to uint8 with ``preprocessing.decode_resized``.
+
+    Training then sees exactly what inference sees: the same reduced-size
+    JPEG decode, 16-bit rescaling, mode handling and PIL bicubic resize,
+    and every format PIL reads (TIFF included).
+    """
+    image = tf.numpy_function(
+        lambda p: decode_resized(p.decode(), image_size), [path], tf.uint8, stateful=False
+    )
+    image.set_shape((image_size, image_size, 3))
+    return image
+
+
+def adjust_brightness_contrast(images, brightness, contrast):
+    """
+    Batched equivalent of PIL ``ImageEnhance.Brightness`` then ``ImageEnhance.Contrast``.
+
+    Args:
+        images: float32 (B, H, W, 3) tensor in [0, 255]
+        brightness: Factors broadcastable to (B, 1, 1, 1)
+        contrast: Factors broadcastable to (B, 1, 1, 1)
+
+    Returns:
+        Tensor in [0, 255], truncated to whole values like PIL's 8-bit blend
+    """
+    images = tf.floor(tf.clip_by_value(images * brightness, 0.0, 255.0))
+    # Contrast blends towards the image's mean grey level
+    gray = tf.tensordot(images, tf.constant(_LUMA, dtype=images.dtype), axes=1)
+    mean = tf.floor(tf.reduce_mean(gray, axis=[1, 2])[:, None, None, None] + 0.5)
+    return tf.floor(tf.clip_by_value(mean + contrast * (images - mean), 0.0, 255.0))
+
+
+def augment_batch(images, lower=0.8, upper=1.2, generator=None):
+    """
+    Random brightness/contrast for a whole batch: independent factors per image.
+
+    Args:
+        generator: ``tf.random.Generator`` the factors are drawn from (the
+            global one when None). Its state advances with every batch, so
+            a seeded pipeline still gets new factors every epoch.
+    """
+    generator = generator or tf.random.get_global_generator()
+    shape = tf.stack([tf.shape(images)[0], 1, 1, 1])
+    brightness = generator.uniform(shape, lower, upper)
+    contrast = generator.uniform(shape, lower, upper)
+    return adjust_brightness_contrast(images, brightness, contrast)
+
+
+def make_dataset(manifest, image_size, batch_size=32, divisor=1.0, augment=False,
+                 shuffle=False, cache='memory', shuffle_buffer=8192, seed=None):
+    """
+    Build a batched ``tf.data.Dataset`` of (images, labels) from a manifest.
+
+    Args:
+        manifest: Manifest of image paths and integer labels
+        image_size: Square model input size
+        batch_size: Images per batch
+        divisor: Input scaling, the predictor's ``input_divisor``
+        augment: Apply random brightness/contrast to every batch
+        shuffle: Shuffle the whole manifest once (it is grouped by class),
+            then reshuffle the cached images every epoch
+        cache: 'memory', a file path prefix for an on-disk cache, or None.
+            The cache holds decoded, resized uint8 images, so augmentation
+            stays random from epoch to epoch.
+        shuffle_buffer: Upper bound on the shuffle buffer size
+        seed: Seed for shuffling and augmentation
+
+    Returns:
+        tf.data.Dataset: float32 images of shape (B, image_size, image_size, 3)
+            and int32 labels
+    """
+    autotune = tf.data.AUTOTUNE
+    if shuffle:
+        # The buffer below only mixes neighbours; without this, early
+        # batches would come from a single class block
+        manifest = manifest.shuffled(seed)
+    dataset = tf.data.Dataset.from_tensor_slices(
+        (manifest.paths, tf.constant(manifest.labels, dtype=tf.int32))
+    )
+    dataset = dataset.map(
+        lambda path, label: (decode_and_resize(path, image_size), label),
+        num_parallel_calls=autotune,
+    )
+    if cache:
+        dataset = dataset.cache('' if cache == 'memory' else cache)
+    if shuffle:
+        dataset = dataset.shuffle(
+            min(len(manifest), shuffle_buffer), seed=seed, reshuffle_each_iteration=True
+        )
+    dataset = dataset.batch(batch_size, num_parallel_calls=autotune)
+    return finish_batches(dataset, divisor, augment, seed)
+
+
+def finish_batches(dataset, divisor=1.0, augment=False, seed=None):
+    """Cast batches of uint8 images to float32, augment, normalize and prefetch."""
+    generator = None
+    if augment:
+        # Created once: an op-level seed inside the map would repeat every epoch
+        generator = tf.random.Generator.from_seed(seed) if seed is not None \
+            else tf.random.Generator.from_non_deterministic_state()
+
+    def finish(images, labels):
+        images = tf.cast(images, tf.float32)
+        if augment:
+            images = augment_batch(images, generator=generator)
+        if divisor != 1.0:
+            images = images / divisor
+        return images, labels
+
+    autotune = tf.data.AUTOTUNE
+    return dataset.map(finish, num_parallel_calls=autotune).prefetch(autotune)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train a Curevia model with tf.data')
+    parser.add_argument('model', choices=sorted(PREDICTORS))
+    parser.add_argument('--train-dir', required=True,
+                        help='One sub-directory per class, or a packed shard directory')
+    parser.add_argument('--val-dir', help='Labelled validation directory or packed shard directory')
+    parser.add_argument('--val-fraction', type=float, default=0.0,
+                        help='Hold out this stratified fraction of --train-dir for validation')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--augment', action=argparse.BooleanOptionalAction, default=None,
+                        help='Brightness/contrast augmentation (default: on for brain, off for eye, '
+                             'as in the notebooks)')
+    parser.add_argument('--cache', default='memory',
+                        help="'memory', 'none', or a file path prefix for an on-disk cache")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', required=True, help='Where to save the trained .keras model')
+    args = parser.parse_args(argv)
+
+    predictor_cls = PREDICTORS[args.model]
+    augment = args.model == 'brain' if args.augment is None else args.augment
+    cache = None if args.cache == 'none' else args.cache
+
+    def load(directory):
+        if ShardedDataset.is_packed(directory):
+            shards = ShardedDataset(directory)
+            if shards.image_size != predictor_cls.image_size:
+                parser.error(f'{directory} was packed at {shards.image_size}px, '
+                             f'{args.model} needs {predictor_cls.image_size}px')
+            return shards
+        return Manifest.from_directory(directory, predictor_cls.class_names)
+
+    train = load(args.train_dir)
+    val = None
+    if args.val_dir:
+        val = load(args.val_dir)
+    elif args.val_fraction:
+        if isinstance(train, ShardedDataset):
+            parser.error('--val-fraction needs an image directory; pack a separate --val-dir')
+        train, val = train.split((1 - args.val_fraction, args.val_fraction), seed=args.seed)
+    print(f'Training images: {len(train)} {train.class_counts()}')
+
+    def dataset(source, training):
+        if isinstance(source, ShardedDataset):
+            return source.as_tf_dataset(
+                args.batch_size, predictor_cls.input_divisor,
+                augment=augment and training, shuffle=training, seed=args.seed,
+            )
+        split_cache = cache
+        if cache not in (None, 'memory'):
+            split_cache = f'{cache}.{"train" if training else "val"}'
+        return make_dataset(
+            source, predictor_cls.image_size, args.batch_size, predictor_cls.input_divisor,
+            augment=augment and training, shuffle=training, cache=split_cache, seed=args.seed,
+        )
+
+    model = BUILDERS[args.model]()
+    model.fit(
+        dataset(train, training=True),
+        validation_data=dataset(val, training=False) if val else None,
+        epochs=args.epochs,
+    )
+    model.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Volume mode: batched inference over every slice of an MRI study.
+
+A study arrives as a series of slices rather than one image:
+
+- a directory of slice images (sorted naturally, so slice_2 comes before slice_10),
+- a multi-frame TIFF, one frame per slice,
+- a stacked ``.npy`` volume of shape (slices, H, W) or (slices, H, W, C).
+
+``load_volume`` preprocesses all slices into one memory-mapped float32
+array, so a few-hundred-slice study never has to fit in RAM as decoded
+images. ``predict_volume`` then runs it through ``predict_preprocessed``
+in fixed-size batches, so the cost is batched throughput, not per-slice
+call overhead. It returns per-slice results and a study-level summary:
+
+    python -m utils.volume brain studies/patient_042/ --output study.json
+    python -m utils.volume brain series.tif --batch-size 64
+
+Every slice goes through the same preprocessing as a single upload, so a
+slice's result matches ``predict`` on that slice alone.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .datasets import iter_image_files
+from .model_registry import DEFAULT_MODEL_PATHS, PREDICTORS
+from .preprocessing import preprocess_into
+
+
+def _natural_key(path):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', path)]
+
+
+def _as_image(pixels):
+    # (H, W, 1) -> (H, W); non-8-bit grayscale goes through the 16-bit/float
+    # path of preprocessing. PIL has no wide multi-channel mode, so non-8-bit
+    # colour slices are rescaled to 8 bits here the same way (by the slice's peak)
+    if pixels.ndim == 3 and pixels.shape[-1] == 1:
+        pixels = pixels[..., 0]
+    if pixels.dtype != np.uint8:
+        pixels = pixels.astype(np.float32)
+        if pixels.ndim == 3:
+            peak = float(pixels.max()) if pixels.size else 0.0
+            if peak > 0:
+                pixels *= np.float32(255.0 / peak)
+            pixels = np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(pixels)
+
+
+def slice_names(source):
+    """
+    Name every slice of a study, in slice order.
+
+    Args:
+        source: Directory of slice images, multi-frame image file or ``.npy`` volume
+
+    Returns:
+        list: File paths for a directory, ``file#index`` for frames and rows
+    """
+    if os.path.isdir(source):
+        return sorted(iter_image_files(source), key=_natural_key)
+    if source.lower().endswith('.npy'):
+        count = np.load(source, mmap_mode='r').shape[0]
+    else:
+        with Image.open(source) as img:
+            count = getattr(img, 'n_frames', 1)
+    return [f'{source}#{index}' for index in range(count)]
+
+
+def load_volume(source, image_size, divisor=1.0, path=None, workers=None):
+    """
+    Preprocess every slice of a study into one memory-mapped float32 array.
+
+    Args:
+        source: Directory of slice images, multi-frame image file or ``.npy`` volume
+        image_size: Model input side length
+        divisor: See ``preprocessing.normalize_into``
+        path: ``.npy`` file backing the array (default: a temporary file
+            that is removed once the array is released)
+        workers: Decode threads for directories and ``.npy`` volumes
+            (default: CPU count); TIFF frames are read in order
+
+    Returns:
+        tuple: (slice names, float32 memmap of shape (slices, image_size, image_size, 3))
+    """
+    names = slice_names(source)
+    if not names:
+        raise ValueError(f'No slices found in {source}')
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.npy')
+        os.close(handle)
+        temporary = True
+    else:
+        temporary = False
+    volume = np.lib.format.open_memmap(
+        path, mode='w+', dtype=np.float32, shape=(len(names), image_size, image_size, 3),
+    )
+    if temporary and os.name == 'posix':
+        # The mapping keeps the data reachable; the file goes away with it
+        os.unlink(path)
+
+    def fill(index, image):
+        preprocess_into(volume[index], image, image_size, divisor)
+
+    if os.path.isdir(source):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(fill, range(len(names)), names))
+    elif source.lower().endswith('.npy'):
+        stack = np.load(source, mmap_mode='r')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda i: fill(i, _as_image(stack[i])), range(len(names))))
+    else:
+        with Image.open(source) as img:
+            for index in range(len(names)):
+                img.seek(index)
+                fill(index, img)
+    return names, volume
+
+
+def summarize(results, class_names, normal_class=None):
+    """
+    Study-level aggregate of per-slice results.
+
+    Args:
+        results: Per-slice result dicts in slice order
+        class_names: The predictor's class names
+        normal_class: Class meaning "nothing found" (the predictor's
+            ``normal_class``); enables the abnormal-slice fields
+
+    Returns:
+        dict: ``slices``, ``class_counts`` (slices per predicted class) and,
+            with a normal class, ``abnormal_slices`` and ``peak`` (the slice
+            with the highest abnormal probability: index, name,
+            probability and its most likely abnormal class)
+    """
+    probs = np.array([result['all_predictions'] for result in results], dtype=np.float32)
+    counts = np.bincount(probs.argmax(axis=1), minlength=len(class_names))
+    summary = {
+        'slices': len(results),
+        'class_counts': dict(zip(class_names, counts.tolist())),
+    }
+    if normal_class is not None:
+        normal = class_names.index(normal_class)
+        abnormal = 1.0 - probs[:, normal]
+        peak = int(abnormal.argmax())
+        others = probs[peak].copy()
+        others[normal] = -1.0
+        summary['abnormal_slices'] = int(len(results) - counts[normal])
+        summary['peak'] = {
+            'slice': peak,
+            'name': results[peak].get('name'),
+            'probability': float(abnormal[peak]),
+            'class_name': class_names[int(others.argmax())],
+        }
+    return summary
+
+
+def predict_volume(predictor, source, batch_size=32, workers=None):
+    """
+    Classify every slice of a study with batched forward passes.
+
+    Args:
+        predictor: BrainTumorPredictor, EyeDiseasePredictor, ...
+        source: Directory of slice images, multi-frame image file or ``.npy`` volume
+        batch_size: Slices per forward pass
+        workers: Decode threads, see ``load_volume``
+
+    Returns:
+        dict: ``slices`` (one result per slice, with its ``slice`` index and
+            ``name``), ``summary`` (see ``summarize``) and ``timings``
+            (seconds spent preprocessing and predicting)
+    """
+    start = time.perf_counter()
+    names, volume = load_volume(
+        source, predictor.image_size, predictor.input_divisor, workers=workers,
+    )
+    loaded = time.perf_counter()
+    results = []
+    for offset in range(0, len(volume), batch_size):
+        results.extend(predictor.predict_preprocessed(volume[offset:offset + batch_size]))
+    predicted = time.perf_counter()
+    del volume
+
+    for index, (name, result) in enumerate(zip(names, results)):
+        result['slice'] = index
+        result['name'] = name
+    return {
+        'slices': results,
+        'summary': summarize(
+            results, predictor.class_names, getattr(predictor, 'normal_class', None),
+        ),
+        'timings': {'preprocess': loaded - start, 'predict': predicted - loaded},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Classify every slice of a study')
+    parser.add_argument('model', choices=sorted(PREDICTORS))
+    parser.add_argument('source', help='Directory of slices, multi-frame TIFF or .npy volume')
+    parser.add_argument('--model-path', help='Model file (default: the registry path)')
+    parser.add_argument('--backend', choices=('keras', 'tflite', 'mmap'), default='keras')
+    parser.add_argument('--num-threads', type=int, default=None,
+                        help='TFLite interpreter threads')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None, help='Decode threads')
+    parser.add_argument('--summary-only', action='store_true', help='Omit per-slice results')
+    parser.add_argument('--output', '-o', help='Write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    predictor = PREDICTORS[args.model](
+        args.model_path or DEFAULT_MODEL_PATHS[args.model],
+        backend=args.backend, num_threads=args.num_threads,
+    )
+    report = predict_volume(predictor, args.source, args.batch_size, args.workers)
+    if args.summary_only:
+        del report['slices']
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    timings = report['timings']
+    print(f'{report["summary"]["slices"]} slices: preprocess {timings["preprocess"]:.2f} s, '
+          f'predict {timings["predict"]:.2f} s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
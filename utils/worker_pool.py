@@ -0,0 +1,541 @@
+"""
+Multi-process model replicas for CPU serving.
+
+One Python process drives one model at a time: the Keras call path holds
+the GIL for much of each request, so a many-core box sits mostly idle.
+``WorkerPool`` starts N worker processes, each loading its own replica with
+TensorFlow's intra-/inter-op thread pools sized so that N workers together
+use the cores once (``threads_per_worker = cpu_count // workers`` by
+default), and dispatches calls to them round-robin or to the least loaded
+worker. Encoded images are sent to the workers, so decoding scales with
+the workers too.
+
+    pool = WorkerPool(BrainTumorPredictor, 'models/brain_tumor/my_model.keras', workers=8)
+    results = pool.predict_batch(paths)   # chunks run on different workers
+    pool.close()
+
+Where the platform has it, workers are forked from a ``forkserver`` that
+has already imported TensorFlow, so a new worker skips the multi-second
+import and shares the imported libraries' memory with its siblings. With
+the ``mmap`` backend (see ``utils.mmap_backend``) the weights are shared
+too, so an extra worker starts in well under a second and costs little
+more than its activations; ``memory()`` reports what each worker holds.
+
+Workers that die are noticed at once and replaced (their in-flight calls
+fail with RuntimeError); calls go only to loaded workers, and a
+replacement that fails to load stays out of rotation. ``restart()``
+replaces all of them, e.g. after the model file changed.
+
+Scaling benchmark:
+
+    python -m utils.worker_pool brain --workers 1,2,4,8 --images 512
+    python -m utils.worker_pool brain --backend mmap --workers 1,2,4,8
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import Future, wait
+from multiprocessing import connection
+
+from .model_registry import PREDICTORS
+from .prediction_cache import model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_MODES = ('least_loaded', 'round_robin')
+START_METHODS = ('forkserver', 'spawn')
+# Longest the collector waits before rechecking whether the pool is closing
+POLL_INTERVAL = 0.5
+
+
+def _portable_exception(exc):
+    # Exceptions must survive pickling on the way back to the parent
+    try:
+        pickle.dumps(exc)
+        return exc
+    except Exception:
+        return RuntimeError(f'{type(exc).__name__}: {exc}')
+
+
+def _worker_main(index, predictor_cls, model_path, predictor_kwargs, intra_op_threads,
+                 inter_op_threads, warm_up_batch_size, requests, results):
+    _exit_with_parent()
+    # Thread pools must be sized before TensorFlow creates them (on first
+    # use, so this also holds when the forkserver has imported it already)
+    os.environ['OMP_NUM_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads)
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        if predictor_kwargs.get('backend') == 'tflite':
+            predictor_kwargs.setdefault('num_threads', intra_op_threads)
+        predictor = predictor_cls(
+            model_path, warm_up_batch_size=warm_up_batch_size, **predictor_kwargs
+        )
+    except Exception:
+        results.send((None, False, RuntimeError(
+            f'worker {index} failed to load {model_path}:\n{traceback.format_exc()}'
+        )))
+        return
+    results.send((None, True, os.getpid()))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            return
+        request_id, method, args, kwargs = item
+        try:
+            payload, ok = getattr(predictor, method)(*args, **kwargs), True
+        except Exception as exc:
+            payload, ok = _portable_exception(exc), False
+        results.send((request_id, ok, payload))
+
+
+def process_memory(pid):
+    """
+    Resident, proportional (shared pages split between their users) and
+    private memory of a process in MB, or None where ``/proc`` has no
+    ``smaps_rollup`` (non-Linux).
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        'rss_mb': fields.get('Rss', 0.0),
+        'pss_mb': fields.get('Pss', 0.0),
+        'private_mb': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+    }
+
+
+def _exit_with_parent():
+    # A parent killed without close() never sends the stop sentinel, and the
+    # worker would block on the request queue forever; reparenting shows it
+    parent_pid = os.getppid()
+
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1.0)
+        os._exit(0)
+
+    threading.Thread(target=watch, name='curevia-parent-watch', daemon=True).start()
+
+
+class _Worker:
+    """Parent-side state of one worker process."""
+
+    def __init__(self, process, requests, results):
+        self.process = process
+        self.requests = requests
+        self.results = results  # Read end of the worker's own result pipe
+        self.pending = {}  # request id -> Future
+        self.completed = 0
+        self.pid = None
+        self.ready = False  # Loaded and serving; only ready workers get calls
+        self.exited = False  # Exit handled; no longer waited on
+
+
+class WorkerPool:
+    """Model replicas in worker processes behind a predictor-like interface."""
+
+    def __init__(self, predictor_cls, model_path, workers=None, threads_per_worker=None,
+                 inter_op_threads=1, dispatch='least_loaded', warm_up_batch_size=1,
+                 start_timeout=300, start_method=None, **predictor_kwargs):
+        """
+        Args:
+            predictor_cls: BrainTumorPredictor, EyeDiseasePredictor, ...
+            model_path: Model file every worker loads
+            workers: Number of worker processes (default: CPU count)
+            threads_per_worker: Intra-op threads per worker (default: an
+                equal share of the cores, at least 1)
+            inter_op_threads: Inter-op threads per worker
+            dispatch: 'least_loaded' (fewest calls in flight) or 'round_robin'
+            warm_up_batch_size: Size of each worker's warm-up batch
+            start_timeout: Seconds to wait for the workers to load
+            start_method: 'forkserver' (default where available: workers fork
+                from a process that has imported TensorFlow already) or
+                'spawn' (every worker starts a fresh interpreter)
+            **predictor_kwargs: Passed to ``predictor_cls`` in every worker
+        """
+        if dispatch not in DISPATCH_MODES:
+            raise ValueError(f'Unknown dispatch {dispatch!r}; expected one of {DISPATCH_MODES}')
+        if start_method is None:
+            start_method = 'forkserver' \
+                if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        if start_method not in START_METHODS:
+            raise ValueError(f'Unknown start method {start_method!r}; expected one of {START_METHODS}')
+        cpus = os.cpu_count() or 1
+        self.predictor_cls = predictor_cls
+        self.model_path = model_path
+        self.num_workers = workers or cpus
+        self.threads_per_worker = threads_per_worker or max(1, cpus // self.num_workers)
+        self.inter_op_threads = inter_op_threads
+        self.dispatch = dispatch
+        self.warm_up_batch_size = warm_up_batch_size
+        self.start_timeout = start_timeout
+        self.predictor_kwargs = predictor_kwargs
+        self.start_method = start_method
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # Only takes effect when the (process-wide) forkserver first starts
+            self._context.set_forkserver_preload(['tensorflow', __name__])
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._round_robin = itertools.count()
+        self._workers = []
+        self._collector = None
+        self._stopping = False
+        self.start()
+
+    # Static predictor metadata, so wrappers (CachedPredictor, pages) work unchanged
+    @property
+    def name(self):
+        return self.predictor_cls.name
+
+    @property
+    def class_names(self):
+        return self.predictor_cls.class_names
+
+    @property
+    def image_size(self):
+        return self.predictor_cls.image_size
+
+    @property
+    def input_divisor(self):
+        return self.predictor_cls.input_divisor
+
+    @property
+    def cache_variant(self):
+        # Same value as the replicas' ``cache_variant``, without asking a worker
+        if self._gate_fingerprint is None:
+            return None
+        from .cascade import gate_variant
+
+        return gate_variant(self._gate_fingerprint, self.predictor_kwargs.get('gate_threshold', 0.95))
+
+    def __getattr__(self, name):
+        # Other public predictor methods (predict_tta, predict_gradcam, ...) run in a worker
+        if name.startswith('_') or name == 'predictor_cls' or \
+                not callable(getattr(self.predictor_cls, name, None)):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.submit(name, *args, **kwargs).result()
+
+    def start(self):
+        """Start the workers and wait until every replica is loaded and warmed up."""
+        self._stopping = False
+        # The files the replicas are about to load; cache keys are built from these
+        self.model_fingerprint = model_fingerprint(self.model_path)
+        gate_path = self.predictor_kwargs.get('gate_path')
+        self._gate_fingerprint = None if gate_path is None else model_fingerprint(gate_path)
+        self._workers = [self._spawn(index) for index in range(self.num_workers)]
+        deadline = time.monotonic() + self.start_timeout
+        loading = {worker.results: index for index, worker in enumerate(self._workers)}
+        while loading:
+            ready = connection.wait(list(loading), timeout=max(deadline - time.monotonic(), 0))
+            if not ready:
+                self.close()
+                raise RuntimeError(f'workers did not start within {self.start_timeout}s')
+            for results in ready:
+                index = loading.pop(results)
+                worker = self._workers[index]
+                try:
+                    _, ok, payload = results.recv()
+                except EOFError:
+                    worker.process.join()
+                    ok, payload = False, RuntimeError(
+                        f'worker {index} exited with {worker.process.exitcode} while loading'
+                    )
+                if not ok:
+                    self.close()
+                    raise payload
+                worker.pid = payload
+                worker.ready = True
+        self._collector = threading.Thread(
+            target=self._collect, name='curevia-pool-collector', daemon=True
+        )
+        self._collector.start()
+        logger.info('Started %d %s workers with %d threads each', self.num_workers,
+                    self.name, self.threads_per_worker)
+
+    def _spawn(self, index):
+        requests = self._context.Queue()
+        # One pipe per worker rather than a shared result queue: a worker
+        # killed while writing to a shared queue can leave its cross-process
+        # lock held, which blocks every other worker's results for good
+        results, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.predictor_cls, self.model_path, dict(self.predictor_kwargs),
+                  self.threads_per_worker, self.inter_op_threads, self.warm_up_batch_size,
+                  requests, writer),
+            name=f'curevia-worker-{index}',
+            daemon=True,
+        )
+        process.start()
+        # With the worker holding the only write end, its exit reads as EOF
+        writer.close()
+        return _Worker(process, requests, results)
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Call ``predictor.<method>(*args, **kwargs)`` in a worker.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the method's return value
+        """
+        future = Future()
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError('WorkerPool is closed')
+            worker = self._choose()
+            request_id = next(self._ids)
+            worker.pending[request_id] = future
+        worker.requests.put((request_id, method, args, kwargs))
+        return future
+
+    def _choose(self):
+        # Restarting or failed replacements get no calls
+        workers = [worker for worker in self._workers if worker.ready]
+        if not workers:
+            raise RuntimeError('no worker is ready (replacements are loading or failed to load)')
+        if self.dispatch == 'round_robin':
+            return workers[next(self._round_robin) % len(workers)]
+        # Least loaded; the rotating start spreads ties across workers
+        offset = next(self._round_robin)
+        order = [workers[(offset + i) % len(workers)] for i in range(len(workers))]
+        return min(order, key=lambda worker: len(worker.pending))
+
+    def predict(self, image):
+        """Predict one image in a worker."""
+        return self.submit('predict', image).result()
+
+    def predict_batch(self, images, batch_size=32):
+        """
+        Predict many images, spreading chunks of ``batch_size`` over the workers.
+
+        Returns:
+            list: One result dict per image, in input order
+        """
+        images = list(images)
+        futures = [
+            self.submit('predict_batch', images[start:start + batch_size], batch_size=batch_size)
+            for start in range(0, len(images), batch_size)
+        ]
+        return [result for future in futures for result in future.result()]
+
+    def stats(self):
+        """Per-worker pid, liveness, readiness, calls in flight and calls completed."""
+        with self._lock:
+            return [
+                {'pid': worker.pid, 'alive': worker.process.is_alive(), 'ready': worker.ready,
+                 'in_flight': len(worker.pending), 'completed': worker.completed}
+                for worker in self._workers
+            ]
+
+    def memory(self):
+        """Per-worker pid and memory in MB (see ``process_memory``)."""
+        with self._lock:
+            pids = [worker.pid for worker in self._workers]
+        return [dict(pid=pid, **(process_memory(pid) or {})) for pid in pids if pid is not None]
+
+    def close(self, timeout=10):
+        """Let the workers finish their queued calls, then stop them."""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            workers = list(self._workers)
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.requests.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+        if self._collector is not None:
+            self._collector.join()
+            self._collector = None
+        for worker in workers:
+            worker.results.close()
+            self._fail_pending(worker, RuntimeError('WorkerPool was closed'))
+
+    def restart(self):
+        """Stop every worker and start fresh replicas (e.g. to pick up a new model file)."""
+        self.close()
+        self.start()
+
+    def _collect(self):
+        while True:
+            with self._lock:
+                workers = [(index, worker) for index, worker in enumerate(self._workers)
+                           if not worker.exited]
+            if not workers and self._stopping:
+                # close() has joined the workers, so nothing else is coming
+                return
+            # A result and a crash both wake the wait, however busy the other
+            # workers are: results on a pipe, crashes on the process sentinel
+            waiting = {}
+            for index, worker in workers:
+                waiting[worker.results] = waiting[worker.process.sentinel] = (index, worker)
+            for ready in connection.wait(list(waiting), timeout=POLL_INTERVAL):
+                index, worker = waiting[ready]
+                if worker.exited:
+                    continue  # Both its pipe and its sentinel fired
+                if self._drain(worker):
+                    self._handle_exit(index, worker)
+
+    def _drain(self, worker):
+        # Deliver every result the worker has sent; True once it has exited
+        while worker.results.poll():
+            try:
+                request_id, ok, payload = worker.results.recv()
+            except (EOFError, OSError):
+                return True
+            self._deliver(worker, request_id, ok, payload)
+        return not worker.process.is_alive()
+
+    def _deliver(self, worker, request_id, ok, payload):
+        with self._lock:
+            if request_id is None:
+                worker.pid = payload if ok else None
+                worker.ready = ok
+                if not ok:
+                    logger.error('%s', payload)
+                return
+            future = worker.pending.pop(request_id, None)
+            worker.completed += 1
+        if future is None:
+            return
+        if ok:
+            future.set_result(payload)
+        else:
+            future.set_exception(payload)
+
+    def _handle_exit(self, index, worker):
+        worker.process.join()
+        with self._lock:
+            worker.exited = True
+            was_ready, worker.ready = worker.ready, False
+            if self._stopping:
+                return
+            self._fail_pending(worker, RuntimeError(f'worker {index} died'))
+            if not was_ready:
+                # Failed to load; restarting it would just fail again in a loop
+                logger.error('Worker %d exited with %s before it was ready; leaving it out of '
+                             'rotation', index, worker.process.exitcode)
+                return
+            logger.warning('Worker %d (pid %s) exited with %s; restarting it',
+                           index, worker.pid, worker.process.exitcode)
+            self._workers[index] = self._spawn(index)
+        worker.results.close()
+
+    @staticmethod
+    def _fail_pending(worker, exc):
+        pending, worker.pending = worker.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+
+def measure_throughput(pool, images, batch_size):
+    """Images per second for ``images`` submitted all at once in chunks of ``batch_size``."""
+    start = time.perf_counter()
+    futures = [
+        pool.submit('predict_batch', images[i:i + batch_size], batch_size=batch_size)
+        for i in range(0, len(images), batch_size)
+    ]
+    wait(futures)
+    for future in futures:
+        future.result()
+    return len(images) / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    from .benchmark import build_stand_in, sample_images
+
+    parser = argparse.ArgumentParser(description='Measure WorkerPool throughput scaling')
+    parser.add_argument('model', choices=sorted(PREDICTORS))
+    parser.add_argument('--model-path', help='Model file (default: a stand-in, see utils.benchmark)')
+    parser.add_argument('--backend', choices=('keras', 'tflite', 'mmap'), default='keras')
+    parser.add_argument('--start-method', choices=START_METHODS, default=None,
+                        help='Worker start method (default: forkserver where available)')
+    parser.add_argument('--workers', default=None,
+                        help='Comma-separated worker counts (default: 1,2,4,... up to the CPU count)')
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--dispatch', choices=DISPATCH_MODES, default='least_loaded')
+    parser.add_argument('--images', type=int, default=256, help='Images per measurement')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--stand-in-dir', help='Keep the stand-in model here (default: a temporary directory)')
+    args = parser.parse_args(argv)
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(count) for count in args.workers.split(',')]
+    else:
+        counts = sorted({2 ** i for i in range(cpus.bit_length()) if 2 ** i <= cpus} | {cpus})
+    distinct = sample_images(args.model, min(args.images, 32))
+    images = [distinct[i % len(distinct)] for i in range(args.images)]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model_path or build_stand_in(
+            args.model, args.stand_in_dir or tmp, args.backend
+        )
+        for count in counts:
+            start = time.perf_counter()
+            pool = WorkerPool(
+                PREDICTORS[args.model], model_path, workers=count,
+                threads_per_worker=args.threads_per_worker, dispatch=args.dispatch,
+                warm_up_batch_size=args.batch_size, start_method=args.start_method,
+                backend=args.backend,
+            )
+            start_seconds = time.perf_counter() - start
+            try:
+                # One untimed round so every worker has run a full-size batch
+                measure_throughput(pool, images[:args.batch_size * count], args.batch_size)
+                throughput = measure_throughput(pool, images, args.batch_size)
+                memory = pool.memory()
+            finally:
+                pool.close()
+            row = {'workers': count, 'threads_per_worker': pool.threads_per_worker,
+                   'start_seconds': start_seconds, 'images_per_second': throughput}
+            if memory and 'pss_mb' in memory[0]:
+                # PSS splits shared pages between the processes mapping them,
+                # so the sum is what the workers really cost together
+                row['workers_pss_mb'] = sum(worker['pss_mb'] for worker in memory)
+                row['workers_rss_mb'] = sum(worker['rss_mb'] for worker in memory)
+                row['private_mb_per_worker'] = sum(
+                    worker['private_mb'] for worker in memory
+                ) / len(memory)
+            rows.append(row)
+            print(f'{count} workers: {throughput:.1f} img/s, started in {start_seconds:.1f} s'
+                  + (f", {row['workers_pss_mb']:.0f} MB PSS" if 'workers_pss_mb' in row else ''),
+                  file=sys.stderr)
+    for row in rows:
+        row['speedup'] = row['images_per_second'] / rows[0]['images_per_second']
+        row['efficiency'] = row['speedup'] / (row['workers'] / rows[0]['workers'])
+    print(json.dumps({'model': args.model, 'model_path': model_path, 'backend': args.backend,
+                      'start_method': pool.start_method, 'cpu_count': cpus,
+                      'batch_size': args.batch_size, 'results': rows}, indent=2))
+
+
+if __name__ == '__main__':
+    main()